@@ -1,819 +1,3990 @@
 #!/usr/bin/python3
 
-import os, subprocess, sys, shutil
-import pandas as pd
-from decimal import Decimal
+import os, subprocess, sys, shutil, collections, concurrent.futures, functools, re, threading, time, hashlib, array, bisect, mmap, argparse, csv, json, glob, contextlib, heapq, itertools, sqlite3, random, math, resource, atexit
+import urllib.request, urllib.parse, urllib.error
+import xml.etree.ElementTree as ElementTree
 
 
 ####################################################################################################################################
-#Searching the user's protein and taxon query on NCBI protein database
+#Tracing the time and resources used by each stage, each external program and the main parsing steps
 
 
-#Function to retrieve the main query fasta sequences from NCBI protin database
-def retrieve_fasta(NCBI_query):
-    
-    #Running the search command, limiting at the first 1000 results. 'head -n 100' is used in comparison to '-start 1 -stop 1000' as the latter does not run when the search contains less than 1000 results.
-    query = f"esearch -db protein -query \"{NCBI_query}\" | head -n 1000 | efetch -format fasta > ./{query_name}/{query_name}.pro.fa"
-    subprocess.call(query, shell=True, stderr=subprocess.DEVNULL)
-    
-    #Splitting the created file containing the query fasta sequences into a list based on each '>' in the headers
-    query_file = open(f"./{query_name}/{query_name}.pro.fa")
-    sequence_list = query_file.read().rstrip().split(">")
-    query_file.close()
-    
-    #Turning each element in the list of fastas to a dictionary of the headers as the keys and fasta sequences as the values
-    sequence_dict = {}
-    for i in sequence_list:
-        if i != '':                                          #Removing the first empty element
-            sequence_index = i.find('\n')                    #Splits the list of fastas based on each new line character
-            keys = i[:sequence_index]                        #Sets the header as the dictionary key
-            values = i[sequence_index:].replace("\n","")     #Sets the fasta sequences as the dictionary value
-            sequence_dict[keys] = values                     #Creates the new entry in the dictionary
-    
-    #Filtering through the results to remove sequences with ambiguous headers
-    items_to_delete = []
-    for keys in sequence_dict.keys():                                       
-        
-        #Removes the fasta entries in the dictionary if any of these words are present in the header
-        if "associated" in keys or "unknown" in keys or "unnamed" in keys:  
-            items_to_delete.append(keys)        #Adding the entries to remove to the temporary list
-    
-    for key in items_to_delete:                 #Looping through the temporary list to remove the entries from the dictionary
-        del sequence_dict[key]
 
-    #The output of the function involves the dictionary of each search result header and corresponding fasta sequence
-    return sequence_dict 
-    
+#File the trace is saved to when the script ends, in the Chrome trace event format (open it in chrome://tracing or https://ui.perfetto.dev). None turns tracing off
+trace_file = None
+trace_events = []
+trace_lock = threading.Lock()
+trace_start = time.perf_counter()
 
+#Most characters of a program's error output kept in the trace
+trace_stderr_characters = 2000
 
-#First output on screen for the user: explaining the search on NCBI
-print("By inputting a protein family and taxonomic group, fasta sequences of proteins found form NCBI protein database will be saved. Please be warned that if the query search contains more than 1000 protein results, only the first 1000 will be considered and the search will take long.")
 
 
-#Running while loop until user inputs the protein family and taxonomic group with the desired output
-while True:
+#Functions to read the highest memory use (resident set size, in bytes) of this process since it was last reset, and to reset it. Linux keeps it in /proc/self/status as VmHWM and resets it when 5 is written to /proc/self/clear_refs; elsewhere the highest use since the process started is given
+def peak_rss():
 
-    #User specifies the protein family and taxonomic group of their query and these inputs get saved to the variables protein_family and taxonomic_group. Unwanted characters are changed to a space.
-    protein_family = input("What is the protein family of your query?\n").replace("."," ").replace(";"," ").replace(","," ").replace("/"," ").replace("\\"," ").replace(":"," ").replace("'"," ").replace("\""," ").replace("_"," ")
-    
-    taxonomic_group = input("What is the taxonomic group of your organism query?\n").replace("."," ").replace(";"," ").replace(","," ").replace("/"," ").replace("\\"," ").replace(":"," ").replace("'"," ").replace("\""," ").replace("_"," ")
-    
-    #Identifies the taxonomic group ID on NCBI taxonomy database
-    temporary_taxon = subprocess.check_output(f"esearch -db taxonomy -query '{taxonomic_group}' | efetch -format docsum | xtract -pattern DocumentSummary -element Id", shell=True, text=True, stderr=subprocess.DEVNULL).strip()
-    
-    #If a valid taxon has been entered by the user, taxonomc_group will be reassigned to the taxonomid ID in the format txid____
-    if temporary_taxon.isnumeric():
-        taxonomic_group = "txid" + temporary_taxon
-    
-    #Checks whether the user has inputted the queries in a valid format, so eliminating blank spaces and other characters. Inputs including a number or letter will be valid to continue to esearch
-    if any(char.isalnum() for char in protein_family) and any(char.isalnum() for char in taxonomic_group):
-    
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
         pass
-    
-    else:
-        
-        #Identifying invalid format of taxonomic group
-        if any(char.isalnum() for char in protein_family):
-            print("You have not enetered a valid taxonomic group. Please re-enter your query.")
 
-        #Identifying invalid format of protein family
-        elif any(char.isalnum() for char in taxonomic_group):
-            print("You have not entered a valid protein family. Please re-enter your query.")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
 
-        continue
-    
-
-    while True:
-        
-        #User names a new directory as well as the name of most files produced for a specific query, so all outputs can be saved in the same location. Each query will therefore have its own directory.
-        query_name = input("What would you like to name the folder and subsequent outputs from this search? Please note that any of the following characters, as well as a space, will be changed to '_' for readability: '\\ / , ; :'\n")
 
-        #Removing unwanted characters from the directory name given by the user
-        query_name = query_name.replace(";","_").replace(",","_").replace("/","_").replace("\\","_").replace(":","_").replace("'","_").replace("\"","_").replace(" ","_")
- 
-        try:
-            #Creating the new directory
-            os.mkdir(query_name)
-            break
+def reset_peak_rss():
 
-        except FileExistsError:
-            
-            file_decision = input("This directory name already exists. Would you like to set it as the directory path for this query too? Please input 'Y' for yes or 'N' for no.\n")
-            if file_decision.upper() == "Y" or file_decision.lower() == "yes":
-                break
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
 
-            else:
-                pass
 
 
+#Function to read the bytes read and written so far by this process and the programs it has run, from /proc/self/io on Linux. Gives zeros elsewhere
+def io_counters():
 
-    #Attempting to catch out any error when running esearch and efetch
+    counters = {}
     try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                name, value = line.split(":")
+                counters[name] = int(value)
+    except OSError:
+        pass
 
-        #Running the user query until the input for including 'NOT PARTIAL' or not is provided well
-        while True:
+    return counters.get("rchar", 0), counters.get("wchar", 0)
 
 
-            #Asking the user if they want to run esearch with 'NOT PARTIAL' or not
-            partial = input("Would you like to consider all protein sequences found from your search, including those that contain an incomplete version of of the amino acid sequence (partial)? Please input 'Y' for yes or 'N' for no.\n")
 
-            #Not including 'NOT PARTIAL' in the NCBI search        
-            if partial.upper() == "Y" or partial.lower() == "yes":
-                print("Retrieving protein sequences of query from NCBI databases...")
-                
-                #Setting the -query field to be inputted into the esearch command
-                esearch_query = f"{protein_family}[PROT] AND {taxonomic_group}[ORGN]"
+#Function to trace a block of code as one event: its wall time, the CPU time of its thread and of the programs run meanwhile, the bytes read and written, and the memory of the process. The peak memory is not reset for each event, as other events may be running at the same time, so the event records how far it rose while the event ran (peak_rss_rise_mb, 0 if it stayed under an earlier peak) and the peak of the process so far (process_peak_rss_mb). The event's details can be added to through the dictionary given by the 'with' statement. Several stages running at the same time share the process, so their bytes and memory overlap
+@contextlib.contextmanager
+def traced(name, category, **details):
 
-                #Contains dictionary of the search fasta result
-                sequence_dict = retrieve_fasta(esearch_query)
-                
+    if trace_file is None:
+        yield details
+        return
 
-                #Checking if the search contains any results. If there are no results, retrieve_fasta() is run again one more time,                     without keeping results as specific by removing [PROT]
-                if len(sequence_dict) == 0:
-                    esearch_query = f"{protein_family} AND {taxonomic_group}[ORGN]"
-                    sequence_dict = retrieve_fasta(esearch_query)
+    start, thread_cpu_start = time.perf_counter(), time.thread_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read_start, written_start = io_counters()
+    peak_start = peak_rss()
 
-                break
+    try:
+        yield details
 
-            #Including 'NOT PARTIAL' in the NCBI search
-            elif partial.upper() == "N" or partial.lower() == "no":
-                print("Retrieving protein sequences of query from NCBI databases...")
+    finally:
+        end = time.perf_counter()
+        children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        read_end, written_end = io_counters()
+        peak_end = peak_rss()
 
-                #Setting the -query field to be inputted into the esearch command
-                esearch_query = f"{protein_family}[PROT] AND {taxonomic_group}[ORGN] NOT PARTIAL"
-                
-                #Contains dictionary of the search fasta result
-                sequence_dict = retrieve_fasta(esearch_query)
+        details.update({
+            "cpu_seconds": round(time.thread_time() - thread_cpu_start, 6),
+            "program_cpu_seconds": round((children_end.ru_utime + children_end.ru_stime) - (children_start.ru_utime + children_start.ru_stime), 6),
+            "bytes_read": read_end - read_start,
+            "bytes_written": written_end - written_start,
+            "peak_rss_rise_mb": round((peak_end - peak_start) / 1024 ** 2, 1),
+            "process_peak_rss_mb": round(peak_end / 1024 ** 2, 1),
+        })
 
-                #Checking if the search contains any results. If there are no results, retrieve_fasta() is run again one more time,                      without keeping results as specific by removing [PROT]
-                if len(sequence_dict) == 0:
-                    esearch_query = f"{protein_family} AND {taxonomic_group}[ORGN] NOT PARTIAL"
-                    sequence_dict = retrieve_fasta(esearch_query)
+        with trace_lock:
+            trace_events.append({"name": name, "cat": category, "ph": "X", "ts": round((start - trace_start) * 1e6), "dur": round((end - start) * 1e6), "pid": os.getpid(), "tid": threading.get_ident(), "args": details})
 
-                break
 
-            else:
-                print("You have not entered a valid character. Please try again.")
 
+#Function to trace every call of a function, e.g. a parser, as an event named after the function
+def traced_calls(category):
 
-        #Checks if the final search has any results
-        if len(sequence_dict) != 0:
-            
-            #Checks whether the search was limited to 1000
-            if len(sequence_dict) > 1000:
-                length = 1000
-            else:
-                length = len(sequence_dict)
+    def decorate(function):
 
-            #Outputs the number of searches found and displays the first 5
-            print("Your query has returned " + str(length) + " protein sequences of the protein family " + protein_family + " and taxonomic group " + taxonomic_group + ". The first few outputs of this search are shown below:")
-            
-            print(subprocess.call(f"grep '>' ./{query_name}/{query_name}.pro.fa | head -n5", shell=True))
-        
-            
-            #Allows user to confirm whether the displayed results are as they desired. Any other input other than yes will not be considered
-            decision = input("Is this your desired search? Please type 'Y' for yes or 'N' for no.\n")
+        @functools.wraps(function)
+        def traced_function(*arguments, **options):
+            with traced(function.__name__, category):
+                return function(*arguments, **options)
 
-            if decision.upper() == "Y" or decision.lower() == "yes":
-                print(f"Great! The fasta sequences for your protein query are saved under ./{query_name}/{query_name}.pro.fa")
-                
-                break
+        return traced_function
 
-            else:
+    return decorate
 
-                #Will delete the directory created if the output is not as desired.
-                shutil.rmtree(f"./{query_name}/")
-                print("It seems you have instructed that these results are not as you desired. Please start this process again.")
-        
-        else:
-            
-            #Will delete the directory created if there are no search results for the query given.    
-            shutil.rmtree(f"./{query_name}/")
-            print("There are no results for your query. Please start again.")
 
 
-    except:
-        shutil.rmtree(f"./{query_name}/")
-        print("There are no results for your query. Please start again.")
+#Function to run an external program, tracing it together with its exit status. While tracing, the error output it would have thrown away is kept in the trace instead. Gives the exit status, as subprocess.call does
+def run_program(command, **options):
 
+    name = (command.split()[0] if isinstance(command, str) else command[0]).rsplit("/", 1)[-1]
 
+    with traced(name, "program", command=command if isinstance(command, str) else " ".join(command)) as details:
+        if trace_file is not None and options.get("stderr") is subprocess.DEVNULL:
+            options["stderr"] = subprocess.PIPE
 
-protein_family = protein_family.replace(" ","_")
-taxonomic_group = taxonomic_group.replace(" ","_")
+        completed = subprocess.run(command, **options)
+        details["exit_status"] = completed.returncode
 
+        if completed.stderr:
+            details["stderr"] = completed.stderr[-trace_stderr_characters:].decode(errors="replace")
 
+    return completed.returncode
 
 
-##############################################################################################################################
-#Aligning and plotting conservation across protein query
 
-if os.path.exists(f"./{query_name}/{query_name}.pro.fa"):
-    aligned_fasta = f"{query_name}_aligned.pro.fa"
+#Function to save the trace events to trace_file, along with the total time, CPU time, bytes and calls of each kind of event. Run when the script ends
+def write_trace():
 
-    #Creating a function to align the fasta sequeces of the protein query and generate a conservation plot png
-    def plot_conservation(query, aligned_file):
+    if trace_file is None:
+        return
 
-        print("Aligning clustered query sequences...")
+    totals = {}
+    with trace_lock:
+        for event in trace_events:
+            total = totals.setdefault(f"{event['cat']}:{event['name']}", {"calls": 0, "seconds": 0, "cpu_seconds": 0, "program_cpu_seconds": 0, "bytes_read": 0, "bytes_written": 0})
+            total["calls"] += 1
+            total["seconds"] += event["dur"] / 1e6
+            for counter in ["cpu_seconds", "program_cpu_seconds", "bytes_read", "bytes_written"]:
+                total[counter] += event["args"][counter]
 
-        #Aligning the query sequences, and outputting a conservation score and similarity score
-        subprocess.call(f"clustalo -i ./{query}/{query}.pro.fa --force --threads=256 -o ./{query}/{aligned_file}", shell=True)
-        print(f"Aligned fasta sequences of your protein query have been saved in ./{query}/{aligned_file}")
+        with open(trace_file, "w") as trace_output:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": {"totals": totals}}, trace_output)
 
+    print(f"The trace of this run has been saved in {trace_file}. The slowest steps were:")
+    for name, total in sorted(totals.items(), key=lambda item: item[1]["seconds"], reverse=True)[:10]:
+        print(f"  {name}: {total['seconds']:.3f} s in {total['calls']} calls, {total['cpu_seconds'] + total['program_cpu_seconds']:.3f} s CPU, {total['bytes_read']} bytes read, {total['bytes_written']} bytes written")
 
-        print("Generating plot of conservation of query sequence...")
 
-        #Plotting the aligned sequences
-        subprocess.call(f"plotcon -sequence ./{query}/{aligned_file} -winsize 7 -graph png -goutfile ./{query}/{query}_conservation_plot", shell=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-        os.rename(f"./{query}/{query}_conservation_plot.1.png", f"./{query}/{query}_conservation_plot.png")
-        print(f"Your generated conservation plot has been saved in the path ./{query}/{query}_conservation_plot.png")
 
 
 
-    #First output on screen to start the process of alignment of user query
-    alignment_question = input("Would you like to determine and plot the level of conservation between the protein sequences of your query? Please input 'Y' for yes or 'N' for no.\n")
 
 
-    #Runs the alignment function and plots the conservation
-    if alignment_question.upper() == "Y" or alignment_question.lower() == "yes":
+####################################################################################################################################
+#Reading fasta files and fetching results from the NCBI E-utilities
 
-        plot_conservation(query_name, aligned_fasta)
 
-        #Asks user if they want the plot to be opened in a separate window
-        view_image = input("Would you like to view the conservation plot? Please input 'Y' for yes or 'N' for no.\n")
-        if view_image.upper() == "Y" or view_image.lower() == "yes":
+#Function to read a fasta file one record at a time, yielding each header and its sequence. Only the record currently being read is held in memory, so memory use stays flat no matter how large the file is
+def read_fasta(fasta_file):
 
-            print("Plot is opening in separate window...")
-            subprocess.call(f"eog ./{query_name}/{query_name}_conservation_plot.png", shell=True)
+    header = None
+    sequence_lines = []
 
-    else:
+    #The trace covers the whole read, including the time spent by the caller on each record
+    with traced("read_fasta", "parse", file=fasta_file), open(fasta_file) as fasta:
+        for line in fasta:
+            line = line.rstrip()
 
-        print("It seems you have decided not to generate conservation plots of your query.")
+            #A '>' marks the start of a new record, so the previous record is complete and can be handed out
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(sequence_lines)
 
+                header = line[1:]                            #Sets the header without the '>'
+                sequence_lines = []
 
+            #Collecting the sequence lines of the current record, ignoring anything before the first header
+            elif header is not None:
+                sequence_lines.append(line)
 
+        #Handing out the last record of the file
+        if header is not None:
+            yield header, "".join(sequence_lines)
 
 
 
-###########################################################################################################################
-#Identifying motifs from the protein and taxon query
+#Function to memory-map a file read-only, so opening it costs nothing and only the pages that are used are read from disk. An empty file cannot be memory-mapped, and has nothing to read anyway, so it gives an empty bytes object
+def map_file(path):
 
+    with open(path, "rb") as mapped_file:
+        if os.path.getsize(path) == 0:
+            return b""
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
 
 
-if os.path.exists(f"./{query_name}/{query_name}.pro.fa"):
-    query_file = open(f"./{query_name}/{query_name}.pro.fa")
-    sequence_list = query_file.read().rstrip().split(">")
-    query_file.close()
 
+#Settings of the NCBI E-utilities fetch. The base URL can be pointed at a local server for testing, and an NCBI_API_KEY in the environment raises the rate limit from 3 to 10 requests per second, as with EDirect
+eutils_base_url = os.environ.get("PROTEIN_ANALYSIS_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/")
+eutils_api_key = os.environ.get("NCBI_API_KEY")
+eutils_batch_size = 500
+eutils_workers = 3
+eutils_retries = 5
 
-    #Making a function to find the motifs in the protein sequence query
-    def find_motifs(list_of_sequences, find=None, motif_chosen=None):
-        if os.path.exists(f"./{query_name}/{query_name}_motifs.txt"):
-            os.remove(f"./{query_name}/{query_name}_motifs.txt")
-    
-        print("Identifying motifs in the protein sequence query...")
+#Most search results fetched for a query. None fetches every result, however many there are: they are fetched to disk in batches, and the later stages read them a record or a chunk at a time
+max_results = 1000
 
-        #Looping through the fasta sequences one at a time to identify motifs
-        for i in list_of_sequences:
-            if i != '':              #Ignoring the first empty entry
+#Directory every E-utilities response is recorded to when set, so the benchmark can replay the recorded searches later without NCBI. Each response is saved under the hash of its request, and the request is added to index.jsonl in the same directory
+eutils_recordings = os.environ.get("PROTEIN_ANALYSIS_EUTILS_RECORD")
+eutils_recording_lock = threading.Lock()
 
-                #Creating a new temporary file and writing each sequence to it
-                with open(f"./{query_name}/temporary_fasta_file", "w") as temporary_file:
-                    temporary_file.write(">" + i)
 
-                #Identifies motifs from PROSITE database in the protein sequences from the query
-                subprocess.call(f"patmatmotifs -sequence ./{query_name}/temporary_fasta_file -outfile ./{query_name}/{query_name}_temporary_motifs.txt", shell=True, stderr=subprocess.DEVNULL)
 
-                #Opening the newly made temporary file
-                with open(f"./{query_name}/{query_name}_temporary_motifs.txt") as temporary_motif_file:
-                    fasta_content = temporary_motif_file.read()
+#Class to space out the requests sent to NCBI so that all threads together stay under the allowed number of requests per second
+class RateLimiter:
 
-                    #Creating a new file to append each fasta sequnce followed by "\nnew_seuqnce". This way, each fasta sequnce has a clear separater of this string.
-                    with open(f"./{query_name}/{query_name}_motifs.txt", "a") as motif_file:
-                        motif_file.write(fasta_content + "\nnew_sequence")
+    def __init__(self, requests_per_second):
+        self.interval = 1 / requests_per_second
+        self.next_time = 0
+        self.lock = threading.Lock()
 
-        #Removng the temporary files
-        os.remove(f"./{query_name}/temporary_fasta_file")
-        os.remove(f"./{query_name}/{query_name}_temporary_motifs.txt")
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
 
-        #Opens the final motif file
-        motif_open = open(f"./{query_name}/{query_name}_motifs.txt")
+        if delay > 0:
+            time.sleep(delay)
 
-        #Splits the file into a list, separating by each "\nnew_sequence"
-        motif_sequences = motif_open.read().split("\nnew_sequence")
-        motif_open.close()
 
+eutils_rate_limiter = RateLimiter(10 if eutils_api_key else 3)
 
-        if find is None:
 
-            #Creating a dictionary to save all the types of motifs present along with their counts from the query search
-            motifs = {}
 
-    
-            #Looping through all the motifs found in the fasta sequences and counting them and storing the number of each motif in a dictionary
-            for j in motif_sequences:   
-                try:
+#Function to name the recording of an E-utilities request after the utility and its parameters, leaving out the API key
+def eutils_recording_key(utility, parameters):
 
-                    #Splitting the lines of the patmatmotifs output into a list
-                    lines = j.split("\n")
+    return hashlib.sha256(json.dumps([utility, sorted((key, str(value)) for key, value in parameters.items() if key != "api_key")]).encode()).hexdigest()
 
-                    #Retrieving the line that contains the type of motif present
-                    motif_name = lines[25][8:]
-                    motifs[motif_name] = motifs.get(motif_name, 0) + 1
 
-                #Excludes any sequences not containing a motif
-                except IndexError:
-                    continue
 
-            #Check whether any motifs were found    
-            if len(motifs) != 0:
-                motifs_found = []
+#Function to send one request to an E-utility (esearch, efetch...), retrying with an increasing wait when NCBI is rate limiting, overloaded or the connection fails
+def eutils_request(utility, parameters, base_url=None, retries=None):
 
-                #Joins all the motifs found and how many times each were found to a list
-                for key, value in motifs.items():
-                    motifs_found.append(f"Found the motif {key} {value} times.")
+    base_url = base_url or eutils_base_url
+    retries = eutils_retries if retries is None else retries
 
-                #Outputs all the motifs found and how many times they were found
-                print("Summary of motifs found in protein sequence query below:\n" + "\n".join(motifs_found))
+    if eutils_api_key:
+        parameters = dict(parameters, api_key=eutils_api_key)
 
+    #Parameters are sent by POST so long queries are not limited by the URL length
+    data = urllib.parse.urlencode(parameters).encode()
 
-            else:
-                print("No motifs found in the protein sequence query.")
+    for attempt in range(retries + 1):
+        eutils_rate_limiter.wait()
+        wait = 2 ** attempt
 
-            #The output of the function is the dictionary of the motifs found with the corresponding number of times they were found
-            return motifs
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base_url.rstrip("/") + f"/{utility}.fcgi", data=data), timeout=60) as response:
+                body = response.read()
 
+            if eutils_recordings:
+                recorded_parameters = {key: str(value) for key, value in parameters.items() if key != "api_key"}
+                with eutils_recording_lock:
+                    os.makedirs(eutils_recordings, exist_ok=True)
+                    with open(os.path.join(eutils_recordings, eutils_recording_key(utility, parameters)), "wb") as recording:
+                        recording.write(body)
+                    with open(os.path.join(eutils_recordings, "index.jsonl"), "a") as recording_index:
+                        recording_index.write(json.dumps({"utility": utility, "parameters": recorded_parameters, "recording": eutils_recording_key(utility, parameters)}) + "\n")
 
-        #Section for wildcard blast step
-        elif find == True:
+            return body.decode()
 
-            ids_with_chosen_motif = []
+        #Too many requests (429) and server errors (5xx) are retried, honouring the wait asked for by NCBI. Any other error, e.g. a malformed query, is raised straight away
+        except urllib.error.HTTPError as error:
+            if error.code != 429 and error.code < 500 or attempt == retries:
+                raise
+            if error.headers.get("Retry-After", "").isnumeric():
+                wait = int(error.headers["Retry-After"])
 
-            for j in motif_sequences:
-                try:
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            if attempt == retries:
+                raise
 
-                    #Splitting the lines of the patmatmotifs output into a list
-                    lines = j.split("\n")
+        time.sleep(wait)
 
-                    #Retrieving the line that contains the type of motif present
-                    if lines[25][8:] == motif_chosen:
-                        name = lines[12][12:].split(" ")
-                        ids_with_chosen_motif.append(name[0])
 
-                #Excludes any sequences not containing a motif
-                except IndexError:
 
-                    continue
+#Function to run esearch and keep the result on the NCBI history server, giving the number of results along with the WebEnv and query_key used to fetch them
+def esearch_history(NCBI_query, database="protein", base_url=None):
 
-            #Returns the accession numbers
-            return set(ids_with_chosen_motif)
+    result = ElementTree.fromstring(eutils_request("esearch", {"db": database, "term": NCBI_query, "usehistory": "y", "retmax": 0}, base_url))
 
+    if result.find("ERROR") is not None:
+        raise RuntimeError(result.find("ERROR").text)
 
+    return int(result.findtext("Count", "0")), result.findtext("WebEnv"), result.findtext("QueryKey")
 
-    #First output to the user before finding protein query motifs
-    motif_decision = input("Would you like the identify the motifs from PROSITE in your protein query sequences? Please input 'Y' for yes or 'N' for no.\n")
 
-    if motif_decision.upper() == "Y" or motif_decision.lower() == "yes":
 
-        #Running the function find_motifs() using the query
-        motifs_found = find_motifs(sequence_list)
-        print(f"The full output of motifs per protein sequence from your query can be found in ./{query_name}/{query_name}_motifs.txt")
+#Function to fetch one batch of fasta records from the history server and save it as a part file. The part file only appears once the whole batch has been written, so a part file that exists is always complete
+def efetch_batch(database, webenv, query_key, start, batch_size, part_file, base_url=None):
 
-    else:
+    if os.path.exists(part_file):
+        return
 
-        print("It seems you have chosen to not identify the motifs in your protein query.")
+    fasta = eutils_request("efetch", {"db": database, "WebEnv": webenv, "query_key": query_key, "retstart": start, "retmax": batch_size, "rettype": "fasta", "retmode": "text"}, base_url)
 
+    #NCBI sometimes answers with an error message instead of fasta records, which is treated as a failed batch
+    if fasta.strip() != "" and not fasta.lstrip().startswith(">"):
+        raise RuntimeError(f"efetch returned no fasta records for results {start} to {start + batch_size}: {fasta.strip()[:200]}")
 
+    #Each batch ends on a new line so that the batches can be joined together
+    if fasta != "" and not fasta.endswith("\n"):
+        fasta += "\n"
 
+    temporary_file = f"{part_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_file, "w") as part_output:
+        part_output.write(fasta)
+    os.rename(temporary_file, part_file)
 
-###############################################################################################################################
-#WILDCARD: Building a blast database off of a motif subset of the user's protein query and asking for a new taxon to blast against
 
 
+#Function to search NCBI and download the fasta records of the results to output_file in fixed-size batches, with a few batches downloading at the same time. The batches are kept in a parts directory of the cache until all of them have arrived, so a failed download resumes from the missing batches when run again with the same query, even if the folder of output_file was removed after the failure
+def fetch_fasta(NCBI_query, output_file, database="protein", limit=None, batch_size=None, workers=None, base_url=None):
 
+    batch_size = batch_size or eutils_batch_size
+    workers = workers or eutils_workers
 
+    count, webenv, query_key = esearch_history(NCBI_query, database, base_url)
+    if limit is not None:
+        count = min(count, limit)
 
-#Making a variable for the pullseq command path
-pullseq_path = "/localdisk/data/BPSM/ICA2/pullseq"
+    #Parts saved by an earlier attempt are only used for the same endpoint, query, batches and output file. Parts left behind by downloads that were never run again are removed once they are older than cache_ttl
+    os.makedirs(fetch_parts_cache, exist_ok=True)
+    for entry in os.scandir(fetch_parts_cache):
+        try:
+            if time.time() - entry.stat().st_mtime > cache_ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
 
+    parts_directory = os.path.join(fetch_parts_cache, cache_key(base_url or eutils_base_url, database, NCBI_query, count, batch_size, os.path.abspath(output_file)))
+    os.makedirs(parts_directory, exist_ok=True)
 
+    #Downloading every batch, with at most 'workers' requests running at once. Errors are only raised after every other batch has had its chance to finish
+    starts = range(0, count, batch_size)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        downloads = [pool.submit(efetch_batch, database, webenv, query_key, start, min(batch_size, count - start), f"{parts_directory}/{start}.fa", base_url) for start in starts]
 
+    for download in downloads:
+        download.result()
 
-#Function to extract the wanted fasta sequences with the chosen motif and make a blastp database out of these fasta sequences
-def motif_assessment(motif_chosen):
+    #Joining the batches in order into the final fasta file
+    with open(output_file, "w") as fasta_output:
+        for start in starts:
+            with open(f"{parts_directory}/{start}.fa") as part_input:
+                shutil.copyfileobj(part_input, fasta_output)
 
-    #Finding the accession numbers of the fasta sequences containing the chosen motif and adding them to a list
-    ids = list(find_motifs(sequence_list, find=True, motif_chosen=motif_chosen))
+    shutil.rmtree(parts_directory, ignore_errors=True)
 
-    #Opening a new temporary file to add the list of accession numbers to
-    with open(f"./{query_name}/{query_name}_temporary_list.txt", "w") as id_file:
-        for each_id in ids:
-            id_file.write(each_id + "\n")
+    return count
 
-    #Running pullseq to extract the fasta sequences from the original query search fasta file that contain the accession number from the newly-made list in their headers
-    subprocess.call(f"{pullseq_path} -i ./{query_name}/{query_name}.pro.fa -n ./{query_name}/{query_name}_temporary_list.txt > ./{query_name}/{query_name}_motif_db.pro.fa ", shell=True)
-    
-    #Deleting the temporary file listing accesion numbers
-    os.remove(f"./{query_name}/{query_name}_temporary_list.txt")
-    
-    #Checks if this function has been run for this original query yet or not
-    try:
 
-        #A new subdirectory will be made when this function is run for the first time per original query
-        os.mkdir(f"./{query_name}/blast_database")
 
-    except FileExistsError:
+#Function to search NCBI and save the accession numbers of the first 'limit' results to output_file, one per line
+def fetch_accessions(NCBI_query, output_file, database="protein", limit=10, base_url=None):
 
-        #Will not re-create a subdirectory when this function has already been run
-        pass
+    result = ElementTree.fromstring(eutils_request("esearch", {"db": database, "term": NCBI_query, "retmax": limit}, base_url))
+    ids = [id_element.text for id_element in result.iter("Id")]
 
-    #Makes a database of the fasta sequences containing the chosen motif to be able to use in blast
-    subprocess.call(f"makeblastdb -in ./{query_name}/{query_name}_motif_db.pro.fa -dbtype prot -out ./{query_name}/blast_database/{motif_chosen}", shell=True, stdout=subprocess.DEVNULL)
+    accessions = ""
+    if len(ids) != 0:
+        accessions = eutils_request("efetch", {"db": database, "id": ",".join(ids), "rettype": "acc", "retmode": "text"}, base_url)
 
-    print(f"The database out of proteins from your query with your chosen motifs is saved in ./{query_name}/blast_database/")
+    with open(output_file, "w") as accession_output:
+        accession_output.write(accessions)
 
-    #Deletes the output file from pullseq as it is no longer needed: the database has already been made
-    os.remove(f"./{query_name}/{query_name}_motif_db.pro.fa")
 
 
+#Function to save the fasta sequences of one accession number, or of a list of them, to output_file. A list is fetched batch_size accession numbers per request. The file is left empty if NCBI does not recognise the accession numbers
+def fetch_fasta_by_id(accessions, output_file, database="protein", batch_size=None, base_url=None):
 
+    accessions = [accessions] if isinstance(accessions, str) else list(accessions)
+    batch_size = batch_size or eutils_batch_size
 
+    with open(output_file, "w") as fasta_output:
+        for start in range(0, len(accessions), batch_size):
+            try:
+                fasta = eutils_request("efetch", {"db": database, "id": ",".join(accessions[start:start + batch_size]), "rettype": "fasta", "retmode": "text"}, base_url)
+            except urllib.error.HTTPError:
+                fasta = ""
 
-#Function to identify the user's new query they want to use in blast, and subsequently runs ths query in blastp against the newly-made database from fasta sequences containing a certain motif
-def run_blast(motif_chosen):
+            if not fasta.lstrip().startswith(">"):
+                continue
 
-    #Defining a function within run_blast() that refines the search query of the user for esearch
-    def carry_on(new_query):
+            fasta_output.write(fasta if fasta.endswith("\n") else fasta + "\n")
 
-        #Removing unwanted spaces form the new query name
-        new_query = new_query.replace(" ", "_")
 
-        #Opens the temporary file created later on in the run_blast() function, containing the accession numbers of esearch
-        with open(f"./{query_name}/{query_name}_temporary_accs.txt", "r") as accs:
 
-            counter=0
-            options = {}
-            
-            #Looping through each accession number
-            for line in accs:
-                counter += 1
+####################################################################################################################################
+#Indexing fasta files by accession number, so a subset of their records can be copied out without reading the whole file, and packing their sequences into one store shared by every stage
 
-                #Enumerates each accession number
-                print(str(counter) + ": " + line)
 
-                #Adds the number and corresponding accession number to a dictionary
-                options[counter] = line.rstrip()
-                
 
-            #Loops until a valid input is given to identify which accession number will be used for the blast
-            while True:
+#Function to index a fasta file next to it: fasta_file.idx has sorted lines of 'accession<TAB>byte offset<TAB>byte length' of each record, and fasta_file.idx.bin where each line starts, for binary search. The accession is the first word of the header
+@traced_calls("index")
+def index_fasta(fasta_file):
 
-                #Asks the user to input a number from the dictionary of accession numbers created
-                id_choice = input("Which species would you like to pick from the list to blast against your protein motif query database? Please input a number from the list of choices from above.\n")
+    entries = []
+    with open(fasta_file, "rb") as fasta:
+        offset = 0
+        for line in fasta:
+            if line.startswith(b">"):
+                if entries != []:
+                    entries[-1][2] = offset - entries[-1][1]
+                entries.append([line[1:].split(maxsplit=1)[0] if line[1:].strip() != b"" else b"", offset, 0])
+            offset += len(line)
 
-                #Checks if the user has inputted an integer
-                try:
+        if entries != []:
+            entries[-1][2] = offset - entries[-1][1]
 
-                    #Checks if the user has inputted a number present in the dictionary, corresponding to an accession number
-                    if int(id_choice) in options.keys():
+    entries.sort()
+    line_starts = array.array("Q")
 
-                        #Extracts the fasta sequence corresponding to the chosen accession number and saves that to a new file
-                        subprocess.call(f"efetch -db protein -id {options[int(id_choice)]} -format fasta > ./{query_name}/{new_query}.pro.fa", shell=True)
-                        
-                        break
-                    
-                    #The user has the chance to re-input a number if the given number is invalid
-                    else:
+    #Both files are written under temporary names first, so a half-written index is never used
+    with open(f"{fasta_file}.idx.tmp", "wb") as index_file:
+        position = 0
+        for accession, offset, length in entries:
+            line = accession + f"\t{offset}\t{length}\n".encode()
+            line_starts.append(position)
+            index_file.write(line)
+            position += len(line)
 
-                        print("The number you have chosen is not in the list of accession names listed above. Please input another number.\n")
-                
-                #If the user has inputted anything besides an integer, they will have the change to re-enter
-                except ValueError:
+    with open(f"{fasta_file}.idx.bin.tmp", "wb") as offsets_file:
+        line_starts.tofile(offsets_file)
 
-                    print("The number you have chosen is not in the correct format. Please ensure you only enter the number from the list shown.")
+    os.replace(f"{fasta_file}.idx.bin.tmp", f"{fasta_file}.idx.bin")
+    os.replace(f"{fasta_file}.idx.tmp", f"{fasta_file}.idx")
 
 
-    #Loops until the user has entered a valid input as to whether they want to input their own accession number or to run esearch on a taxon to chose from a list of accession number
-    while True:
 
-        #Asks the user to decide between option 1 or 2
-        own_query = input(f"Would you like to (1) enter your own query accession number for a taxon and {protein_family} or would you like to (2) search up top results for a general taxon? Please enter '1' or '2' corresponding to the these options.\n")
-        
-        #Checks if the user has inputted an integer
-        try:
+#Class looking up records of an indexed fasta file by accession number, reading the index through memory maps
+class FastaIndex:
 
-            #Checks if the user has chosen option 1
-            if int(own_query) == 1:
+    def __init__(self, fasta_file):
+        self.lines = map_file(f"{fasta_file}.idx")
+        self.line_starts = memoryview(map_file(f"{fasta_file}.idx.bin")).cast("Q")
 
-                while True:
-                    new_query = input("What is the accession number of your query?\n").upper()
+    #Gives the accession number on one line of the sorted index
+    def accession_at(self, position):
+        start = self.line_starts[position]
+        return self.lines[start:self.lines.find(b"\t", start)]
 
-                    print("Accessing the sequence to your accession number from NCBI protein database...")
+    #Gives the byte offset and length of the record of an accession number, or None if it is not in the fasta file
+    def record(self, accession):
+        accession = accession.encode()
 
-                    #Extracts the fasta sequence corresponding to the accession number provided by the user
-                    subprocess.call(f"efetch -db protein -id {new_query} -format fasta > ./{query_name}/{new_query}.pro.fa", shell=True, stderr=subprocess.DEVNULL)
-                    
-                    if os.path.getsize(f"./{query_name}/{new_query}.pro.fa") != 0:
-                        break
-                    else:
-                        print("The access number you entered was either mistyped or does not correspond to a sequence. Please enter another one.")
-                                        
+        position = bisect.bisect_left(range(len(self.line_starts)), accession, key=self.accession_at)
+        if position == len(self.line_starts) or self.accession_at(position) != accession:
+            return None
 
-                break
+        start = self.line_starts[position] + len(accession) + 1
+        offset, length = self.lines[start:self.lines.find(b"\n", start)].split(b"\t")
+        return int(offset), int(length)
 
-            #Checks if the user has chosen option 2
-            elif int(own_query) == 2:
 
-                #Loops until an esearch result desired is achieved
-                while True:
 
-                    #Asks the user to input the taxon to use for as a blast query. Any unwanted characters in the input will be replaced by a space
-                    new_query = input(f"What is the taxon of your new query to blastp {protein_family} againist your initial query of {taxonomic_group}? Please note that only the first 10 NCBI protein database results will be considered.\n").replace("."," ").replace(";"," ").replace(","," ").replace("/"," ").replace("\\"," ").replace(":"," ").replace("'"," ").replace("\""," ").replace("_"," ")
+#Function to copy the records of some accession numbers from a fasta file to output_file, in the order they have in the fasta file. The index is (re)built first if it is missing or older than the fasta file
+@traced_calls("index")
+def extract_fasta(fasta_file, accessions, output_file):
 
-                    print("Finding results for your new query on NCBI protein database...")        
-        
-                    #Runs esearch to achieve the accession numbers of the first 10 results with their taxon query
-                    subprocess.call(f"esearch -db protein -query '{protein_family}[PROT] AND {new_query}[ORGN]' -retmax 10 | efetch -format acc -start 0 -stop 10 > ./{query_name}/{query_name}_temporary_accs.txt", shell=True, stderr=subprocess.DEVNULL)
-                    
-                    #Checks if the file outputted from esearch contains any accession numbers
-                    if os.path.getsize(f"./{query_name}/{query_name}_temporary_accs.txt") != 0:
-                        
-                        #Runs carry_on() function described above
-                        carry_on(new_query)
+    if not os.path.exists(f"{fasta_file}.idx.bin") or os.path.getmtime(f"{fasta_file}.idx.bin") < os.path.getmtime(fasta_file):
+        index_fasta(fasta_file)
 
-                        break
-                    
-                    #If the file outputted form esearch does not contain any accession numbers, esearch will be run one more time without including [PROT] to check if any accession numbers can be achieved if the search is less specific
-                    else:
-                        
-                        #Runs esearch to acheive the accession numbers of the first 10 results with thei user's taxon query
-                        subprocess.call(f"esearch -db protein -query '{protein_family} AND {new_query}[ORGN]' -retmax 10 | efetch -format acc -start 0 -stop 10 > ./{query_name}/{query_name}_temporary_accs.txt", shell=True, stderr=subprocess.DEVNULL)
-        
-                        #Again checks if the file outputted from esearch contains any accession numbers
-                        if os.path.getsize(f"./{query_name}/{query_name}_temporary_accs.txt") != 0:
-                            
-                            #Runs carry_oun() function described above
-                            carry_on(new_query)
+    index = FastaIndex(fasta_file)
+    records = sorted(filter(None, (index.record(accession) for accession in accessions)))
 
-                            break
+    #Seeking straight to each record, so only the records asked for are read
+    with open(fasta_file, "rb") as fasta, open(output_file, "wb") as fasta_output:
+        for offset, length in records:
+            fasta.seek(offset)
+            fasta_output.write(fasta.read(length))
 
-                        
-                        else:
+    return len(records)
 
-                            #If there are no results in esearch, the user has the choice to try searching again
-                            again_decision = input("There are no results for your query. Would you like to input another new query? Please input 'Y' for yes or 'N' for no.\n")
 
-                            #Checks if the user wants to try search with a new taxon
-                            if again_decision.upper() == "Y" or again_decision.lower() == "yes":
-                                
-                                continue
 
-                            else:
+#Lock held while a sequence store is checked and built
+sequence_store_lock = threading.Lock()
 
-                                break
-                break
-            
-            #If the user has not inputted 1 or 2, they can re-enter a number
-            else:
-                print("You did not enter a valid number. Please try again.")
-        
 
-        #If the user inputted anything besides an integer, they can re-enter a number
-        except ValueError:
-            
-            print("You did not enter a valid number. Please try again.")
 
+#Function to pack the records of a fasta file into a sequence store next to it: fasta_file.seq holds every sequence one after another as upper case letters, one byte per residue, with no headers or line breaks, and fasta_file.headers the headers on lines of their own. fasta_file.seq.offsets and fasta_file.headers.offsets give where each sequence and header starts, with one more offset at the end
+@traced_calls("index")
+def build_sequence_store(fasta_file):
 
-    #Checks if the file containing accession number has been created, and if it has, it is deleted
-    if os.path.exists(f"./{query_name}/{query_name}_temporary_accs.txt"):
-        os.remove(f"./{query_name}/{query_name}_temporary_accs.txt")
-    
-    #Ensures that the new_query variable does not have any spaces remaining
-    new_query = new_query.replace(" ", "_")
+    sequence_offsets, header_offsets = array.array("Q", [0]), array.array("Q", [0])
 
-    #Checks if the fasta sequence for the new taxon query has been extracted
-    if os.path.exists(f"./{query_name}/{new_query}.pro.fa"):
+    #Every file is written under a temporary name first, so a half-written store is never used
+    with open(f"{fasta_file}.seq.tmp", "wb") as sequence_output, open(f"{fasta_file}.headers.tmp", "wb") as header_output:
+        for header, sequence in read_fasta(fasta_file):
+            sequence = sequence.upper().encode()
+            header = header.encode() + b"\n"
+            sequence_output.write(sequence)
+            header_output.write(header)
+            sequence_offsets.append(sequence_offsets[-1] + len(sequence))
+            header_offsets.append(header_offsets[-1] + len(header))
 
-        print("Running blastp of your new query against your intial protein motif query database...")
+    for file_name, offsets in [("seq.offsets", sequence_offsets), ("headers.offsets", header_offsets)]:
+        with open(f"{fasta_file}.{file_name}.tmp", "wb") as offsets_output:
+            offsets.tofile(offsets_output)
 
-        #Runs blastp of the new query fasta file aganst the database made of protein fasta sequences containing the chosen motif from the original query
-        subprocess.call(f"blastp -query ./{query_name}/{new_query}.pro.fa -db ./{query_name}/blast_database/{motif_chosen} -outfmt 7 > ./{query_name}/{motif_chosen}_{new_query}_blast.out", shell=True)
-    
-    #Function returns the name of the new taxon query
-    return new_query
+    #The sequences are replaced last, as their modification time tells whether the store is current
+    for file_name in ["headers", "headers.offsets", "seq.offsets", "seq"]:
+        os.replace(f"{fasta_file}.{file_name}.tmp", f"{fasta_file}.{file_name}")
 
 
 
+#Class reading the records of a sequence store through memory maps, so every stage, thread and worker process reading the same store shares one copy of it in memory, and nothing is read from disk until it is used. Iterating over it gives (header, sequence) records, just like read_fasta()
+class SequenceStore:
 
+    def __init__(self, fasta_file):
+        self.fasta_file = fasta_file
+        self.residues = map_file(f"{fasta_file}.seq")
+        self.sequence_offsets = memoryview(map_file(f"{fasta_file}.seq.offsets")).cast("Q")
+        self.headers = map_file(f"{fasta_file}.headers")
+        self.header_offsets = memoryview(map_file(f"{fasta_file}.headers.offsets")).cast("Q")
 
-#Function that assesses the blastp output, saves the output as a csv file, and summarises the most similar sequences found across the new query and old query with a chosen motif
-def assess_blastp(motif_chosen, new_query):
-    
-    try:
-        #Reads the blastp outfut as a data frame, only if hits were found, ignoring the comment lines in the file
-        df = pd.read_csv(f"./{query_name}/{motif_chosen}_{new_query}_blast.out", sep="\t", comment ="#")
+    def __len__(self):
+        return len(self.sequence_offsets) - 1
 
-    except pd.errors.EmptyDataError:
+    def __iter__(self):
+        return self.records()
 
-        #Lets the user know that no hits were found with this blast, so they should try with a different query
-        print("There are no resulting hits form your results! Please start again with a new query.")
-        return
+    def header(self, number):
+        return self.headers[self.header_offsets[number]:self.header_offsets[number + 1] - 1].decode()
 
-    #Sets the column names of the data frame
-    df.columns = ['Query Accession Number', f'{taxonomic_group} Accesion Number', '% Identity', 'Alignment Length', 'Mismatches', 'Gap Opens', 'Query Sequence Start', 'Query Sequence End', f'{taxonomic_group} Sequence Start', f'{taxonomic_group} Sequence End', 'E-value', 'Bit Score']
-    
-    
-    #Loops until a valid threshold value is entered by the user
-    while True:
+    def accession(self, number):
+        return self.header(number).split(" ")[0]
 
-        try:
-            
-            #Asks the user to enter a threshold for E-value. The user can input this value in scientific e notation
-            threshold = input("What is your E-value threshold to indicate a significant match? You can enter this value as a decimal or in scientific e notation, however ensure it is in this format, e: '5e-2'. Typically, a very high similarity between two proteins results in an E-value lower than 1e-50, and related homologues may have an E-value lower than 1.\n").replace(" ","")
+    def sequence(self, number):
+        return self.residues[self.sequence_offsets[number]:self.sequence_offsets[number + 1]].decode()
 
-            threshold = Decimal(threshold)                   #Checks that the user has entered a number
-            if threshold > 0:                                #Checks that the user has entered a number larger than 0
-                if len(df[df.iloc[:,10] <= threshold]) > 0:  #Checks whether any E-values in the blast output are lower than the threshold
-                    
-                    break
-                
-                #If the user has entered a valid threshold that is too low in comparison to the blast output E-values, they are asked to                re-enter one
-                else:
-                    
-                    #Find the lowest E-value present to let the user know about the range of the results
-                    lowest_evalue = df['E-value'].min()
-                    print(f"None of the blast output have an E-value lower than your threshold. The lowest E-value achieved is {lowest_evalue}. Please re-enter a threshold.")
+    #Gives the (header, sequence) records from number start up to number stop
+    def records(self, start=0, stop=None):
+        for number in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield self.header(number), self.sequence(number)
 
-            #If the user has entered a number lower or equal to 0, they have the change to re-enter a number
-            else:
-                print("Your E-value threshold seems to be out of the range, and cannot be lower or equal to 0. Please re-enter a suitable threshold number.")
+    #Gives the residues of the sequences from number start up to number stop as one numpy array of bytes, and the length of each sequence, both read straight from the memory maps without copying
+    def residue_array(self, start=0, stop=None):
+        import numpy as np
 
-        #Checks whether the user has inputted anything besides a number, and the user will be able to re-enter a number
-        except ValueError:
-            
-            print("You did not enter a valid E-value threshold. Please make sure you input a number.")
+        stop = len(self) if stop is None else min(stop, len(self))
+        offsets = np.frombuffer(self.sequence_offsets, dtype=np.uint64)[start:stop + 1].astype(np.int64)
+        if offsets[-1] == offsets[0]:
+            return np.zeros(0, dtype=np.uint8), np.diff(offsets)
 
-        except decimal.InvalidOperation:
+        return np.frombuffer(self.residues, dtype=np.uint8, count=int(offsets[-1] - offsets[0]), offset=int(offsets[0])), np.diff(offsets)
 
-            print("Your input has not been recognized. Please re-enter the number again.") 
 
-    
-    df = df[df.iloc[:,10] <= threshold]                            #Subsets the data to E-values lower than the threshold
-    df.sort_values(df.columns[10], ascending=True, inplace=True)   #Sorts the data in ascending number of E-value
 
-    #Saves the new data frame to a csv file
-    df.to_csv(f"./{query_name}/{motif_chosen}_{new_query}_blast.csv", header=True, index=False)
+#Function to give the files of the sequence store of a fasta file
+def sequence_store_files(fasta_file):
 
-    #Lets the user know the best results from blastp
-    print("The top performing 3 results of the blast with your query are tabulated below (sorted by E-value):")
-    print(df.head(3))
-    print(f"The protein with the lowest E-value from your blast, and thus the most significant match to your query sequence of {new_query} has accession number {df.iloc[0,1]}")
-    print(f"The full list of blast results with an E-value lower than {threshold} can be found in ./{query_name}/{motif_chosen}_{new_query}_blast.out or in csv format in /{query_name}/{motif_chosen}_{new_query}_blast.csv")
+    return [f"{fasta_file}.{file_name}" for file_name in ["seq", "seq.offsets", "headers", "headers.offsets"]]
 
 
 
+#Function to open the sequence store of a fasta file, building it first if it is missing or older than the fasta file. The steps of a query running at the same time never build the same store twice
+def open_sequence_store(fasta_file):
 
+    with sequence_store_lock:
+        if not os.path.exists(f"{fasta_file}.seq") or os.path.getmtime(f"{fasta_file}.seq") < os.path.getmtime(fasta_file):
+            build_sequence_store(fasta_file)
 
-#Looping until the user has ran blast as many times as they desire
-while True:
+    return SequenceStore(fasta_file)
 
-    #The first output to the user before identifying the new query to blast against a database of a chosen motif from the original query
-    motif_assessment_decision = input("Would you like to make a database of a certain motif found in your protein sequence query to subsequently run blastp on a separate query against? This involves running blastp across the same protein family, but with two different taxonomic groups as query (new) and subject (original query: to make database). Please input 'Y' for yes or 'N' for no.\n")
-    
-    if motif_assessment_decision.upper() == 'Y' or motif_assessment_decision.lower() == 'yes':
-        
-        #Checks if motifs have already been identified for the original taxon query
-        if os.path.exists(f"./{query_name}/{query_name}_motifs.txt"):
-            
-            #Asks the user to pick from a list of motifs
-            print("Please pick the motif for which you would like to create a blast database. This database will be constructed using the proteins from your query search containing this motif.\n")
 
-            counter = 1
-            motif_choice_dict = {}
 
-            #Loops through each motif present from the original taxon query
-            for m in motifs_found.keys():     
-                print(str(counter) + ": " + m)   #Enumerates each motif and prints each combination
-                motif_choice_dict[counter] = m   #Saves each combination of number and motif to a dictionary
-                counter += 1
-            
-            #Loops until a valid motif number has been picked by the user
-            while True:
+#Function to give the residues of a list of sequences as one numpy array of upper case bytes, and the length of each sequence, as SequenceStore.residue_array() gives them for the sequences of a store
+def residue_array(sequences):
+    import numpy as np
 
-                #Asks the user to input a number corresponding to a motif
-                motif_choice = input("Input the number corresponding to your chosen motif.\n")
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    return np.frombuffer("".join(sequences).upper().encode(), dtype=np.uint8), lengths
 
-                #Checks that the motif chosen is an integer
-                try:
 
-                    int(motif_choice)
-                
-                #If the motif chosen is not an integer, the user has the chance to re-enter a number
-                except ValueError:
 
-                    print("You have not chosen a valid motif number. Please input a number that corresponds to a motif from your protein query search shown above.")
-                    
-                    #Does not continue on to the remainder of this interation
-                    continue
 
 
-                #Checks if the user has chosen a number corresponding to a motif by checking the dictionary created
-                if int(motif_choice) in motif_choice_dict.keys():
 
-                    #Extracts the motif name corresponding to the chosen number and saves it to chosen_motif
-                    chosen_motif = motif_choice_dict[int(motif_choice)]
-                        
-                    #Runs the motif_assessment() function to make the blast database
-                    motif_assessment(chosen_motif)
-                    
-                    #Runs the new_query() function to blast a new query to the database created
-                    new_query = run_blast(chosen_motif)
 
-                    #Runs the assess_blastp() function to output the results of blastp
-                    assess_blastp(chosen_motif, new_query)
-                        
-                    break
-                    
+####################################################################################################################################
+#Caching the NCBI search results on disk, so the same search is only sent to NCBI once
 
-                #If the user did not pick a valid motif number, they can re-enter a new number
-                else:
-                    print("You have not chosen a valid motif number. Please input a number that corresponds to a motif from your protein query search shown above.")
 
 
-            
-        #If motifs have not yet been identified of the fasta sequences from the original query, the user has the choice to do so now
-        else:
+#Settings of the cache shared by all queries: where it is kept, how long a result is trusted for (in seconds) and the most space it can take up (in bytes)
+cache_directory = os.environ.get("PROTEIN_ANALYSIS_CACHE", os.path.expanduser("~/.cache/protein_analysis"))
+cache_ttl = 7 * 24 * 60 * 60
+cache_max_bytes = 2 * 1024 ** 3
 
-            rerun_decision = input("It appears you have not yet identified motifs from your protein sequence query. Would you like to do that now? Please input 'Y' for yes or 'N' for no.\n")
+#The blast databases built for the motifs are kept in their own part of the cache, under their own size limit, and are evicted a whole database at a time
+blast_database_cache = os.path.join(cache_directory, "blast_databases")
+blast_database_cache_max_bytes = 4 * 1024 ** 3
 
-            #If user has chosen to identify the motifs now, find_motifs() function is run
-            if rerun_decision.upper() == "Y" or rerun_decision.lower() == "yes":
+#The batches of a download still under way are kept in their own part of the cache as well, out of reach of the eviction of cached searches
+fetch_parts_cache = os.path.join(cache_directory, "fetch_parts")
 
-                print("Identifying motifs from your protein query sequences...")
-                find_motifs(sequence_list)
+#Locks held while the cache and the blast databases are evicted, and the size of the cache as last counted plus what this process has saved to it since. None until the cache is first counted
+cache_lock = threading.Lock()
+blast_database_cache_lock = threading.Lock()
+cache_size = None
 
-                continue
 
-            else:
-                print("A motif from your protein sequence query cannot be assessed if motifs have not been identified yet.")
 
-    #Loop will be broken if the user does not choose to find the motifs from the original query
-    else:
+#Function to turn a search into the name of its cache file. Differences in case and spacing do not change the search on NCBI, so they do not change the name either
+def cache_key(*search):
 
-        break
+    normalized_search = "\t".join(" ".join(str(part).lower().split()) for part in search)
+    return hashlib.sha256(normalized_search.encode()).hexdigest()
 
-    
-    #Checks if blastp has already been run
-    if os.path.exists(f"./{query_name}/{chosen_motif}_{new_query}_blast.out"):
 
-        #Asks the user if they want to start the process again
-        again = input("Would you like to run blast again with a different motif or taxon query? Please input 'Y' for yes or 'N' for no.\n")
 
-        if again.upper() == "Y" or again.lower() == "yes":
+#Function to count the cache files, giving the access time, size and path of each. The access time of each file records when it was last used. Files still being written under a temporary name are left out, and files removed by another run or thread while the cache is counted are skipped
+def cache_files():
 
-            #Will continue to the next iteration if the user chooses to blast again
-            pass
+    files_found = []
+    for directory, subdirectories, files in os.walk(cache_directory):
+        subdirectories[:] = [subdirectory for subdirectory in subdirectories if os.path.join(directory, subdirectory) not in (blast_database_cache, fetch_parts_cache)]
+        for file_name in files:
+            if file_name.endswith(".tmp"):
+                continue
 
-        else:
+            try:
+                file_stat = os.stat(os.path.join(directory, file_name))
+            except FileNotFoundError:
+                continue
 
-            #Breaks the loop if the user chooses not to blast again
-            break
+            files_found.append((file_stat.st_atime, file_stat.st_size, os.path.join(directory, file_name)))
 
+    return files_found
 
 
 
+#Function to add the bytes of a newly saved cache file to the size of the cache, and only when that goes over cache_max_bytes, to count the cache again and remove the least recently used files until it fits. The cache is counted once when first written to, rather than on every write, and other runs writing to the same cache are caught up with whenever it is counted again
+def evict_cache(added_bytes=0):
+    global cache_size
 
-#################################################################################################################################
-#Plotting the transmembrane segments of the user's original protein and taxon query
+    with cache_lock:
+        if cache_size is None:
+            cache_size = sum(size for access_time, size, path in cache_files())
+        else:
+            cache_size += added_bytes
+
+        if cache_size <= cache_max_bytes:
+            return
 
+        files_found = cache_files()
+        cache_size = sum(size for access_time, size, path in files_found)
 
+        for access_time, size, path in sorted(files_found):
+            if cache_size <= cache_max_bytes:
+                break
 
-#Checks whether the query sequences have been aligned yet
-if os.path.exists(f"./{query_name}/{query_name}_aligned.pro.fa"):
+            #Another run may have removed or replaced the file already, in which case it no longer counts either way
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
 
+            cache_size -= size
 
-    #Asks the user if they want to identify transmembrane segments of their query
-    tmap_decision = input("Would you like to predict whether there are transmembrane segments in the proteins of your query? Please input 'Y' for yes or 'N' for no.\n")
 
-    if tmap_decision.upper() == "Y" or tmap_decision.lower() == "yes":
 
-        #Generates a plot showing transmembrane regions. Plot will be blank if no transmembrane regions are present
-        subprocess.call(f"tmap -sequence ./{query_name}/{query_name}_aligned.pro.fa -sformat fasta -graph png -outfile ./{query_name}/{query_name}_tmap.res -goutfile ./{query_name}/{query_name}_tmap_plot", shell=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+#Function to fill output_file with the result of a search, either copied from the cache when the same search was saved less than cache_ttl seconds ago, or made by create_file(output_file) and then saved to the cache. Every search names the E-utilities endpoint it is sent to, so results from a local stand-in never answer a search of NCBI
+def cached_file(search, output_file, create_file):
 
-        os.rename(f"./{query_name}/{query_name}_tmap_plot.1.png", f"./{query_name}/{query_name}_tmap_plot.png")
+    key = cache_key(*search)
+    cache_file = os.path.join(cache_directory, key[:2], key)
 
-        print(f"Your transmembrane segment plot is saved in ./{query_name}/{query_name}_tmap.png\nOpening this plot in a separate window...")
+    #The cache file can be evicted by another run or thread at any moment, in which case the search is made again
+    try:
+        if time.time() - os.path.getmtime(cache_file) < cache_ttl:
 
-        #Displays the plot in a separate window
-        subprocess.call(f"eog ./{query_name}/{query_name}_tmap_plot.png", shell=True)
+            #Marking the file as just used, while its modification time still records when it was saved
+            os.utime(cache_file, (time.time(), os.path.getmtime(cache_file)))
+            shutil.copyfile(cache_file, output_file)
+            return
+    except FileNotFoundError:
+        pass
 
-    else:
+    create_file(output_file)
 
-        print("It seems you have decided not to predict transmembrane segments in your protein query.")
+    #Empty results are not saved, as they can also come from a failed fetch, and neither are results so big they would push most of the cache out
+    if os.path.getsize(output_file) == 0 or os.path.getsize(output_file) > cache_max_bytes // 4:
+        return
 
-else:
+    #The result is copied in under a temporary name first so other runs and threads never see a half-written cache file
+    temporary_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    shutil.copyfile(output_file, temporary_file)
+    os.replace(temporary_file, cache_file)
+
+    evict_cache(os.path.getsize(output_file))
+
+
+
+#Function to remove the least recently used blast databases until they fit within blast_database_cache_max_bytes. The modification time of each database directory records when it was last used. Databases still being built under a temporary name are left out, and databases removed by another run while they are counted are skipped
+def evict_blast_databases():
+
+    with blast_database_cache_lock:
+        databases = []
+        for entry in os.scandir(blast_database_cache):
+            if entry.name.endswith(".tmp"):
+                continue
+
+            try:
+                if entry.is_dir():
+                    size = sum(database_file.stat().st_size for database_file in os.scandir(entry.path))
+                    databases.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:
+                continue
+
+        databases_size = sum(size for modified_time, size, path in databases)
+
+        for modified_time, size, path in sorted(databases):
+            if databases_size <= blast_database_cache_max_bytes:
+                break
+
+            shutil.rmtree(path, ignore_errors=True)
+            databases_size -= size
+
+
+
+#Function to copy the blast database saved under key into output_directory, first building it with create_database(directory) into a new cache entry if there is none. Databases do not expire: the key already changes whenever the sequences in them do
+def cached_blast_database(key, output_directory, create_database):
+
+    database_directory = os.path.join(blast_database_cache, key)
+
+    if not os.path.isdir(database_directory):
+        temporary_directory = f"{database_directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(temporary_directory)
+        create_database(temporary_directory)
+
+        #Nothing is saved if the database could not be built
+        if os.listdir(temporary_directory) == []:
+            os.rmdir(temporary_directory)
+            return
+
+        #Another run may have saved the same database in the meantime, in which case its copy is kept
+        try:
+            os.rename(temporary_directory, database_directory)
+        except OSError:
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+
+        evict_blast_databases()
+
+    else:
+        print("Reusing the blast database already built from the same sequences...")
+
+    #Marking the database as just used, under the eviction lock, so it is the last database another thread would evict while it is copied
+    with blast_database_cache_lock:
+        os.utime(database_directory)
+    os.makedirs(output_directory, exist_ok=True)
+    for database_file in os.scandir(database_directory):
+        shutil.copyfile(database_file.path, os.path.join(output_directory, database_file.name))
+
+
+
+####################################################################################################################################
+#Resolving taxonomic groups offline from a local copy of the NCBI taxonomy (taxdump)
+
+
+
+#Directory holding names.dmp and nodes.dmp from NCBI's taxdump. The index built from them is saved in an 'index' subdirectory
+taxdump_directory = os.environ.get("PROTEIN_ANALYSIS_TAXDUMP", "./taxdump")
+
+#Lock held while the taxonomy index is checked and built
+taxonomy_index_lock = threading.Lock()
+
+#Priority of each kind of name when the same name belongs to several taxa: scientific names win over synonyms and common names
+taxonomy_name_priority = {"scientific name": 0, "equivalent name": 1, "synonym": 2, "genbank common name": 3, "common name": 4}
+
+
+
+#Function to build the taxonomy index from names.dmp and nodes.dmp. The index is made of flat binary arrays that are memory-mapped when read, rather than loaded:
+#  names.txt          sorted lines of 'normalized name<TAB>taxid', with name_offsets.bin giving where each line starts, for binary search
+#  parents.bin        the parent taxid of each taxid
+#  child_offsets.bin  where the children of each taxid start in children.bin, so descendants can be found without NCBI
+def build_taxonomy_index(taxdump_path=None):
+
+    taxdump_path = taxdump_path or taxdump_directory
+    index_path = f"{taxdump_path}/index"
+    os.makedirs(index_path, exist_ok=True)
+
+    #Reading the parent of each taxon from nodes.dmp, where fields are separated by '\t|\t'
+    parent_of = {}
+    with open(f"{taxdump_path}/nodes.dmp") as nodes:
+        for line in nodes:
+            fields = line.split("\t|\t")
+            parent_of[int(fields[0])] = int(fields[1])
+
+    highest_taxid = max(parent_of)
+    parents = array.array("I", bytes(4 * (highest_taxid + 1)))
+    child_counts = array.array("I", bytes(4 * (highest_taxid + 2)))
+
+    for taxid, parent in parent_of.items():
+        parents[taxid] = parent
+
+        #The root (taxid 1) is its own parent in nodes.dmp, so it is not counted as its own child
+        if taxid != parent:
+            child_counts[parent + 1] += 1
+
+    #Turning the number of children of each taxid into the offset of its first child
+    for taxid in range(1, highest_taxid + 2):
+        child_counts[taxid] += child_counts[taxid - 1]
+
+    children = array.array("I", bytes(4 * child_counts[-1]))
+    next_child = array.array("I", child_counts)
+    for taxid, parent in parent_of.items():
+        if taxid != parent:
+            children[next_child[parent]] = taxid
+            next_child[parent] += 1
+
+    #Reading the names of each taxon, keeping the highest priority taxon for names shared by several taxa
+    best_taxon = {}
+    with open(f"{taxdump_path}/names.dmp") as names:
+        for line in names:
+            fields = line.rstrip("\t|\n").split("\t|\t")
+            priority = taxonomy_name_priority.get(fields[3], len(taxonomy_name_priority))
+            name = " ".join(fields[1].lower().split())
+
+            if name not in best_taxon or priority < best_taxon[name][0]:
+                best_taxon[name] = (priority, int(fields[0]))
+
+    #Every file is written under a temporary name first and only replaces the old index once all of them are complete, so a half-written file is never mapped
+    name_offsets = array.array("Q")
+    with open(f"{index_path}/names.txt.tmp", "wb") as names_output:
+        for name in sorted(best_taxon, key=lambda name: name.encode()):
+            name_offsets.append(names_output.tell())
+            names_output.write(f"{name}\t{best_taxon[name][1]}\n".encode())
+
+    for file_name, values in [("name_offsets.bin", name_offsets), ("parents.bin", parents), ("child_offsets.bin", child_counts), ("children.bin", children)]:
+        with open(f"{index_path}/{file_name}.tmp", "wb") as index_output:
+            values.tofile(index_output)
+
+    for file_name in ["name_offsets.bin", "parents.bin", "child_offsets.bin", "children.bin", "names.txt"]:
+        os.replace(f"{index_path}/{file_name}.tmp", f"{index_path}/{file_name}")
+
+
+
+#Class to answer taxonomy lookups from the memory-mapped index, so opening it costs nothing and only the pages that are used are read from disk
+class TaxonomyIndex:
+
+    def __init__(self, taxdump_path=None):
+        index_path = f"{taxdump_path or taxdump_directory}/index"
+
+        self.names = map_file(f"{index_path}/names.txt")
+        self.name_offsets = memoryview(map_file(f"{index_path}/name_offsets.bin")).cast("Q")
+        self.parents = memoryview(map_file(f"{index_path}/parents.bin")).cast("I")
+        self.child_offsets = memoryview(map_file(f"{index_path}/child_offsets.bin")).cast("I")
+        self.children = memoryview(map_file(f"{index_path}/children.bin")).cast("I")
+
+    #Gives the normalized name stored at one position of the sorted name list
+    def name_at(self, position):
+        start = self.name_offsets[position]
+        return self.names[start:self.names.find(b"\t", start)]
+
+    #Gives the taxid of a taxon name, or None if the name is not in the taxonomy
+    def taxid(self, name):
+        name = " ".join(name.lower().split()).encode()
+
+        position = bisect.bisect_left(range(len(self.name_offsets)), name, key=self.name_at)
+        if position == len(self.name_offsets) or self.name_at(position) != name:
+            return None
+
+        start = self.name_offsets[position] + len(name) + 1
+        return int(self.names[start:self.names.find(b"\n", start)])
+
+    #Gives the taxids from a taxon up to the root of the taxonomy
+    def lineage(self, taxid):
+        taxids = [taxid]
+        while taxid < len(self.parents) and self.parents[taxid] not in (0, taxid):
+            taxid = self.parents[taxid]
+            taxids.append(taxid)
+        return taxids
+
+    #Gives the taxids of every taxon below a taxon
+    def descendants(self, taxid):
+        found = []
+        to_visit = [taxid]
+        while len(to_visit) != 0:
+            taxid = to_visit.pop()
+            if taxid + 1 < len(self.child_offsets):
+                children = self.children[self.child_offsets[taxid]:self.child_offsets[taxid + 1]]
+                found.extend(children)
+                to_visit.extend(children)
+        return found
+
+
+
+#Function to open the taxonomy index of the local taxdump, building it first if it is missing or older than the dmp files. Gives None when there is no local taxdump. The index is checked and built under a lock, so the queries of a batch resolving their taxa at the same time only build it once
+@functools.lru_cache(maxsize=None)
+def open_taxonomy_index(taxdump_path=None):
+
+    taxdump_path = taxdump_path or taxdump_directory
+    if not (os.path.exists(f"{taxdump_path}/names.dmp") and os.path.exists(f"{taxdump_path}/nodes.dmp")):
+        return None
+
+    with taxonomy_index_lock:
+        index_files = [f"{taxdump_path}/index/{file_name}" for file_name in ["names.txt", "name_offsets.bin", "parents.bin", "child_offsets.bin", "children.bin"]]
+        newest_dump = max(os.path.getmtime(f"{taxdump_path}/names.dmp"), os.path.getmtime(f"{taxdump_path}/nodes.dmp"))
+
+        if not all(os.path.exists(index_file) and os.path.getmtime(index_file) >= newest_dump for index_file in index_files):
+            print("Building the local taxonomy index from the NCBI taxdump. This is only done once...")
+            build_taxonomy_index(taxdump_path)
+
+        return TaxonomyIndex(taxdump_path)
+
+
+
+#Function to find the taxid of a taxonomic group, from the local taxonomy index when there is one and otherwise from NCBI taxonomy database. Gives the taxid as text, or an empty string if it could not be found
+def resolve_taxon(taxonomic_group):
+
+    taxonomy_index = open_taxonomy_index()
+    if taxonomy_index is not None:
+        taxid = taxonomy_index.taxid(taxonomic_group)
+        return "" if taxid is None else str(taxid)
+
+    #Several matching taxa give several IDs, one per line, which is not a valid taxid
+    result = ElementTree.fromstring(eutils_request("esearch", {"db": "taxonomy", "term": taxonomic_group}))
+    return "\n".join(id_element.text for id_element in result.iter("Id"))
+
+
+
+####################################################################################################################################
+#Sharing the CPUs available to this script between the external programs it runs
+
+
+
+#Function to find the number of CPUs this script may use: the CPUs it is allowed to run on, further limited by any CPU quota of its container (cgroup). PROTEIN_ANALYSIS_CPUS sets the number directly, e.g. to leave room for other users of a shared machine
+def available_cpus():
+
+    if os.environ.get("PROTEIN_ANALYSIS_CPUS", "").isnumeric():
+        return max(1, int(os.environ["PROTEIN_ANALYSIS_CPUS"]))
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+    #The quota is given as the CPU time allowed per period, in '/sys/fs/cgroup/cpu.max' for cgroup v2 and in two separate files for cgroup v1. A quota of 'max' or -1 means no limit
+    quota, period = None, None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as quota_file, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as period_file:
+                quota, period = quota_file.read().strip(), period_file.read().strip()
+        except OSError:
+            pass
+
+    if quota is not None and quota.isnumeric() and int(period) > 0:
+        cpus = min(cpus, max(1, int(quota) // int(period)))
+
+    return cpus
+
+
+
+#Class handing out CPU threads to the external programs, so that all the programs running at the same time never use more threads than there are CPUs. A program waits until at least one thread is free, and is then given as many of the threads it asked for as are free, so no CPU is left idle while a program is waiting
+class CpuBudget:
+
+    def __init__(self, total):
+        self.total = total
+        self.free = total
+
+        #Number of threads asked for by programs that can use several, lowered when several queries run at the same time so they share the CPUs
+        self.share = total
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def threads(self, wanted=None):
+        wanted = max(1, min(wanted or self.share, self.total))
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.free >= 1)
+            granted = min(wanted, self.free)
+            self.free -= granted
+
+        try:
+            yield granted
+
+        finally:
+            with self.condition:
+                self.free += granted
+                self.condition.notify_all()
+
+
+cpu_budget = CpuBudget(available_cpus())
+
+
+
+
+
+
+####################################################################################################################################
+#Recording the stages completed for each query, so a stage is skipped when its inputs and settings have not changed since it last ran
+
+
+
+#One lock per query, so that stages of the same query finishing at the same time do not overwrite each other's records
+stage_locks = {}
+
+
+
+#Function to read the record of completed stages of a query: the hash of the inputs and settings of each completed stage, and the digest of each input file read so far
+def read_stage_records(query):
+
+    if not os.path.exists(f"./{query}/{query}_stages.json"):
+        return {"stages": {}, "files": {}}
+
+    with open(f"./{query}/{query}_stages.json") as record_file:
+        return json.load(record_file)
+
+
+
+#Function to save the record of completed stages of a query, under a temporary name first so an interrupted run never leaves half a record
+def write_stage_records(query, records):
+
+    with open(f"./{query}/{query}_stages.json.tmp", "w") as record_file:
+        json.dump(records, record_file, indent=1)
+
+    os.replace(f"./{query}/{query}_stages.json.tmp", f"./{query}/{query}_stages.json")
+
+
+
+#Function to give the SHA-256 digest of the contents of a file. Each digest is remembered along with the size and modification time of the file, so a file is only read again once it has changed
+def file_digest(records, path):
+
+    file_stat = os.stat(path)
+    stamp = [file_stat.st_size, file_stat.st_mtime_ns]
+
+    if path in records["files"] and records["files"][path][:2] == stamp:
+        return records["files"][path][2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for block in iter(lambda: input_file.read(1024 * 1024), b""):
+            digest.update(block)
+
+    records["files"][path] = stamp + [digest.hexdigest()]
+    return digest.hexdigest()
+
+
+
+#Function to run one stage of the analysis of a query, unless it has already been run on the same input file contents and settings and all of its output files are still there. A stage that fails is not recorded, so running the query again resumes from it. Gives True if the stage was run
+def run_stage(query, name, inputs, settings, outputs, action):
+
+    lock = stage_locks.setdefault(query, threading.Lock())
+
+    with lock:
+        records = read_stage_records(query)
+
+        #The hash covers the stage name, its settings and the contents of every input file
+        stage_hash = hashlib.sha256((name + json.dumps(settings, sort_keys=True, default=str)).encode())
+        for path in inputs:
+            stage_hash.update((path + (file_digest(records, path) if os.path.exists(path) else "missing")).encode())
+        stage_hash = stage_hash.hexdigest()
+
+        write_stage_records(query, records)
+
+        if records["stages"].get(name) == stage_hash and all(os.path.exists(path) for path in outputs):
+            print(f"Skipping {name}: its inputs and settings have not changed since it last ran.")
+            return False
+
+    with traced(name, "stage", query=query):
+        action()
+
+    with lock:
+        records = read_stage_records(query)
+        records["stages"][name] = stage_hash
+        write_stage_records(query, records)
+
+    return True
+
+
+
+
+
+
+####################################################################################################################################
+#Saving the results of every query to one SQLite database, so results can be looked up across queries without reading their files again
+
+
+
+#Path of the results database shared by all queries. The stages write their results to it as well as to their files
+results_database = os.environ.get("PROTEIN_ANALYSIS_RESULTS", "./protein_analysis_results.sqlite")
+
+#Number of rows sent to SQLite in each executemany call, so results of any size are written without holding them all in memory
+results_batch_size = 10000
+
+#Tables of the results database, with indexes on the columns the results are looked up by
+results_schema = """
+CREATE TABLE IF NOT EXISTS sequences (query TEXT, accession TEXT, header TEXT, taxon TEXT, length INTEGER, sequence TEXT, PRIMARY KEY (query, accession));
+CREATE TABLE IF NOT EXISTS motif_hits (query TEXT, accession TEXT, motif TEXT, start INTEGER, end INTEGER, score REAL);
+CREATE TABLE IF NOT EXISTS blast_hits (query TEXT, motif TEXT, blast_query TEXT, query_accession TEXT, subject_accession TEXT, identity REAL, alignment_length INTEGER, mismatches INTEGER, gap_opens INTEGER, query_start INTEGER, query_end INTEGER, subject_start INTEGER, subject_end INTEGER, evalue REAL, bit_score REAL);
+CREATE TABLE IF NOT EXISTS tm_segments (query TEXT, accession TEXT, start INTEGER, end INTEGER, score REAL);
+CREATE INDEX IF NOT EXISTS sequences_accession ON sequences (accession);
+CREATE INDEX IF NOT EXISTS sequences_taxon ON sequences (taxon);
+CREATE INDEX IF NOT EXISTS motif_hits_motif ON motif_hits (motif, accession);
+CREATE INDEX IF NOT EXISTS motif_hits_query ON motif_hits (query, motif);
+CREATE INDEX IF NOT EXISTS motif_hits_accession ON motif_hits (accession);
+CREATE INDEX IF NOT EXISTS blast_hits_query ON blast_hits (query, motif, blast_query, evalue);
+CREATE INDEX IF NOT EXISTS blast_hits_subject ON blast_hits (subject_accession);
+CREATE INDEX IF NOT EXISTS blast_hits_query_accession ON blast_hits (query_accession);
+CREATE INDEX IF NOT EXISTS tm_segments_query ON tm_segments (query, accession);
+"""
+
+#Only one thread writes to the results database at a time; SQLite would otherwise make the others fail while it is locked
+results_lock = threading.Lock()
+
+
+
+#Function to open the results database, creating its tables if needed. Changes are committed when the 'with' block ends without an error
+@contextlib.contextmanager
+def results_store():
+
+    connection = sqlite3.connect(results_database, timeout=60)
+    try:
+        connection.executescript(results_schema)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+
+#Function to replace the rows of one table for a query (and, for example, a motif) by new rows, in one transaction, sending them results_batch_size at a time. 'rows' can be any iterable, so a stage can hand its results over as it reads them
+def store_results(table, key, rows):
+
+    conditions = " AND ".join(f"{column} = ?" for column in key)
+
+    with results_lock, results_store() as connection:
+        connection.execute(f"DELETE FROM {table} WHERE {conditions}", list(key.values()))
+
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, results_batch_size))
+            if batch == []:
+                break
+            connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(batch[0]))})", batch)
+
+
+
+#Function to find the taxon in an NCBI protein header, given at its end in square brackets
+def header_taxon(header):
+
+    return header[header.rfind("[") + 1:-1] if header.endswith("]") and "[" in header else ""
+
+
+
+#Functions to save the results of each stage of a query to the results database
+def store_sequences(query, fasta_file):
+
+    store_results("sequences", {"query": query}, ((query, header.split(" ")[0], header, header_taxon(header), len(sequence), sequence) for header, sequence in read_fasta(fasta_file)))
+
+
+def store_motif_hits(query, index_file):
+
+    def hits():
+        with open(index_file) as index_input:
+            for line in index_input:
+                if not line.startswith("#"):
+                    accession, motif_name, start, end, score = line.rstrip("\n").split("\t")
+                    yield query, accession, motif_name, int(start), int(end), float(score)
+
+    store_results("motif_hits", {"query": query}, hits())
+
+
+def store_blast_hits(query, motif_chosen, new_query, blast_file):
+
+    store_results("blast_hits", {"query": query, "motif": motif_chosen, "blast_query": new_query}, ((query, motif_chosen, new_query) + hit for hit in read_blast_hits(blast_file)))
+
+
+def store_tm_segments(query, segments):
+
+    store_results("tm_segments", {"query": query}, ((query,) + segment for segment in segments))
+
+
+
+#Function to write the fasta records of a query carrying a motif from the results database to members_file, in the order they were fetched, one row at a time. Gives the number of records written, or None if the sequences or motif hits of the query are not in the database
+def stored_motif_members(query, motif_chosen, members_file):
+
+    with results_store() as connection:
+        if connection.execute("SELECT 1 FROM sequences WHERE query = ? LIMIT 1", (query,)).fetchone() is None or connection.execute("SELECT 1 FROM motif_hits WHERE query = ? LIMIT 1", (query,)).fetchone() is None:
+            return None
+
+        member_count = 0
+        with open(members_file, "w") as members_output:
+            for header, sequence in connection.execute("SELECT header, sequence FROM sequences WHERE query = ? AND accession IN (SELECT accession FROM motif_hits WHERE query = ? AND motif = ?) ORDER BY rowid", (query, query, motif_chosen)):
+                members_output.write(f">{header}\n{sequence}\n")
+                member_count += 1
+
+        return member_count
+
+
+
+#Function to find every sequence carrying a motif across all the queries in the results database, as (accession, taxon, query) rows. The database is only read, so it is opened read-only and is neither created nor given its tables when it has no results yet
+def motif_carriers(motif_name):
+
+    if not os.path.exists(results_database):
+        return []
+
+    connection = sqlite3.connect(f"file:{urllib.request.pathname2url(os.path.abspath(results_database))}?mode=ro", uri=True, timeout=60)
+    try:
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'motif_hits'").fetchone() is None:
+            return []
+
+        return connection.execute("SELECT DISTINCT motif_hits.accession, sequences.taxon, motif_hits.query FROM motif_hits LEFT JOIN sequences ON sequences.query = motif_hits.query AND sequences.accession = motif_hits.accession WHERE motif_hits.motif = ? ORDER BY sequences.taxon, motif_hits.accession", (motif_name.upper(),)).fetchall()
+    finally:
+        connection.close()
+
+
+
+
+
+
+
+####################################################################################################################################
+#Measuring the features of each sequence, and dropping the sequences that do not pass the chosen filters
+
+
+
+#Filters the fetched sequences must pass to be kept, each written as '<feature> <operator> <value>', e.g. 'length >= 50', 'ambiguity <= 0.05' or 'C < 0.1' for the fraction of cysteines. The operators are <, <=, >, >=, == and !=, and for 'header' also ~ and !~, matching a regular expression, e.g. 'header !~ associated|unknown|unnamed'. By default every sequence is kept
+sequence_filters = []
+
+#The 20 standard amino acids, and the average mass of each once in a peptide chain (the mass of the amino acid less a water)
+amino_acids = "ACDEFGHIKLMNPQRSTVWY"
+residue_masses = {"A": 71.0788, "C": 103.1388, "D": 115.0886, "E": 129.1155, "F": 147.1766, "G": 57.0519, "H": 137.1411, "I": 113.1594, "K": 128.1741, "L": 113.1594, "M": 131.1926, "N": 114.1038, "P": 97.1167, "Q": 128.1307, "R": 156.1875, "S": 87.0782, "T": 101.1051, "V": 99.1326, "W": 186.2132, "Y": 163.1760}
+
+#Kyte-Doolittle hydropathy of each amino acid
+kyte_doolittle = {"A": 1.8, "C": 2.5, "D": -3.5, "E": -3.5, "F": 2.8, "G": -0.4, "H": -3.2, "I": 4.5, "K": -3.9, "L": 3.8, "M": 1.9, "N": -3.5, "P": -1.6, "Q": -3.5, "R": -4.5, "S": -0.8, "T": -0.7, "V": 4.2, "W": -0.9, "Y": -1.3}
+
+#pKa of the ends of the chain and of the charged side chains, as used by EMBOSS iep, and the letters standing for ambiguous residues
+positive_pka = {"N_terminus": 8.6, "H": 6.5, "K": 10.8, "R": 12.5}
+negative_pka = {"C_terminus": 3.6, "C": 8.5, "D": 3.9, "E": 4.1, "Y": 10.1}
+ambiguous_residues = "BJXZ"
+
+#Number of sequences measured at a time
+feature_chunk_size = 50000
+
+#Names of the features measured for each sequence, in the order of the feature table. The amino acid letters are the fraction of the sequence made of each
+feature_names = ["length", "molecular_weight", "pi", "ambiguity", "gravy"] + list(amino_acids)
+
+
+
+#Function to measure the features of many sequences at once: the residues of every sequence are counted in one pass over all of them, and each feature is then worked out from the counts for all the sequences together. The sequences are either a list, or the residues and lengths of some sequences of a sequence store, as given by SequenceStore.residue_array(). Gives a dictionary of one numpy array per feature
+def sequence_features(sequences):
+    import numpy as np
+
+    residues, lengths = residue_array(sequences) if isinstance(sequences, list) else sequences
+    sequence_count = len(lengths)
+    residues = residues.astype(np.int64)
+    sequence_numbers = np.repeat(np.arange(sequence_count), lengths)
+
+    #Counts of each byte in each sequence, one row per sequence
+    counts = np.bincount(sequence_numbers * 256 + residues, minlength=sequence_count * 256).reshape(sequence_count, 256).astype(float)
+    column = lambda letters: [ord(letter) for letter in letters]
+    standard_counts = counts[:, column(amino_acids)]
+    standard_lengths = np.maximum(standard_counts.sum(axis=1), 1)
+
+    features = {"length": lengths}
+    features["molecular_weight"] = standard_counts @ np.array([residue_masses[letter] for letter in amino_acids]) + 18.01528 * (lengths > 0)
+    features["ambiguity"] = counts[:, column(ambiguous_residues)].sum(axis=1) / np.maximum(lengths, 1)
+    features["gravy"] = standard_counts @ np.array([kyte_doolittle[letter] for letter in amino_acids]) / standard_lengths
+
+    #The isoelectric point is the pH where the charge of the sequence is 0. The charge falls as the pH rises, so the pH of every sequence is found together by halving the range it lies in, 30 times
+    positive_counts = np.column_stack([np.ones(sequence_count)] + [counts[:, ord(letter)] for letter in list(positive_pka)[1:]])
+    negative_counts = np.column_stack([np.ones(sequence_count)] + [counts[:, ord(letter)] for letter in list(negative_pka)[1:]])
+    low, high = np.zeros(sequence_count), np.full(sequence_count, 14.0)
+
+    for halving in range(30):
+        ph = (low + high) / 2
+        charge = (positive_counts / (1 + 10 ** (ph[:, None] - np.array(list(positive_pka.values()))))).sum(axis=1) - (negative_counts / (1 + 10 ** (np.array(list(negative_pka.values())) - ph[:, None]))).sum(axis=1)
+        low = np.where(charge > 0, ph, low)
+        high = np.where(charge > 0, high, ph)
+
+    features["pi"] = (low + high) / 2
+
+    for letter, amino_acid_counts in zip(amino_acids, standard_counts.T):
+        features[letter] = amino_acid_counts / np.maximum(lengths, 1)
+
+    return features
+
+
+
+#Function to turn a filter written as '<feature> <operator> <value>' into its three parts, checking that the feature and operator exist
+def parse_sequence_filter(sequence_filter):
+
+    match = re.fullmatch(r"\s*(\w+)\s*(<=|>=|==|!=|!~|<|>|~)\s*(.*?)\s*", sequence_filter)
+    if match is None:
+        raise ValueError(f"The filter '{sequence_filter}' is not written as '<feature> <operator> <value>'.")
+
+    name, operator, value = match.groups()
+    if name != "header" and name not in feature_names:
+        raise ValueError(f"The filter '{sequence_filter}' uses an unknown feature. The features are: header, {', '.join(feature_names)}.")
+    if (name == "header") != (operator in ("~", "!~")) and operator not in ("==", "!="):
+        raise ValueError(f"The filter '{sequence_filter}' uses an operator that does not apply to {name}.")
+
+    if operator in ("~", "!~"):
+        try:
+            re.compile(value)
+        except re.error as error:
+            raise ValueError(f"The filter '{sequence_filter}' has an invalid regular expression: {error}.")
+
+    if name == "header":
+        return name, operator, value
+
+    try:
+        return name, operator, float(value)
+    except ValueError:
+        raise ValueError(f"The filter '{sequence_filter}' compares {name} with '{value}', which is not a number.")
+
+
+
+#Function to find which sequences pass every filter, as a numpy array of True or False for each sequence
+def filter_sequences(features, headers, filters):
+    import numpy as np
+
+    comparisons = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal, "==": np.equal, "!=": np.not_equal}
+    keep = np.ones(len(headers), dtype=bool)
+
+    for name, operator, value in map(parse_sequence_filter, filters):
+        if name != "header":
+            keep &= comparisons[operator](features[name], value)
+
+        elif operator in ("~", "!~"):
+            pattern = re.compile(value)
+            keep &= np.array([(pattern.search(header) is not None) == (operator == "~") for header in headers], dtype=bool)
+
+        else:
+            keep &= np.array([(header == value) == (operator == "==") for header in headers], dtype=bool)
+
+    return keep
+
+
+
+#Function to save the feature table of the fetched sequences of a query, and to remove the sequences failing sequence_filters from the fasta file, keeping them in ./{query}/{query}_removed.pro.fa. The sequences are measured feature_chunk_size at a time straight from the sequence store of the fasta file, so any number of them can be filtered in bounded memory
+@traced_calls("parse")
+def measure_sequences(query, fasta_file, filters=None):
+
+    filters = sequence_filters if filters is None else filters
+    kept_count, removed_count = 0, 0
+
+    with open(f"./{query}/{query}_features.tsv", "w", newline="") as feature_file, open(f"{fasta_file}.tmp", "w") as kept_output, open(f"./{query}/{query}_removed.pro.fa", "w") as removed_output:
+        writer = csv.writer(feature_file, delimiter="\t", lineterminator="\n")
+        writer.writerow(["accession"] + feature_names + ["kept"])
+
+        store = open_sequence_store(fasta_file)
+        for start in range(0, len(store), feature_chunk_size):
+            records = list(store.records(start, start + feature_chunk_size))
+            features = sequence_features(store.residue_array(start, start + feature_chunk_size))
+            keep = filter_sequences(features, [header for header, sequence in records], filters)
+
+            for number, (header, sequence) in enumerate(records):
+                writer.writerow([header.split(" ")[0]] + [f"{features[name][number]:.6g}" for name in feature_names] + ["Y" if keep[number] else "N"])
+                (kept_output if keep[number] else removed_output).write(f">{header}\n{sequence}\n")
+
+            kept_count += int(keep.sum())
+            removed_count += len(records) - int(keep.sum())
+
+    #The fasta file is only replaced when some sequences were removed
+    if removed_count == 0:
+        os.remove(f"{fasta_file}.tmp")
+        os.remove(f"./{query}/{query}_removed.pro.fa")
+        return kept_count
+
+    os.replace(f"{fasta_file}.tmp", fasta_file)
+    print(f"{removed_count} of the {kept_count + removed_count} sequences did not pass your filters and were moved to ./{query}/{query}_removed.pro.fa")
+
+    return kept_count
+
+
+
+
+
+
+
+####################################################################################################################################
+#Searching the user's protein and taxon query on NCBI protein database
+
+
+
+#Function to count the sequences of a fasta file, skipping those with ambiguous headers
+def count_sequences(fasta_file):
+
+    #Streaming through the file and counting the sequences
+    sequence_count = 0
+    for header, sequence in read_fasta(fasta_file):
+
+        #Ignores the fasta entries if any of these words are present in the header
+        if "associated" in header or "unknown" in header or "unnamed" in header:
+            continue
+
+        sequence_count += 1
+
+    #The output of the function is the number of search results kept after filtering
+    return sequence_count
+
+
+
+#Function to retrieve the main query fasta sequences from NCBI protin database
+def retrieve_fasta(query, NCBI_query):
+    
+    #Searching NCBI and downloading the fasta sequences of the first max_results results (or all of them) in batches, unless this search has been run recently and is in the cache
+    cached_file(("fasta", eutils_base_url, "protein", NCBI_query, max_results), f"./{query}/{query}.pro.fa", lambda output_file: fetch_fasta(NCBI_query, output_file, limit=max_results))
+
+    return count_sequences(f"./{query}/{query}.pro.fa")
+
+
+
+#Function to search NCBI for a protein family within a taxonomic group, including partial sequences or not, and save the results to ./{query}/{query}.pro.fa. If there are no results, the search is run again one more time without keeping results as specific by removing [PROT]
+def search_query(query, protein_family, taxonomic_group, include_partial):
+
+    #'NOT PARTIAL' is added to the search when partial sequences are not wanted
+    not_partial = "" if include_partial else " NOT PARTIAL"
+
+    def search():
+        if retrieve_fasta(query, f"{protein_family}[PROT] AND {taxonomic_group}[ORGN]{not_partial}") == 0:
+            retrieve_fasta(query, f"{protein_family} AND {taxonomic_group}[ORGN]{not_partial}")
+
+        #Measuring the features of the sequences and dropping those failing the filters, before anything else uses them
+        measure_sequences(query, f"./{query}/{query}.pro.fa")
+
+        #Indexing the sequences by accession number as soon as they are saved, for the motif subsets of the blast databases, and packing the kept sequences into the store read by the later stages
+        index_fasta(f"./{query}/{query}.pro.fa")
+        open_sequence_store(f"./{query}/{query}.pro.fa")
+        store_sequences(query, f"./{query}/{query}.pro.fa")
+
+    #The search is only sent again when it has changed since the results were last saved for this query
+    run_stage(query, "fetch", [], {"protein_family": protein_family, "taxonomic_group": taxonomic_group, "include_partial": include_partial, "max_results": max_results, "filters": sequence_filters}, [f"./{query}/{query}.pro.fa", f"./{query}/{query}.pro.fa.idx", f"./{query}/{query}.pro.fa.idx.bin", f"./{query}/{query}_features.tsv"] + sequence_store_files(f"./{query}/{query}.pro.fa"), search)
+
+    return count_sequences(f"./{query}/{query}.pro.fa")
+
+
+
+
+
+
+
+##############################################################################################################################
+#Removing redundant sequences before the alignment
+
+
+
+#Identity at or above which sequences are clustered together so only one of them is aligned, e.g. 0.95. None aligns every sequence
+redundancy_identity = None
+
+
+
+#Function to choose the k-mer length for an identity threshold, as cd-hit does: long words are only shared often enough by very similar sequences, so lower thresholds need shorter words
+def kmer_length(identity):
+
+    for lowest_identity, length in ((0.7, 5), (0.6, 4), (0.5, 3)):
+        if identity >= lowest_identity:
+            return length
+
+    return 2
+
+
+
+#Function to cluster the sequences of a sequence store greedily, longest first: identical sequences are found by their hash, and each other sequence joins the first representative whose k-mers it shares enough of, or becomes a representative itself. The identity of two sequences is estimated from the fraction of the shorter one's k-mers found in the representative, as a k-mer survives only if all k of its residues are conserved. Only the numbers of the sequences are sorted by length, and each sequence is read from the store when its turn comes. Gives the sequence numbers of the representatives, in the order they were chosen, and the representative number of every sequence
+@traced_calls("cluster")
+def cluster_sequences(store, identity):
+    import numpy as np
+
+    k = kmer_length(identity)
+    residues, lengths = store.residue_array()
+    order = np.argsort(-lengths, kind="stable")
+
+    representatives = []                                #Sequence numbers of the representatives, in the order they were chosen
+    clusters = array.array("I", bytes(4 * len(store)))  #Representative number of each sequence
+    by_hash = {}                                        #Representative number of each sequence seen, by the hash of the sequence
+    kmer_index = collections.defaultdict(list)          #Representative numbers having each k-mer
+
+    for sequence_number in map(int, order):
+        sequence = store.sequence(sequence_number)
+        sequence_hash = hashlib.sha1(sequence.encode()).digest()
+
+        if sequence_hash in by_hash:
+            clusters[sequence_number] = by_hash[sequence_hash]
+            continue
+
+        kmers = {sequence[start:start + k] for start in range(len(sequence) - k + 1)}
+        shared = collections.Counter(number for kmer in kmers for number in kmer_index.get(kmer, ()))
+
+        #The sequence is clustered with the representative sharing the most k-mers, if the identity estimated from them reaches the threshold
+        cluster = None
+        if kmers and shared:
+            number, shared_kmers = shared.most_common(1)[0]
+            if (shared_kmers / len(kmers)) ** (1 / k) >= identity:
+                cluster = number
+
+        if cluster is None:
+            cluster = len(representatives)
+            representatives.append(sequence_number)
+            for kmer in kmers:
+                kmer_index[kmer].append(cluster)
+
+        by_hash[sequence_hash] = cluster
+        clusters[sequence_number] = cluster
+
+    return representatives, clusters
+
+
+
+#Function to write the representative sequences to be aligned, and the map of each representative to the sequences it stands for
+def reduce_redundancy(query, identity=None):
+    import numpy as np
+
+    identity = identity or redundancy_identity
+    print(f"Clustering the sequences of your query at {identity:.0%} identity...")
+
+    store = open_sequence_store(f"./{query}/{query}.pro.fa")
+    representatives, clusters = cluster_sequences(store, identity)
+
+    with open(f"./{query}/{query}_representatives.pro.fa", "w") as representative_file:
+        for number in representatives:
+            representative_file.write(f">{store.header(number)}\n{store.sequence(number)}\n")
+
+    #Each line has the accession of a representative, the number of sequences in its cluster, and their accessions in the order they were fetched. The sequences are grouped by sorting their numbers by cluster
+    clusters = np.frombuffer(clusters, dtype=np.uint32)
+    by_cluster = np.argsort(clusters, kind="stable")
+    cluster_ends = np.cumsum(np.bincount(clusters, minlength=len(representatives)))
+
+    with open(f"./{query}/{query}_clusters.tsv", "w") as cluster_file:
+        for cluster, number in enumerate(representatives):
+            members = by_cluster[cluster_ends[cluster - 1] if cluster > 0 else 0:cluster_ends[cluster]]
+            cluster_file.write(f"{store.accession(number)}\t{len(members)}\t{','.join(store.accession(member) for member in map(int, members))}\n")
+
+    print(f"{len(store)} sequences were reduced to {len(representatives)} representatives, saved in ./{query}/{query}_representatives.pro.fa")
+
+
+
+#Function to find the fasta file to align: the representatives when redundant sequences are removed, otherwise every sequence of the query
+def alignment_input(query):
+
+    if redundancy_identity is None:
+        return f"./{query}/{query}.pro.fa"
+
+    return f"./{query}/{query}_representatives.pro.fa"
+
+
+
+def redundancy_stage(query):
+
+    if redundancy_identity is not None:
+        run_stage(query, "redundancy", [f"./{query}/{query}.pro.fa"], {"identity": redundancy_identity}, [f"./{query}/{query}_representatives.pro.fa", f"./{query}/{query}_clusters.tsv"], lambda: reduce_redundancy(query))
+
+
+
+
+
+
+
+##############################################################################################################################
+#Aligning and plotting conservation across protein query
+
+
+
+#Most sequences aligned at once, as the time and memory clustalo needs grow much faster than the number of sequences. Beyond it, the alignment either uses a random sample of alignment_max_sequences sequences ("downsample") or is refused ("reject")
+alignment_max_sequences = 5000
+alignment_oversize = "downsample"
+
+
+
+#Function to write a random sample of 'size' fasta records to sample_file, reading the records one at a time and keeping only the sample in memory (reservoir sampling). The same records are always picked from the same file, and they keep their order
+def sample_fasta(fasta_file, sample_file, size, seed=1):
+
+    generator = random.Random(seed)
+    sample = []
+
+    for number, record in enumerate(read_fasta(fasta_file)):
+        if number < size:
+            sample.append((number, record))
+        else:
+            position = generator.randrange(number + 1)
+            if position < size:
+                sample[position] = (number, record)
+
+    with open(sample_file, "w") as sample_output:
+        for number, (header, sequence) in sorted(sample):
+            sample_output.write(f">{header}\n{sequence}\n")
+
+
+
+#Function to align the fasta sequences of the protein query
+def align_sequences(query, aligned_file):
+
+    input_file = alignment_input(query)
+    sequence_count = sum(1 for record in read_fasta(input_file))
+
+    #Too many sequences are refused or sampled before reaching clustalo, so one huge family cannot exhaust the machine
+    if sequence_count > alignment_max_sequences:
+        if alignment_oversize == "reject":
+            raise RuntimeError(f"{sequence_count} sequences are too many to align (the most is {alignment_max_sequences}). Remove redundant sequences with --reduce-redundancy, filter them with --filter, or sample them with --alignment-oversize downsample.")
+
+        print(f"Your query has {sequence_count} sequences to align, more than the {alignment_max_sequences} that can be aligned at once, so a random sample of {alignment_max_sequences} of them will be aligned.")
+        sample_fasta(input_file, f"./{query}/{query}_alignment_sample.pro.fa", alignment_max_sequences)
+        input_file = f"./{query}/{query}_alignment_sample.pro.fa"
+
+    print("Aligning clustered query sequences...")
+
+    #Aligning the query sequences, and outputting a conservation score and similarity score
+    with cpu_budget.threads() as threads:
+        run_program(f"clustalo -i {input_file} --force --threads={threads} -o ./{query}/{aligned_file}", shell=True)
+    print(f"Aligned fasta sequences of your protein query have been saved in ./{query}/{aligned_file}")
+
+
+
+#Function to generate a conservation plot png from the aligned sequences
+def draw_conservation_plot(query, aligned_file):
+
+    print("Generating plot of conservation of query sequence...")
+
+    #Plotting the aligned sequences
+    with cpu_budget.threads(1):
+        run_program(f"plotcon -sequence ./{query}/{aligned_file} -winsize {conservation_window} -graph png -goutfile ./{query}/{query}_conservation_plot", shell=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    os.rename(f"./{query}/{query}_conservation_plot.1.png", f"./{query}/{query}_conservation_plot.png")
+    print(f"Your generated conservation plot has been saved in the path ./{query}/{query}_conservation_plot.png")
+
+
+
+#Substitution matrix used to score the conservation of each alignment column, as in plotcon: None uses the BLOSUM62 matrix below, otherwise the path of a matrix file in the EMBOSS or NCBI format (e.g. EPAM250 from the EMBOSS data directory). The window is the number of columns averaged for each point, plotcon's -winsize
+conservation_matrix_file = None
+conservation_window = 7
+
+blosum62 = """
+   A  R  N  D  C  Q  E  G  H  I  L  K  M  F  P  S  T  W  Y  V  B  Z  X  *
+A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+B -2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+Z -1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+X  0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+* -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+"""
+
+
+
+#Function to read a substitution matrix in the EMBOSS/NCBI format: a header line of residue letters, then one line per residue starting with its letter. Lines starting with '#' are comments
+def read_substitution_matrix(matrix_text):
+
+    rows = [line.split() for line in matrix_text.splitlines() if line.strip() != "" and not line.startswith("#")]
+    letters = rows[0]
+    scores = {row[0]: [int(score) for score in row[1:]] for row in rows[1:]}
+
+    return letters, [scores[letter] for letter in letters]
+
+
+
+#Function to encode an alignment as a memory-mapped matrix of one byte per residue (n_sequences x n_columns), so the scores never need the whole alignment as Python strings. Residues are numbered from 1 in the order of the matrix letters; gaps are 0 and letters missing from the matrix count as X
+def encode_alignment(aligned_path, letters, matrix_path):
+    import numpy as np
+
+    #The shape of the matrix is found first, from the number of records and the width of the first one, so the rows can then be written one at a time as the alignment is read
+    with open(aligned_path, "rb") as aligned_file:
+        record_count = sum(1 for line in aligned_file if line.startswith(b">"))
+    first_record = next(read_fasta(aligned_path), None)
+    if first_record is None:
+        return np.zeros((0, 0), dtype=np.uint8)
+
+    unknown = letters.index("X") + 1 if "X" in letters else 0
+    table = bytearray(unknown if chr(byte).isalpha() or chr(byte) == "*" else 0 for byte in range(256))
+    for code, letter in enumerate(letters, 1):
+        table[ord(letter.upper())] = code
+        table[ord(letter.lower())] = code
+
+    #bytes.translate turns a whole aligned sequence into residue codes at once, with no loop over the residues
+    matrix = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=np.uint8, shape=(record_count, len(first_record[1])))
+    for row, (header, sequence) in enumerate(read_fasta(aligned_path)):
+        matrix[row] = np.frombuffer(sequence.encode().translate(table), dtype=np.uint8)
+    matrix.flush()
+    del matrix
+
+    return np.load(matrix_path, mmap_mode="r")
+
+
+
+#Function to score the conservation of each alignment column and of the window around it, as plotcon does: the score of a column is the mean substitution score of all the pairs of residues in it, gaps left out, and each point of the plot is the mean of the column scores across the window
+@traced_calls("score")
+def conservation_scores(aligned_path, matrix_path, window=None, substitution_matrix_file=None):
+    import numpy as np
+
+    window = window or conservation_window
+    substitution_matrix_file = substitution_matrix_file or conservation_matrix_file
+    if substitution_matrix_file is None:
+        letters, scores = read_substitution_matrix(blosum62)
+    else:
+        with open(substitution_matrix_file) as matrix_file:
+            letters, scores = read_substitution_matrix(matrix_file.read())
+
+    alignment = encode_alignment(aligned_path, letters, matrix_path)
+    columns = alignment.shape[1]
+
+    #Code 0 is a gap, and scores 0 against everything so gaps add nothing to the pair sums
+    substitution = np.zeros((len(letters) + 1, len(letters) + 1))
+    substitution[1:, 1:] = scores
+
+    #Counting each residue in each column in one pass over the matrix, a block of rows at a time so a 10k sequence alignment is never copied whole into memory
+    counts = np.zeros((len(letters) + 1) * columns, dtype=np.int64)
+    column_numbers = np.arange(columns, dtype=np.intp)
+    for start in range(0, alignment.shape[0], 1024):
+        block = alignment[start:start + 1024].astype(np.intp)
+        counts += np.bincount((block * columns + column_numbers).ravel(), minlength=counts.size)
+    counts = counts.reshape(len(letters) + 1, columns).T.astype(float)
+    counts[:, 0] = 0
+
+    #Sum of the scores of every pair of residues in a column from the residue counts: all ordered pairs, minus each residue paired with itself, halved
+    pair_sums = (np.einsum("ca,ab,cb->c", counts, substitution, counts) - counts @ np.diag(substitution)) / 2
+    residues = counts.sum(axis=1)
+    pairs = residues * (residues - 1) / 2
+    column_scores = np.divide(pair_sums, pairs, out=np.zeros(columns), where=pairs > 0)
+
+    #Mean of the column scores across the window centred on each column. As in plotcon, columns closer to the ends than half a window have no score
+    window_scores = np.full(columns, np.nan)
+    if columns >= window:
+        cumulative = np.concatenate(([0.0], np.cumsum(column_scores)))
+        window_scores[window // 2:window // 2 + columns - window + 1] = (cumulative[window:] - cumulative[:-window]) / window
+
+    return column_scores, window_scores
+
+
+
+#Function to save the conservation scores of the aligned sequences next to the conservation plot, as a csv table and as a numpy array of the column and window scores
+def write_conservation_scores(query, aligned_file):
+    import numpy as np
+
+    print("Scoring the conservation of each column of the alignment...")
+
+    column_scores, window_scores = conservation_scores(f"./{query}/{aligned_file}", f"./{query}/{query}_aligned.u8.npy")
+    np.save(f"./{query}/{query}_conservation.npy", np.vstack((column_scores, window_scores)))
+
+    with open(f"./{query}/{query}_conservation.csv", "w", newline="") as score_file:
+        writer = csv.writer(score_file)
+        writer.writerow(["position", "column_score", f"window_score_{conservation_window}"])
+        for position, (column_score, window_score) in enumerate(zip(column_scores, window_scores), 1):
+            writer.writerow([position, round(column_score, 4), "" if np.isnan(window_score) else round(window_score, 4)])
+
+    os.remove(f"./{query}/{query}_aligned.u8.npy")
+    print(f"The conservation scores have been saved in ./{query}/{query}_conservation.csv")
+
+
+
+#Creating a function to align the fasta sequeces of the protein query and generate a conservation plot png and score table, skipping either step if its input has not changed
+def plot_conservation(query, aligned_file):
+
+    redundancy_stage(query)
+    alignment_stage(query, aligned_file)
+    conservation_plot_stage(query, aligned_file)
+    conservation_scores_stage(query, aligned_file)
+
+
+
+#Functions running the alignment and the conservation plot as separate stages, so the transmembrane prediction can start as soon as the alignment is ready
+def alignment_stage(query, aligned_file):
+
+    run_stage(query, "alignment", [alignment_input(query)], {"max_sequences": alignment_max_sequences, "oversize": alignment_oversize}, [f"./{query}/{aligned_file}"], lambda: align_sequences(query, aligned_file))
+
+
+def conservation_plot_stage(query, aligned_file):
+
+    run_stage(query, "conservation_plot", [f"./{query}/{aligned_file}"], {"winsize": conservation_window}, [f"./{query}/{query}_conservation_plot.png"], lambda: draw_conservation_plot(query, aligned_file))
+
+
+def conservation_scores_stage(query, aligned_file):
+
+    score_inputs = [f"./{query}/{aligned_file}"] + ([conservation_matrix_file] if conservation_matrix_file is not None else [])
+    run_stage(query, "conservation_scores", score_inputs, {"window": conservation_window, "matrix": conservation_matrix_file or "BLOSUM62"}, [f"./{query}/{query}_conservation.csv", f"./{query}/{query}_conservation.npy"], lambda: write_conservation_scores(query, aligned_file))
+
+
+
+
+
+
+###########################################################################################################################
+#Identifying motifs from the protein and taxon query
+
+
+
+#Number of fasta records written to each temporary file handed to patmatmotifs, and the number of patmatmotifs processes run at the same time
+motif_batch_size = 200
+motif_workers = cpu_budget.total
+
+#The motif search can either run EMBOSS patmatmotifs ("patmatmotifs") or match the PROSITE patterns of a local prosite.dat in this script ("native")
+motif_backend = "patmatmotifs"
+prosite_file = "./prosite.dat"
+
+#Number of sequences of a sequence store handed to each worker process of the native motif search at a time
+native_motif_chunk = 2000
+
+
+
+#Function to group the fasta records into lists of batch_size records, reading only one batch at a time
+def batch_records(fasta_records, batch_size):
+
+    batch = []
+    for record in fasta_records:
+        batch.append(record)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if len(batch) != 0:
+        yield batch
+
+
+
+#Function to split a patmatmotifs report covering several sequences into one report per sequence, laid out exactly as if patmatmotifs had been run on each sequence on its own
+def split_motif_report(report):
+
+    lines = report.split("\n")
+
+    #Finding where each sequence section starts: a '#=====' line followed by '#' and the '# Sequence:' line
+    section_starts = [i for i in range(len(lines) - 2) if lines[i].startswith("#=====") and lines[i + 2].startswith("# Sequence:")]
+
+    if len(section_starts) == 0:
+        return []
+
+    #Finding where the summary of the whole report starts, which comes right before '# Total_sequences:'
+    footer_start = len(lines)
+    for i in range(len(lines) - 1, section_starts[-1], -1):
+        if lines[i].startswith("# Total_sequences:"):
+            footer_start = i - 1
+            break
+
+    #The report header (program, command line and report format) is shared by all sequences
+    header = lines[:section_starts[0]]
+    section_ends = section_starts[1:] + [footer_start]
+
+    per_sequence_reports = []
+    for start, end in zip(section_starts, section_ends):
+        section = lines[start:end]
+
+        #Recovering the sequence length and number of hits for the summary of this sequence alone
+        sequence_line = section[2].split()
+        sequence_length = int(sequence_line[sequence_line.index("to:") + 1]) - int(sequence_line[sequence_line.index("from:") + 1]) + 1
+        hit_count = section[3].split(":")[1].strip()
+
+        footer = ["#---------------------------------------",
+                  "# Total_sequences: 1",
+                  f"# Total_length: {sequence_length}",
+                  "# Reported_sequences: 1",
+                  f"# Reported_hitcount: {hit_count}",
+                  "#---------------------------------------",
+                  ""]
+
+        per_sequence_reports.append("\n".join(header + section + footer))
+
+    return per_sequence_reports
+
+
+
+#Function run by each worker: writes one batch of fasta records to its own temporary file, runs patmatmotifs once on the whole batch and returns the report of each sequence
+@traced_calls("scan")
+def scan_motif_batch(query, batch_number, batch):
+
+    temporary_fasta = f"./{query}/temporary_fasta_file_{batch_number}"
+    temporary_motifs = f"./{query}/{query}_temporary_motifs_{batch_number}.txt"
+
+    with open(temporary_fasta, "w") as temporary_file:
+        for header, sequence in batch:
+            temporary_file.write(">" + header + "\n" + sequence + "\n")
+
+    #Identifies motifs from PROSITE database in all the protein sequences of the batch
+    with cpu_budget.threads(1):
+        run_program(["patmatmotifs", "-sequence", temporary_fasta, "-outfile", temporary_motifs], stderr=subprocess.DEVNULL)
+
+    with open(temporary_motifs) as temporary_motif_file:
+        report = temporary_motif_file.read()
+
+    #Removing the temporary files of this batch
+    os.remove(temporary_fasta)
+    os.remove(temporary_motifs)
+
+    return split_motif_report(report)
+
+
+
+#Function to read every hit out of the patmatmotifs report of one sequence, giving (accession, motif, start, end, score) for each hit rather than only the first one
+def parse_motif_hits(report):
+
+    hits = []
+    accession, start, end, score = None, None, None, 0
+
+    for line in report.split("\n"):
+        if line.startswith("# Sequence:"):
+            accession = line.split()[2]
+        elif line.startswith("Start = position"):
+            start = int(line.split()[3])
+        elif line.startswith("End = position"):
+            end = int(line.split()[3])
+        elif line.startswith("Score = "):
+            score = float(line[8:])
+
+        #The motif name closes the description of each hit
+        elif line.startswith("Motif = "):
+            hits.append((accession, line[8:], start, end, score))
+            start, end, score = None, None, 0
+
+    return hits
+
+
+
+#Function to write the hits of one sequence to the motif index as tab separated lines of accession, motif, start, end and score
+def write_motif_hits(index_output, hits):
+
+    for accession, motif_name, start, end, score in hits:
+        index_output.write(f"{accession}\t{motif_name}\t{start}\t{end}\t{score:g}\n")
+
+
+
+#Function to scan all the fasta records for motifs in batches spread across a pool of workers, writing the report of each sequence to motif_file in the original order, separated by "\nnew_sequence", and every hit to index_file
+@traced_calls("scan")
+def scan_motifs(query, fasta_records, motif_file, index_file, batch_size=motif_batch_size, workers=motif_workers):
+
+    #Each worker only waits on a patmatmotifs process, so threads are enough to keep every core busy
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool, open(motif_file, "w") as motif_output, open(index_file, "w") as index_output:
+        index_output.write("#accession\tmotif\tstart\tend\tscore\n")
+
+        #Only a few batches per worker are read ahead at a time, so memory stays bounded however many sequences there are
+        pending = collections.deque()
+        for batch_number, batch in enumerate(batch_records(fasta_records, batch_size)):
+            pending.append(pool.submit(scan_motif_batch, query, batch_number, batch))
+
+            #Writing out the oldest batch once enough batches are queued, or every remaining batch once all have been submitted
+            while len(pending) >= 2 * workers:
+                for sequence_report in pending.popleft().result():
+                    motif_output.write(sequence_report + "\nnew_sequence")
+                    write_motif_hits(index_output, parse_motif_hits(sequence_report))
+
+        while len(pending) != 0:
+            for sequence_report in pending.popleft().result():
+                motif_output.write(sequence_report + "\nnew_sequence")
+                write_motif_hits(index_output, parse_motif_hits(sequence_report))
+
+
+
+#Function to turn one PROSITE pattern, e.g. 'N-{P}-[ST]-{P}.', into the equivalent regular expression
+def prosite_to_regex(pattern):
+
+    regex = ""
+    for element in pattern.rstrip(".").split("-"):
+
+        #'<' and '>' anchor the pattern to the start or end of the sequence
+        if element.startswith("<"):
+            regex += "^"
+            element = element[1:]
+
+        end_anchor = element.endswith(">")
+        if end_anchor:
+            element = element[:-1]
+
+        #Splitting off the number of repeats, e.g. 'x(2,4)'
+        repeat = ""
+        if "(" in element:
+            element, repeat = element[:-1].split("(")
+            repeat = "{" + repeat + "}"
+
+        #'x' is any amino acid, '[..]' any of the amino acids listed and '{..}' any amino acid except those listed. A '>' inside '[..]' also allows the end of the sequence
+        if element == "x":
+            residue = "."
+        elif element.startswith("["):
+            residue = "[" + element[1:-1].replace(">", "") + "]"
+            if ">" in element:
+                residue = "(?:" + residue + "|$)"
+        elif element.startswith("{"):
+            residue = "[^" + element[1:-1] + "]"
+        else:
+            residue = element
+
+        regex += residue + repeat
+        if end_anchor:
+            regex += "$"
+
+    return regex
+
+
+
+#Function to load the PROSITE patterns from a prosite.dat file and compile each of them once. Patterns flagged with /SKIP-FLAG=TRUE (very common post-translational modification sites) are left out, just as patmatmotifs prunes them by default
+@functools.lru_cache(maxsize=None)
+def load_prosite(prosite_path, prune=True):
+
+    patterns = []
+    motif_name, pattern, is_pattern, skip = None, "", False, False
+
+    with open(prosite_path) as prosite:
+        for line in prosite:
+            code, content = line[:2], line[5:].rstrip()
+
+            if code == "ID":
+                motif_name = content.split(";")[0]
+                is_pattern = content.rstrip(".").endswith("PATTERN")
+
+            #Patterns can be wrapped across several 'PA' lines
+            elif code == "PA":
+                pattern += content
+
+            elif code == "CC" and "/SKIP-FLAG=TRUE" in content:
+                skip = True
+
+            #'//' closes each entry
+            elif code == "//":
+                if is_pattern and pattern != "" and not (prune and skip):
+
+                    #The lookahead allows overlapping matches to be found, one at each starting position
+                    patterns.append((motif_name, re.compile("(?=(" + prosite_to_regex(pattern) + "))")))
+
+                motif_name, pattern, is_pattern, skip = None, "", False, False
+
+    return patterns
+
+
+
+#Function to write a report for one sequence laid out like the patmatmotifs (dbmotif) report of a single sequence, so both backends are read the same way. The report names the prosite.dat file the sequence was scanned with
+def format_motif_report(name, sequence, hits, prosite_path=None):
+
+    prosite_path = prosite_path or prosite_file
+
+    lines = ["########################################",
+             "# Program: patmatmotifs (native PROSITE pattern search)",
+             f"# Data_file: {prosite_path}",
+             "# Commandline: protein_analysis.py",
+             "#    -backend native",
+             f"#    -sequence {name}",
+             "# Report_format: dbmotif",
+             "# Report_file: -",
+             "########################################",
+             "",
+             "#=======================================",
+             "#",
+             f"# Sequence: {name}     from: 1   to: {len(sequence)}",
+             f"# HitCount: {len(hits)}",
+             "#",
+             "# Full: No",
+             "# Prune: Yes",
+             f"# Data_file: {prosite_path}",
+             "#",
+             "#=======================================",
+             ""]
+
+    for motif_name, start, end in hits:
+        lines += [f"Length = {end - start + 1}",
+                  f"Start = position {start} of sequence",
+                  f"End = position {end} of sequence",
+                  "",
+                  f"Motif = {motif_name}",
+                  "",
+                  sequence[max(start - 6, 0):end + 5],
+                  "",
+                  "#---------------------------------------",
+                  ""]
+
+    lines += ["#---------------------------------------",
+              "#---------------------------------------",
+              "",
+              "#---------------------------------------",
+              "# Total_sequences: 1",
+              f"# Total_length: {len(sequence)}",
+              "# Reported_sequences: 1",
+              f"# Reported_hitcount: {len(hits)}",
+              "#---------------------------------------",
+              ""]
+
+    return "\n".join(lines)
+
+
+
+#Function to find the PROSITE pattern hits of one sequence as (motif, start, end), in the order they appear along the sequence, with positions counted from 1 like patmatmotifs
+def match_prosite(sequence, patterns):
+
+    hits = []
+    for motif_name, matcher in patterns:
+        for match in matcher.finditer(sequence):
+            hits.append((motif_name, match.start(1) + 1, match.end(1)))
+
+    hits.sort(key=lambda hit: hit[1])
+    return hits
+
+
+
+#Function to give the report and the hits of each of the fasta records that has any hit of the PROSITE patterns loaded from prosite_path
+def native_motif_reports(fasta_records, patterns, prosite_path=None):
+
+    for header, sequence in fasta_records:
+        sequence = sequence.upper()
+        hits = match_prosite(sequence, patterns)
+
+        #PROSITE patterns carry no score, so every pattern hit is indexed with a score of 0
+        if len(hits) != 0:
+            accession = header.split(" ")[0]
+            yield format_motif_report(accession, sequence, hits, prosite_path), [(accession, motif_name, start, end, 0) for motif_name, start, end in hits]
+
+
+
+#Function run by each worker process of the native motif search on the sequences from number start up to number stop of a sequence store. The worker maps the store itself, so only the name of the fasta file and two numbers are sent to it, rather than the sequences
+def scan_store_native(fasta_file, prosite_path, start, stop):
+
+    return list(native_motif_reports(SequenceStore(fasta_file).records(start, stop), load_prosite(prosite_path), prosite_path))
+
+
+
+#Function to find the motifs of all the fasta records with the compiled PROSITE patterns, writing the report of each sequence with hits to motif_file, separated by "\nnew_sequence", and every hit to index_file. The records of a large sequence store are matched native_motif_chunk sequences at a time by a pool of worker processes, as the matching runs in Python and one process only keeps one core busy; any other records are matched in this process
+@traced_calls("scan")
+def scan_motifs_native(fasta_records, motif_file, index_file, prosite_path=None):
+
+    prosite_path = prosite_path or prosite_file
+    patterns = load_prosite(prosite_path)
+
+    with open(motif_file, "w") as motif_output, open(index_file, "w") as index_output:
+        index_output.write("#accession\tmotif\tstart\tend\tscore\n")
+
+        if isinstance(fasta_records, SequenceStore) and len(fasta_records) > native_motif_chunk:
+            with cpu_budget.threads(motif_workers) as workers, concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                chunk_starts = range(0, len(fasta_records), native_motif_chunk)
+                chunks = pool.map(scan_store_native, itertools.repeat(fasta_records.fasta_file), itertools.repeat(prosite_path), chunk_starts, [start + native_motif_chunk for start in chunk_starts])
+
+                for report, hits in itertools.chain.from_iterable(chunks):
+                    motif_output.write(report + "\nnew_sequence")
+                    write_motif_hits(index_output, hits)
+
+        else:
+            for report, hits in native_motif_reports(fasta_records, patterns, prosite_path):
+                motif_output.write(report + "\nnew_sequence")
+                write_motif_hits(index_output, hits)
+
+
+
+#Function to check whether the motif index was built from the current query fasta file, so it can be used instead of scanning again
+def motif_index_current(fasta_file, index_file):
+
+    return os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(fasta_file)
+
+
+
+#Function to load the motif index into a dictionary of each motif to the accession numbers carrying it, each with the list of its (start, end, score) hits. The loaded index is kept for as long as the file is unchanged, so repeated motif picks do not read it again
+@functools.lru_cache(maxsize=8)
+def load_motif_index(index_file, modified_time):
+
+    motif_hits = {}
+    with open(index_file) as index_open:
+        for line in index_open:
+            if line.startswith("#"):
+                continue
+
+            accession, motif_name, start, end, score = line.rstrip("\n").split("\t")
+            motif_hits.setdefault(motif_name, {}).setdefault(accession, []).append((int(start), int(end), float(score)))
+
+    return motif_hits
+
+
+
+#Function to read the motif index of a query, giving the dictionary of each motif to the accession numbers carrying it
+def read_motif_index(index_file):
+
+    return load_motif_index(index_file, os.path.getmtime(index_file))
+
+
+
+#Function to count the number of sequences carrying each motif in the motif index
+def motif_counts(index_file):
+
+    return {motif_name: len(accessions) for motif_name, accessions in read_motif_index(index_file).items()}
+
+
+
+#Function to compare the native backend with a patmatmotifs report of the same fasta records, giving the number of sequences carrying each motif according to each backend, and the hits (accession, motif, start, end) found by only one of them
+def compare_motif_report(report_file, fasta_records, prosite_path=None):
+
+    prosite_path = prosite_path or prosite_file
+
+    with open(report_file) as report:
+        patmatmotifs_hits = set(hit[:4] for sequence_report in split_motif_report(report.read()) for hit in parse_motif_hits(sequence_report))
+
+    native_hits = set(hit[:4] for report, hits in native_motif_reports(fasta_records, load_prosite(prosite_path), prosite_path) for hit in hits)
+
+    #Each sequence is counted once for each motif it carries, however many times it carries it
+    patmatmotifs_counts = dict(collections.Counter(motif_name for accession, motif_name in set(hit[:2] for hit in patmatmotifs_hits)))
+    native_counts = dict(collections.Counter(motif_name for accession, motif_name in set(hit[:2] for hit in native_hits)))
+
+    return patmatmotifs_counts, native_counts, sorted(patmatmotifs_hits ^ native_hits)
+
+
+
+#Function to check that the native backend agrees with patmatmotifs on a fasta file, running patmatmotifs on the whole file and comparing its report with the native hits. The two only agree when the PROSITE data of EMBOSS was built from the same prosite.dat
+def compare_motif_backends(fasta_file, prosite_path=None):
+
+    report_file = f"{fasta_file}.patmatmotifs"
+
+    with cpu_budget.threads(1):
+        run_program(["patmatmotifs", "-sequence", fasta_file, "-outfile", report_file], stderr=subprocess.DEVNULL)
+
+    try:
+        return compare_motif_report(report_file, read_fasta(fasta_file), prosite_path)
+    finally:
+        os.remove(report_file)
+
+
+
+#Making a function to find the motifs in the protein sequence query
+def find_motifs(query, fasta_records, find=None, motif_chosen=None):
+
+    #Every motif hit of the query is saved to this index by the first scan, and later calls are answered from it
+    query_fasta = f"./{query}/{query}.pro.fa"
+    motif_index = f"./{query}/{query}_motif_index.tsv"
+
+    def scan():
+
+        print("Identifying motifs in the protein sequence query...")
+
+        #Matching the PROSITE patterns in this script, or scanning the fasta records in batches of patmatmotifs across all available cores, giving one report per sequence in the final motif file
+        if motif_backend == "native":
+            scan_motifs_native(fasta_records, f"./{query}/{query}_motifs.txt", motif_index)
+        else:
+            scan_motifs(query, fasta_records, f"./{query}/{query}_motifs.txt", motif_index)
+
+        store_motif_hits(query, motif_index)
+
+    #The sequences are only scanned if the query fasta file, the motif backend or its PROSITE patterns have changed since the index was built
+    motif_inputs = [query_fasta] + ([prosite_file] if motif_backend == "native" else [])
+    run_stage(query, "motifs", motif_inputs, {"backend": motif_backend}, [motif_index, f"./{query}/{query}_motifs.txt"], scan)
+
+
+    if find is None:
+
+        #Creating a dictionary to save all the types of motifs present along with the number of sequences carrying them from the query search
+        motifs = motif_counts(motif_index)
+
+        #Check whether any motifs were found    
+        if len(motifs) != 0:
+            motifs_found = []
+
+            #Joins all the motifs found and how many times each were found to a list
+            for key, value in motifs.items():
+                motifs_found.append(f"Found the motif {key} {value} times.")
+
+            #Outputs all the motifs found and how many times they were found
+            print("Summary of motifs found in protein sequence query below:\n" + "\n".join(motifs_found))
+
+
+        else:
+            print("No motifs found in the protein sequence query.")
+
+        #The output of the function is the dictionary of the motifs found with the corresponding number of times they were found
+        return motifs
+
+
+    #Section for wildcard blast step
+    elif find == True:
+
+        #Returns the accession numbers
+        return set(read_motif_index(motif_index).get(motif_chosen, {}))
+
+
+
+
+
+
+###############################################################################################################################
+#WILDCARD: Building a blast database off of a motif subset of the user's protein query and asking for a new taxon to blast against
+
+
+
+
+
+
+
+
+
+#Function to extract the wanted fasta sequences with the chosen motif and make a blastp database out of these fasta sequences
+def build_motif_database(query, motif_chosen):
+
+    #Finding the accession numbers of the fasta sequences containing the chosen motif
+    ids = find_motifs(query, open_sequence_store(f"./{query}/{query}.pro.fa"), find=True, motif_chosen=motif_chosen)
+
+    #Taking the fasta sequences with the chosen motif from the results database, or copying those with these accession numbers out of the original query search fasta file, using its accession index. The file is kept next to the database as the list of its members
+    os.makedirs(f"./{query}/blast_database", exist_ok=True)
+    members_file = f"./{query}/blast_database/{motif_chosen}_members.fa"
+
+    if stored_motif_members(query, motif_chosen, members_file) is None:
+        extract_fasta(f"./{query}/{query}.pro.fa", ids, members_file)
+
+    #The database is saved in the cache under the motif and a hash of its member sequences, so any query with the same members for this motif reuses it, whatever order they were fetched in. Each record is hashed on its own and the hashes are added up, which does not depend on their order, so only one record is held in memory at a time
+    members_sum, member_count = 0, 0
+    for header, sequence in read_fasta(members_file):
+        members_sum = (members_sum + int.from_bytes(hashlib.sha256(f">{header}\n{sequence}\n".encode()).digest(), "big")) % 2 ** 256
+        member_count += 1
+    members_hash = hashlib.sha256(f"{member_count}\t{members_sum:064x}".encode())
+
+    #Makes a database of the fasta sequences containing the chosen motif to be able to use in blast, unless it is in the cache
+    def create_database(directory):
+        with cpu_budget.threads(1):
+            run_program(["makeblastdb", "-in", members_file, "-dbtype", "prot", "-title", motif_chosen, "-out", os.path.join(directory, motif_chosen)], stdout=subprocess.DEVNULL)
+
+    cached_blast_database(cache_key("blastdb", motif_chosen, members_hash.hexdigest()), f"./{query}/blast_database", create_database)
+
+
+
+#Function to make the blastp database of the proteins with the chosen motif, unless it has already been made from the same query sequences and motif hits
+def motif_assessment(query, motif_chosen):
+
+    run_stage(query, f"blast_database_{motif_chosen}", [f"./{query}/{query}.pro.fa", f"./{query}/{query}_motif_index.tsv"], {"motif": motif_chosen}, [f"./{query}/blast_database/{motif_chosen}.pin"], lambda: build_motif_database(query, motif_chosen))
+
+    print(f"The database out of proteins from your query with your chosen motifs is saved in ./{query}/blast_database/")
+
+
+
+
+
+#Function to identify the user's new query they want to use in blast, and subsequently runs ths query in blastp against the newly-made database from fasta sequences containing a certain motif
+def run_blast(query, motif_chosen, protein_family, taxonomic_group):
+
+    #Defining a function within run_blast() that refines the search query of the user for esearch
+    def carry_on(new_query):
+
+        #Removing unwanted spaces form the new query name
+        new_query = new_query.replace(" ", "_")
+
+        #Opens the temporary file created later on in the run_blast() function, containing the accession numbers of esearch
+        with open(f"./{query}/{query}_temporary_accs.txt", "r") as accs:
+
+            counter=0
+            options = {}
+            
+            #Looping through each accession number
+            for line in accs:
+                counter += 1
+
+                #Enumerates each accession number
+                print(str(counter) + ": " + line)
+
+                #Adds the number and corresponding accession number to a dictionary
+                options[counter] = line.rstrip()
+                
+
+            #Loops until a valid input is given to identify which accession number will be used for the blast
+            while True:
+
+                #Asks the user to input a number from the dictionary of accession numbers created
+                id_choice = input("Which species would you like to pick from the list to blast against your protein motif query database? Please input a number from the list of choices from above.\n")
+
+                #Checks if the user has inputted an integer
+                try:
+
+                    #Checks if the user has inputted a number present in the dictionary, corresponding to an accession number
+                    if int(id_choice) in options.keys():
+
+                        #Extracts the fasta sequence corresponding to the chosen accession number and saves that to a new file
+                        cached_file(("fasta", eutils_base_url, "protein", "id", options[int(id_choice)]), f"./{query}/{new_query}.pro.fa", lambda output_file: fetch_fasta_by_id(options[int(id_choice)], output_file))
+                        
+                        break
+                    
+                    #The user has the chance to re-input a number if the given number is invalid
+                    else:
+
+                        print("The number you have chosen is not in the list of accession names listed above. Please input another number.\n")
+                
+                #If the user has inputted anything besides an integer, they will have the change to re-enter
+                except ValueError:
+
+                    print("The number you have chosen is not in the correct format. Please ensure you only enter the number from the list shown.")
+
+
+    #Loops until the user has entered a valid input as to whether they want to input their own accession number or to run esearch on a taxon to chose from a list of accession number
+    while True:
+
+        #Asks the user to decide between option 1 or 2
+        own_query = input(f"Would you like to (1) enter your own query accession number for a taxon and {protein_family}, (2) search up top results for a general taxon, or (3) blast many sequences at once? Please enter '1', '2' or '3' corresponding to the these options.\n")
+        
+        #Checks if the user has inputted an integer
+        try:
+
+            #Checks if the user has chosen option 1
+            if int(own_query) == 1:
+
+                while True:
+                    new_query = input("What is the accession number of your query?\n").upper()
+
+                    print("Accessing the sequence to your accession number from NCBI protein database...")
+
+                    #Extracts the fasta sequence corresponding to the accession number provided by the user
+                    cached_file(("fasta", eutils_base_url, "protein", "id", new_query), f"./{query}/{new_query}.pro.fa", lambda output_file: fetch_fasta_by_id(new_query, output_file))
+                    
+                    if os.path.getsize(f"./{query}/{new_query}.pro.fa") != 0:
+                        break
+                    else:
+                        print("The access number you entered was either mistyped or does not correspond to a sequence. Please enter another one.")
+                                        
+
+                break
+
+            #Checks if the user has chosen option 2
+            elif int(own_query) == 2:
+
+                #Loops until an esearch result desired is achieved
+                while True:
+
+                    #Asks the user to input the taxon to use for as a blast query. Any unwanted characters in the input will be replaced by a space
+                    new_query = input(f"What is the taxon of your new query to blastp {protein_family} againist your initial query of {taxonomic_group}? Please note that only the first 10 NCBI protein database results will be considered.\n").replace("."," ").replace(";"," ").replace(","," ").replace("/"," ").replace("\\"," ").replace(":"," ").replace("'"," ").replace("\""," ").replace("_"," ")
+
+                    print("Finding results for your new query on NCBI protein database...")        
+        
+                    #Runs esearch to achieve the accession numbers of the first 10 results with their taxon query
+                    cached_file(("accessions", eutils_base_url, "protein", f"{protein_family}[PROT] AND {new_query}[ORGN]", 10), f"./{query}/{query}_temporary_accs.txt", lambda output_file: fetch_accessions(f"{protein_family}[PROT] AND {new_query}[ORGN]", output_file))
+                    
+                    #Checks if the file outputted from esearch contains any accession numbers
+                    if os.path.getsize(f"./{query}/{query}_temporary_accs.txt") != 0:
+                        
+                        #Runs carry_on() function described above
+                        carry_on(new_query)
+
+                        break
+                    
+                    #If the file outputted form esearch does not contain any accession numbers, esearch will be run one more time without including [PROT] to check if any accession numbers can be achieved if the search is less specific
+                    else:
+                        
+                        #Runs esearch to acheive the accession numbers of the first 10 results with thei user's taxon query
+                        cached_file(("accessions", eutils_base_url, "protein", f"{protein_family} AND {new_query}[ORGN]", 10), f"./{query}/{query}_temporary_accs.txt", lambda output_file: fetch_accessions(f"{protein_family} AND {new_query}[ORGN]", output_file))
+        
+                        #Again checks if the file outputted from esearch contains any accession numbers
+                        if os.path.getsize(f"./{query}/{query}_temporary_accs.txt") != 0:
+                            
+                            #Runs carry_oun() function described above
+                            carry_on(new_query)
+
+                            break
+
+                        
+                        else:
+
+                            #If there are no results in esearch, the user has the choice to try searching again
+                            again_decision = input("There are no results for your query. Would you like to input another new query? Please input 'Y' for yes or 'N' for no.\n")
+
+                            #Checks if the user wants to try search with a new taxon
+                            if again_decision.upper() == "Y" or again_decision.lower() == "yes":
+                                
+                                continue
+
+                            else:
+
+                                break
+                break
+            
+            #Checks if the user has chosen option 3, blasting a list of accession numbers or every result of a taxon in one blastp run
+            elif int(own_query) == 3:
+
+                while True:
+                    many_queries = input(f"Please enter the accession numbers to blast separated by spaces or commas, the path of a file listing them, or 'taxon:' followed by a taxon to blast all of its {protein_family} results{'' if max_results is None else f' (up to {max_results})'}.\n")
+
+                    try:
+                        new_query, fetch_blast_query = blast_query_source(query, many_queries, protein_family)
+                    except ValueError as error:
+                        print(f"{error} Please enter them again.")
+                        continue
+
+                    print("Accessing the sequences of your queries from NCBI protein database...")
+                    fetch_blast_query()
+
+                    if os.path.getsize(f"./{query}/{new_query}.pro.fa") != 0:
+                        break
+                    else:
+                        print("No sequences were found for your queries. Please enter them again.")
+
+                break
+
+            #If the user has not inputted 1, 2 or 3, they can re-enter a number
+            else:
+                print("You did not enter a valid number. Please try again.")
+        
+
+        #If the user inputted anything besides an integer, they can re-enter a number
+        except ValueError:
+            
+            print("You did not enter a valid number. Please try again.")
+
+
+    #Checks if the file containing accession number has been created, and if it has, it is deleted
+    if os.path.exists(f"./{query}/{query}_temporary_accs.txt"):
+        os.remove(f"./{query}/{query}_temporary_accs.txt")
+    
+    #Ensures that the new_query variable does not have any spaces remaining
+    new_query = new_query.replace(" ", "_")
+
+    #Checks if the fasta sequence for the new taxon query has been extracted, and runs blastp on it
+    if os.path.exists(f"./{query}/{new_query}.pro.fa"):
+        run_blastp(query, motif_chosen, new_query)
+    
+    #Function returns the name of the new taxon query
+    return new_query
+
+
+
+
+
+#Function to turn a blast query given as text into the name of its fasta file and the function fetching it. The text is one or more accession numbers separated by spaces, commas or semicolons, the path of a file listing accession numbers, or 'taxon:' followed by a taxon whose results for the protein family are all used as blast queries. Raises ValueError when the text gives no accession number or taxon
+def blast_query_source(query, blast_query, protein_family):
+
+    if blast_query.lower().startswith("taxon:"):
+        taxon = blast_query[len("taxon:"):].strip()
+        if not any(char.isalnum() for char in taxon):
+            raise ValueError("No taxon was given after 'taxon:'.")
+
+        new_query = taxon.replace(" ", "_")
+        NCBI_query = f"{protein_family}[PROT] AND {taxon}[ORGN]"
+
+        return new_query, lambda: cached_file(("fasta", eutils_base_url, "protein", NCBI_query, max_results), f"./{query}/{new_query}.pro.fa", lambda output_file: fetch_fasta(NCBI_query, output_file, limit=max_results))
+
+    if os.path.isfile(blast_query):
+        with open(blast_query) as accession_file:
+            blast_query = accession_file.read()
+
+    accessions = [accession for accession in re.split(r"[\s,;]+", blast_query.upper()) if accession != ""]
+    if len(accessions) == 0:
+        raise ValueError("No accession numbers were given.")
+
+    #Several accession numbers are named after the first of them in sorted order and a hash of all of them, so different lists never share their files
+    sorted_accessions = sorted(set(accessions))
+    new_query = accessions[0] if len(sorted_accessions) == 1 else f"{sorted_accessions[0]}_and_{len(sorted_accessions) - 1}_more_{hashlib.sha256(' '.join(sorted_accessions).encode()).hexdigest()[:10]}"
+
+    return new_query, lambda: cached_file(("fasta", eutils_base_url, "protein", "id", *accessions), f"./{query}/{new_query}.pro.fa", lambda output_file: fetch_fasta_by_id(accessions, output_file))
+
+
+
+#Number of blastp processes a file of several query sequences is split between. With 1, all the sequences go to one blastp run using every thread it is given
+blastp_shards = 1
+
+
+
+#Function to split the hits of a blast output of several query sequences into one file per query sequence, in a directory named after the blast output. Queries without hits get an empty file. Each group of hits is sent to the file of its query by the query ID blastp reports, which is usually the first word of the header, but only the accession for headers such as 'sp|P12345.2|X_HUMAN', so the fields of those headers are looked up as well. Hits whose query ID matches no query are saved under that ID instead. Gives the number of queries, the number of them with hits and the query IDs that matched no query
+def split_blast_hits(blast_file, query_accessions):
+
+    hits_directory = blast_file[:-len(".out")]
+    os.makedirs(hits_directory, exist_ok=True)
+
+    #Giving every query an empty file to start with, and naming each file by every ID blastp could report for the query. The whole header wins over a field of another header
+    hits_files, header_fields = {}, []
+    query_count = 0
+    for accession in query_accessions:
+        query_count += 1
+        hits_file = os.path.join(hits_directory, f"{accession}.tsv")
+        open(hits_file, "w").close()
+        hits_files.setdefault(accession, hits_file)
+        header_fields += [(field, hits_file) for field in accession.split("|")[1:] if field != ""]
+
+    for field, hits_file in header_fields:
+        hits_files.setdefault(field, hits_file)
+
+    files_with_hits, unmatched_queries = set(), []
+    with open(blast_file) as blast_output:
+        hit_lines = (line for line in blast_output if not line.startswith("#") and line.strip() != "")
+
+        for blast_query, hits in itertools.groupby(hit_lines, key=lambda line: line.split("\t", 1)[0]):
+            hits_file = hits_files.get(blast_query)
+            if hits_file is None:
+                unmatched_queries.append(blast_query)
+                hits_file = os.path.join(hits_directory, f"{blast_query.replace('/', '_')}.tsv")
+            else:
+                files_with_hits.add(hits_file)
+
+            with open(hits_file, "a") as hits_output:
+                hits_output.writelines(hits)
+
+    return query_count, len(files_with_hits), unmatched_queries
+
+
+
+#Function to run blastp of the new query fasta file against the database made of protein fasta sequences containing the chosen motif from the original query. A file of several query sequences is searched in one go, or split between blastp_shards blastp runs at the same time, and its hits are then split back per query
+def run_blastp(query, motif_chosen, new_query, shards=None):
+
+    query_fasta = f"./{query}/{new_query}.pro.fa"
+    blast_file = f"./{query}/{motif_chosen}_{new_query}_blast.out"
+
+    def blastp(input_file, output_file, threads):
+        with open(output_file, "w") as blast_output:
+            run_program(["blastp", "-query", input_file, "-db", f"./{query}/blast_database/{motif_chosen}", "-outfmt", "7", "-num_threads", str(threads)], stdout=blast_output)
+
+    def search():
+        record_count = sum(1 for record in read_fasta(query_fasta))
+        shard_count = max(1, min(shards or blastp_shards, record_count))
+
+        if record_count > 1:
+            print(f"Running blastp of your {record_count} new query sequences against your intial protein motif query database...")
+        else:
+            print("Running blastp of your new query against your intial protein motif query database...")
+
+        if shard_count == 1:
+            with cpu_budget.threads() as threads:
+                blastp(query_fasta, blast_file, threads)
+
+        #Each shard is a consecutive part of the query sequences, written out in one pass over them, so joining the outputs in order keeps the queries in their original order
+        else:
+            shard_size = -(-record_count // shard_count)
+            shard_files = [f"./{query}/{motif_chosen}_{new_query}_shard{number}" for number in range(shard_count)]
+
+            with contextlib.ExitStack() as stack:
+                shard_fastas = [stack.enter_context(open(f"{shard_file}.pro.fa", "w")) for shard_file in shard_files]
+                for number, (header, sequence) in enumerate(read_fasta(query_fasta)):
+                    shard_fastas[number // shard_size].write(f">{header}\n{sequence}\n")
+
+            def run_shard(number):
+                with cpu_budget.threads(max(1, cpu_budget.share // shard_count)) as threads:
+                    blastp(f"{shard_files[number]}.pro.fa", f"{shard_files[number]}.out", threads)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=shard_count) as pool:
+                list(pool.map(run_shard, range(shard_count)))
+
+            with open(blast_file, "w") as blast_output:
+                for shard_file in shard_files:
+                    with open(f"{shard_file}.out") as shard_output:
+                        shutil.copyfileobj(shard_output, blast_output)
+                    os.remove(f"{shard_file}.out")
+                    os.remove(f"{shard_file}.pro.fa")
+
+        store_blast_hits(query, motif_chosen, new_query, blast_file)
+
+        if record_count > 1:
+            query_count, queries_with_hits, unmatched_queries = split_blast_hits(blast_file, (header.split(" ")[0] for header, sequence in read_fasta(query_fasta)))
+            print(f"{queries_with_hits} of your {query_count} query sequences have hits. The hits of each one are saved in {blast_file[:-len('.out')]}/")
+
+            if unmatched_queries != []:
+                print(f"Warning: blastp reported hits for {len(unmatched_queries)} query IDs that match none of your query sequences, saved under the IDs blastp gave: {', '.join(unmatched_queries[:10])}{' ...' if len(unmatched_queries) > 10 else ''}")
+
+    #blastp is only run again if the new query sequence or the database files have changed
+    blastp_inputs = [query_fasta] + sorted(glob.glob(f"./{query}/blast_database/{motif_chosen}.p*"))
+    run_stage(query, f"blastp_{motif_chosen}_{new_query}", blastp_inputs, {}, [blast_file], search)
+
+
+
+
+
+#Names and types of the columns of blastp's tabular output (-outfmt 6 or 7)
+blast_columns = [("query", str), ("subject", str), ("identity", float), ("alignment_length", int), ("mismatches", int), ("gap_opens", int), ("query_start", int), ("query_end", int), ("subject_start", int), ("subject_end", int), ("evalue", float), ("bit_score", float)]
+
+#E-value thresholds summarised for every blast output, and the number of hits sorted in memory at a time when sorting a blast output by E-value
+blast_summary_thresholds = [1e-50, 1e-20, 1e-10, 1e-5, 1e-3, 1, 10]
+blast_sort_chunk = 200000
+
+
+
+#Function to read the hits of a blastp tabular output one at a time, as tuples of typed values in the order of blast_columns, skipping the comment lines
+def read_blast_hits(blast_file):
+
+    with open(blast_file) as blast_output:
+        for line in blast_output:
+            if line.startswith("#") or line.strip() == "":
+                continue
+
+            yield tuple(column_type(value) for (name, column_type), value in zip(blast_columns, line.rstrip("\n").split("\t")))
+
+
+
+#Function to sort the hits of a blastp output by E-value into sorted_file, with the best bit score first among equal E-values, together with sorted_file.evalues.bin, the E-values in the same order, so the hits below any threshold are found by binary search. Only blast_sort_chunk hits are held in memory at a time: each chunk is sorted and saved, and the chunks are then merged. The lines are copied as they are, only their E-value and bit score being read to sort them
+@traced_calls("parse")
+def sort_blast_hits(blast_file, sorted_file, chunk_size=None):
+
+    chunk_size = chunk_size or blast_sort_chunk
+
+    def sort_key(line):
+        fields = line.split("\t", 12)
+        return float(fields[10]), -float(fields[11])
+
+    chunk_files = []
+    with open(blast_file) as blast_output:
+        hit_lines = (line if line.endswith("\n") else line + "\n" for line in blast_output if not line.startswith("#") and line.strip() != "")
+
+        while True:
+            chunk = sorted(itertools.islice(hit_lines, chunk_size), key=sort_key)
+            if chunk == []:
+                break
+
+            chunk_files.append(f"{sorted_file}.chunk{len(chunk_files)}")
+            with open(chunk_files[-1], "w") as chunk_output:
+                chunk_output.writelines(chunk)
+
+    chunk_inputs = [open(chunk_file) for chunk_file in chunk_files]
+    with open(f"{sorted_file}.tmp", "w") as sorted_output, open(f"{sorted_file}.evalues.bin.tmp", "wb") as evalue_output:
+        evalues = array.array("d")
+
+        for line in heapq.merge(*chunk_inputs, key=sort_key):
+            sorted_output.write(line)
+            evalues.append(float(line.split("\t", 12)[10]))
+
+            #The E-values are written out in blocks too, so memory stays bounded however many hits there are
+            if len(evalues) == chunk_size:
+                evalues.tofile(evalue_output)
+                evalues = array.array("d")
+
+        evalues.tofile(evalue_output)
+
+    for chunk_file, chunk_input in zip(chunk_files, chunk_inputs):
+        chunk_input.close()
+        os.remove(chunk_file)
+
+    os.replace(f"{sorted_file}.evalues.bin.tmp", f"{sorted_file}.evalues.bin")
+    os.replace(f"{sorted_file}.tmp", sorted_file)
+
+
+
+#Class reading the hits of a blastp output sorted by E-value, sorting them first if the sorted copy is missing or older than the blast output
+class SortedBlastHits:
+
+    def __init__(self, blast_file):
+        self.sorted_file = f"{blast_file[:-len('.out')]}.sorted.tsv"
+
+        if not os.path.exists(self.sorted_file) or os.path.getmtime(self.sorted_file) < os.path.getmtime(blast_file):
+            sort_blast_hits(blast_file, self.sorted_file)
+
+        self.evalues = memoryview(map_file(f"{self.sorted_file}.evalues.bin")).cast("d")
+
+    def __len__(self):
+        return len(self.evalues)
+
+    #Gives the number of hits with an E-value at or below the threshold, which are the first hits of the sorted file
+    def count(self, threshold):
+        return bisect.bisect_right(self.evalues, threshold)
+
+    #Gives the first 'limit' hits, or all of them, one at a time
+    def hits(self, limit=None):
+        with open(self.sorted_file) as sorted_input:
+            for line in itertools.islice(sorted_input, limit):
+                yield tuple(column_type(value) for (name, column_type), value in zip(blast_columns, line.rstrip("\n").split("\t")))
+
+
+
+#Function to summarise the hits of a sorted blast output for several E-value thresholds in one pass: the number of hits, of query sequences with hits and of database sequences hit, at or below each threshold. As the hits come in order of E-value, the first hit of each sequence gives the lowest threshold it is counted from
+@traced_calls("parse")
+def summarise_blast_hits(sorted_hits, thresholds=None):
+
+    thresholds = sorted(thresholds or blast_summary_thresholds)
+    new_queries = [0] * len(thresholds)
+    new_subjects = [0] * len(thresholds)
+    seen_queries, seen_subjects = set(), set()
+
+    for hit in sorted_hits.hits(sorted_hits.count(thresholds[-1])):
+        first_threshold = bisect.bisect_left(thresholds, hit[10])
+
+        if hit[0] not in seen_queries:
+            seen_queries.add(hit[0])
+            new_queries[first_threshold] += 1
+
+        if hit[1] not in seen_subjects:
+            seen_subjects.add(hit[1])
+            new_subjects[first_threshold] += 1
+
+    query_totals = itertools.accumulate(new_queries)
+    subject_totals = itertools.accumulate(new_subjects)
+    return [(threshold, sorted_hits.count(threshold), queries, subjects) for threshold, queries, subjects in zip(thresholds, query_totals, subject_totals)]
+
+
+
+#Function to save the hits at or below an E-value threshold, in order of E-value, as a csv file, and as a Parquet file when pyarrow is installed. Both are written a block of hits at a time
+def write_blast_tables(sorted_hits, threshold, column_names, csv_file, parquet_file):
+
+    hit_count = sorted_hits.count(threshold)
+
+    with open(csv_file, "w", newline="") as csv_output:
+        writer = csv.writer(csv_output)
+        writer.writerow(column_names)
+        writer.writerows(sorted_hits.hits(hit_count))
+
+    try:
+        import pyarrow, pyarrow.parquet
+    except ImportError:
+        return False
+
+    schema = pyarrow.schema([(name, pyarrow.string() if column_type is str else pyarrow.int32() if column_type is int else pyarrow.float64()) for name, column_type in blast_columns])
+    with pyarrow.parquet.ParquetWriter(parquet_file, schema) as parquet_output:
+        hits = sorted_hits.hits(hit_count)
+        while True:
+            block = list(itertools.islice(hits, 65536))
+            if block == []:
+                break
+            parquet_output.write_table(pyarrow.Table.from_pylist([dict(zip(schema.names, hit)) for hit in block], schema=schema))
+
+    return True
+
+
+
+#Function that assesses the blastp output, saves the hits below an E-value threshold as csv (and Parquet) files, and summarises the most similar sequences found across the new query and old query with a chosen motif. The E-value threshold is asked for unless it is given
+def assess_blastp(query, motif_chosen, new_query, taxonomic_group, threshold=None):
+
+    blast_file = f"./{query}/{motif_chosen}_{new_query}_blast.out"
+
+    #Sorting the blastp output by E-value, without reading it all into memory
+    sorted_hits = SortedBlastHits(blast_file)
+
+    if len(sorted_hits) == 0:
+
+        #Lets the user know that no hits were found with this blast, so they should try with a different query
+        print("There are no resulting hits form your results! Please start again with a new query.")
+        return
+
+    #Saving how many hits, query sequences and database sequences are left at each of several E-value thresholds
+    with open(f"./{query}/{motif_chosen}_{new_query}_blast_summary.tsv", "w") as summary_file:
+        summary_file.write("#evalue_threshold\thits\tqueries_with_hits\tsequences_hit\n")
+        for summary in summarise_blast_hits(sorted_hits):
+            summary_file.write("\t".join(f"{value:g}" for value in summary) + "\n")
+
+    #Sets the column names of the csv file
+    column_names = ['Query Accession Number', f'{taxonomic_group} Accesion Number', '% Identity', 'Alignment Length', 'Mismatches', 'Gap Opens', 'Query Sequence Start', 'Query Sequence End', f'{taxonomic_group} Sequence Start', f'{taxonomic_group} Sequence End', 'E-value', 'Bit Score']
+
+
+    #A threshold given in advance is used as it is, even if no E-values in the blast output are lower than it
+    if threshold is not None:
+        threshold = float(threshold)
+
+    #Loops until a valid threshold value is entered by the user
+    while threshold is None:
+
+        try:
+
+            #Asks the user to enter a threshold for E-value. The user can input this value in scientific e notation
+            answer = input("What is your E-value threshold to indicate a significant match? You can enter this value as a decimal or in scientific e notation, however ensure it is in this format, e: '5e-2'. Typically, a very high similarity between two proteins results in an E-value lower than 1e-50, and related homologues may have an E-value lower than 1.\n").replace(" ","")
+
+            answer = float(answer)                           #Checks that the user has entered a number
+            if answer > 0:                                   #Checks that the user has entered a number larger than 0
+                if sorted_hits.count(answer) > 0:            #Checks whether any E-values in the blast output are lower than the threshold
+
+                    threshold = answer
+
+                #If the user has entered a valid threshold that is too low in comparison to the blast output E-values, they are asked to re-enter one
+                else:
+
+                    #The lowest E-value present is the first of the sorted hits, to let the user know about the range of the results
+                    lowest_evalue = sorted_hits.evalues[0]
+                    print(f"None of the blast output have an E-value lower than your threshold. The lowest E-value achieved is {lowest_evalue:g}. Please re-enter a threshold.")
+
+            #If the user has entered a number lower or equal to 0, or not a number, they have the change to re-enter a number
+            else:
+                print("Your E-value threshold seems to be out of the range, and cannot be lower or equal to 0. Please re-enter a suitable threshold number.")
+
+        #Checks whether the user has inputted anything besides a number, and the user will be able to re-enter a number
+        except ValueError:
+
+            print("You did not enter a valid E-value threshold. Please make sure you input a number.")
+
+
+    #Saves the hits with E-values lower than the threshold, in ascending order of E-value, to a csv file and a Parquet file
+    parquet_written = write_blast_tables(sorted_hits, threshold, column_names, f"./{query}/{motif_chosen}_{new_query}_blast.csv", f"./{query}/{motif_chosen}_{new_query}_blast.parquet")
+
+    #Only possible when the threshold was given in advance
+    if sorted_hits.count(threshold) == 0:
+        print(f"None of the blast output have an E-value lower than {threshold:g}.")
+        return
+
+    #Lets the user know the best results from blastp
+    top_hits = list(sorted_hits.hits(min(3, sorted_hits.count(threshold))))
+    print("The top performing 3 results of the blast with your query are tabulated below (sorted by E-value):")
+    print("\n".join("\t".join(str(value) for value in row) for row in [column_names] + top_hits))
+    print(f"The protein with the lowest E-value from your blast, and thus the most significant match to your query sequence of {new_query} has accession number {top_hits[0][1]}")
+    print(f"The full list of blast results with an E-value lower than {threshold:g} can be found in ./{query}/{motif_chosen}_{new_query}_blast.out or in csv format in /{query}/{motif_chosen}_{new_query}_blast.csv" + (f" and Parquet format in ./{query}/{motif_chosen}_{new_query}_blast.parquet" if parquet_written else ""))
+    print(f"The number of hits at other E-value thresholds is summarised in ./{query}/{motif_chosen}_{new_query}_blast_summary.tsv")
+
+
+
+
+
+#################################################################################################################################
+#Plotting the transmembrane segments of the user's original protein and taxon query
+
+
+
+#The transmembrane segments can either be predicted by EMBOSS tmap from the alignment ("tmap"), or from the hydropathy of the fetched sequences in this script ("native"), which needs no alignment
+tm_backend = "tmap"
+
+#Hydropathy scales the native prediction can use, each with the mean hydropathy over a window above which the window is taken to cross the membrane: Kyte-Doolittle, and the normalised consensus scale of Eisenberg et al. (1984)
+hydropathy_scales = {
+    "kyte_doolittle": (kyte_doolittle, 1.6),
+    "eisenberg": ({"A": 0.62, "C": 0.29, "D": -0.90, "E": -0.74, "F": 1.19, "G": 0.48, "H": -0.40, "I": 1.38, "K": -1.50, "L": 1.06, "M": 0.64, "N": -0.78, "P": 0.12, "Q": -0.85, "R": -2.53, "S": -0.18, "T": -0.05, "V": 1.08, "W": 0.81, "Y": 0.26}, 0.42),
+}
+hydropathy_scale = "kyte_doolittle"
+
+#Number of residues in each window, about the length of a helix crossing the membrane, and the number of sequences predicted at a time
+tm_window = 19
+tm_chunk_size = 50000
+
+
+
+#Function to find the transmembrane segments of many sequences at once. The sequences are joined into one array of hydropathies, and the mean of every window is read off a running sum of it, keeping only the windows lying inside one sequence. A residue is in a segment when any window above the threshold covers it, and each run of such residues is one segment. The sequences are either a list, or the residues and lengths of some sequences of a sequence store. Gives numpy arrays of the sequence number, start and end (counted from 1) and mean hydropathy of each segment
+def transmembrane_segments(sequences, scale=None, window=None, threshold=None):
+    import numpy as np
+
+    hydropathies, default_threshold = hydropathy_scales[scale or hydropathy_scale]
+    window = window or tm_window
+    threshold = default_threshold if threshold is None else threshold
+
+    #Hydropathy of each byte in hundredths, so the running sums are exact whatever the number of residues, with 0 for the letters of ambiguous or unusual residues
+    byte_hydropathy = np.zeros(256, dtype=np.int64)
+    for letter, value in hydropathies.items():
+        byte_hydropathy[ord(letter)] = round(value * 100)
+
+    residues, lengths = residue_array(sequences) if isinstance(sequences, list) else sequences
+    sequence_starts = np.concatenate([[0], np.cumsum(lengths)])
+    residue_count = int(sequence_starts[-1])
+    values = byte_hydropathy[residues]
+    running_sum = np.concatenate([[0], np.cumsum(values)])
+
+    #Windows starting at every residue, kept when they end inside the sequence they start in
+    sequence_numbers = np.repeat(np.arange(len(lengths)), lengths)
+    window_starts = np.flatnonzero((np.arange(residue_count) + window <= sequence_starts[1:][sequence_numbers]) & (running_sum[np.minimum(np.arange(residue_count) + window, residue_count)] - running_sum[:-1] > round(threshold * 100) * window))
+
+    #Marking the residues covered by the windows above the threshold
+    coverage = np.bincount(window_starts, minlength=residue_count + 1) - np.bincount(window_starts + window, minlength=residue_count + 1)
+    covered = np.cumsum(coverage[:-1]) > 0
+
+    #Runs of covered residues, broken at the start of every sequence
+    first_residue = np.zeros(residue_count, dtype=bool)
+    first_residue[sequence_starts[:-1][lengths > 0]] = True
+    previous_covered = np.concatenate([[False], covered[:-1]]) & ~first_residue
+    next_covered = np.concatenate([covered[1:], [False]]) & ~np.concatenate([first_residue[1:], [True]])
+    segment_starts = np.flatnonzero(covered & ~previous_covered)
+    segment_ends = np.flatnonzero(covered & ~next_covered) + 1
+
+    segment_sequences = sequence_numbers[segment_starts]
+    scores = (running_sum[segment_ends] - running_sum[segment_starts]) / (segment_ends - segment_starts) / 100
+
+    return segment_sequences, segment_starts - sequence_starts[segment_sequences] + 1, segment_ends - sequence_starts[segment_sequences], scores
+
+
+
+#Function to predict the transmembrane segments of every fetched sequence of a query and save them to ./{query}/{query}_tm_segments.tsv, one line per segment with the number of the segment in its sequence, and to the results database. The sequences are predicted tm_chunk_size at a time straight from the sequence store of the fasta file. Gives the number of sequences with at least one segment
+@traced_calls("score")
+def predict_transmembrane(query, fasta_file, scale=None, window=None, threshold=None):
+
+    segment_table = f"./{query}/{query}_tm_segments.tsv"
+    sequences_with_segments = 0
+
+    with open(segment_table, "w", newline="") as segment_file:
+        writer = csv.writer(segment_file, delimiter="\t", lineterminator="\n")
+        writer.writerow(["accession", "segment", "start", "end", "hydropathy"])
+
+        store = open_sequence_store(fasta_file)
+        for chunk_start in range(0, len(store), tm_chunk_size):
+            segment_sequences, starts, ends, scores = transmembrane_segments(store.residue_array(chunk_start, chunk_start + tm_chunk_size), scale, window, threshold)
+            previous_sequence, segment_number = None, 0
+
+            for sequence_number, start, end, score in zip(segment_sequences.tolist(), starts.tolist(), ends.tolist(), scores.tolist()):
+                segment_number = segment_number + 1 if sequence_number == previous_sequence else 1
+                previous_sequence = sequence_number
+                writer.writerow([store.accession(chunk_start + sequence_number), segment_number, start, end, f"{score:.3f}"])
+
+            sequences_with_segments += len(set(segment_sequences.tolist()))
+
+    #The segments are only loaded into the results database once the table is complete, as the motif hits are from their index, so the database is not held by other stages and queries while they are predicted
+    def segments():
+        with open(segment_table) as segment_input:
+            next(segment_input)
+            for line in segment_input:
+                accession, segment_number, start, end, score = line.rstrip("\n").split("\t")
+                yield accession, int(start), int(end), float(score)
+
+    store_tm_segments(query, segments())
+
+    return sequences_with_segments
+
+
+
+#Function to read the transmembrane segments from a tmap report, as (sequence name, start, end, score) tuples. Each sequence starts with a '# Sequence:' comment line, followed by a table of the start and end of its segments. tmap gives no score
+@traced_calls("parse")
+def parse_tmap_report(report_file):
+
+    segments = []
+    sequence_name = None
+
+    with open(report_file) as report:
+        for line in report:
+            if line.startswith("# Sequence:"):
+                sequence_name = line.split()[2]
+
+            elif not line.startswith("#") and sequence_name is not None:
+                columns = line.split()
+                if len(columns) >= 2 and columns[0].isdigit() and columns[1].isdigit():
+                    segments.append((sequence_name, int(columns[0]), int(columns[1]), None))
+
+    return segments
+
+
+
+#Function to generate a plot showing transmembrane regions of the aligned query sequences. Plot will be blank if no transmembrane regions are present
+def plot_transmembrane(query):
+
+    def predict():
+        with cpu_budget.threads(1):
+            run_program(f"tmap -sequence ./{query}/{query}_aligned.pro.fa -sformat fasta -graph png -outfile ./{query}/{query}_tmap.res -goutfile ./{query}/{query}_tmap_plot", shell=True, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+
+        os.rename(f"./{query}/{query}_tmap_plot.1.png", f"./{query}/{query}_tmap_plot.png")
+        store_tm_segments(query, parse_tmap_report(f"./{query}/{query}_tmap.res"))
+
+    run_stage(query, "transmembrane", [f"./{query}/{query}_aligned.pro.fa"], {}, [f"./{query}/{query}_tmap.res", f"./{query}/{query}_tmap_plot.png"], predict)
+
+
+
+#Function to predict the transmembrane segments of a query with the chosen tm_backend. The native prediction reads the fetched sequences, so it can run before, or without, the alignment
+def transmembrane_stage(query):
+
+    if tm_backend == "tmap":
+        plot_transmembrane(query)
+        return
+
+    settings = {"backend": tm_backend, "scale": hydropathy_scale, "window": tm_window, "threshold": hydropathy_scales[hydropathy_scale][1]}
+    run_stage(query, "transmembrane", [f"./{query}/{query}.pro.fa"], settings, [f"./{query}/{query}_tm_segments.tsv"], lambda: predict_transmembrane(query, f"./{query}/{query}.pro.fa"))
+
+
+
+
+
+
+#################################################################################################################################
+#Running many protein family and taxon queries from a manifest, without any questions
+
+
+
+#Number of queries from a manifest analysed at the same time, and whether the independent steps of each query (e.g. the alignment and the motif search) also run at the same time
+batch_workers = 4
+parallel_steps = False
+
+#Columns of a manifest, one for each question asked when running interactively. Only protein_family and taxonomic_group are needed: query_name defaults to '{protein_family}_{taxonomic_group}', partial to 'Y', evalue to blastp's default of 10, and every other step is skipped unless asked for
+manifest_columns = ["protein_family", "taxonomic_group", "query_name", "partial", "alignment", "motifs", "motif", "blast_query", "evalue", "transmembrane"]
+
+
+
+#Function to check whether an answer from a manifest means yes, accepting the same 'Y'/'yes' answers as the questions, as well as TOML's true
+def answered_yes(answer):
+
+    return answer is True or str(answer).upper() == "Y" or str(answer).lower() == "yes"
+
+
+
+#Function to read the queries from a manifest, either a CSV file with a header line of manifest_columns, or a TOML file with one [[query]] table per query. tomllib only comes with Python 3.11 and later, so it is only imported for a TOML manifest
+def read_manifest(manifest_file):
+
+    if manifest_file.endswith(".toml"):
+        import tomllib
+
+        with open(manifest_file, "rb") as manifest:
+            jobs = tomllib.load(manifest).get("query", [])
+
+    else:
+        with open(manifest_file, newline="") as manifest:
+            jobs = list(csv.DictReader(manifest))
+
+    #Every column is filled in, with an empty string for any answer left out
+    return [{column: "" if job.get(column) is None else job[column] for column in manifest_columns} for job in jobs]
+
+
+
+#Function to remove the characters that cannot be used in an NCBI search or a directory name, as done to the answers of the questions
+def remove_unwanted_characters(text, replacement):
+
+    for character in [".", ";", ",", "/", "\\", ":", "'", "\"", "_"]:
+        text = text.replace(character, replacement)
+
+    return text
+
+
+
+#Function to run every step asked for by one query of the manifest, writing the same files to ./{query_name}/ as the interactive questions would. Gives a short summary of how the query went
+def run_job(job):
+
+    protein_family = remove_unwanted_characters(str(job["protein_family"]), " ")
+    taxonomic_group = remove_unwanted_characters(str(job["taxonomic_group"]), " ")
+
+    temporary_taxon = resolve_taxon(taxonomic_group)
+    if temporary_taxon.isnumeric():
+        taxonomic_group = "txid" + temporary_taxon
+
+    query = str(job["query_name"]) or f"{protein_family}_{taxonomic_group}"
+    query = remove_unwanted_characters(query, "_").replace(" ", "_")
+    os.makedirs(query, exist_ok=True)
+
+    sequence_count = search_query(query, protein_family, taxonomic_group, job["partial"] == "" or answered_yes(job["partial"]))
+    if sequence_count == 0:
+        shutil.rmtree(f"./{query}/")
+        return f"{query}: no results for {protein_family} in {taxonomic_group}"
+
+    taxonomic_group = taxonomic_group.replace(" ", "_")
+    summary = {}
+
+    #Each step of the query is listed with the steps it has to wait for. Listed in this order, they can also be run one after another
+    steps = {}
+
+    if answered_yes(job["alignment"]) or (answered_yes(job["transmembrane"]) and tm_backend == "tmap"):
+        steps["redundancy"] = ([], lambda: redundancy_stage(query))
+        steps["alignment"] = (["redundancy"], lambda: alignment_stage(query, f"{query}_aligned.pro.fa"))
+
+    if answered_yes(job["alignment"]):
+        steps["conservation_plot"] = (["alignment"], lambda: conservation_plot_stage(query, f"{query}_aligned.pro.fa"))
+        steps["conservation_scores"] = (["alignment"], lambda: conservation_scores_stage(query, f"{query}_aligned.pro.fa"))
+        summary["alignment"] = "aligned"
+
+    if answered_yes(job["transmembrane"]):
+        steps["transmembrane"] = (["alignment"] if tm_backend == "tmap" else [], lambda: transmembrane_stage(query))
+        summary["transmembrane"] = "transmembrane segments"
+
+    #A motif to build a blast database from also needs the motifs to be found first
+    if answered_yes(job["motifs"]) or job["motif"] != "":
+        def motifs():
+            summary["motifs"] = f"{len(find_motifs(query, open_sequence_store(f'./{query}/{query}.pro.fa')))} motifs"
+
+        steps["motifs"] = ([], motifs)
+
+    if job["motif"] != "" and job["blast_query"] != "":
+        motif_chosen = str(job["motif"])
+        new_query, fetch_blast_query = blast_query_source(query, str(job["blast_query"]), protein_family)
+
+        def blast():
+            motif_assessment(query, motif_chosen)
+
+            if os.path.getsize(f"./{query}/{new_query}.pro.fa") != 0:
+                run_blastp(query, motif_chosen, new_query)
+                assess_blastp(query, motif_chosen, new_query, taxonomic_group, threshold=job["evalue"] or 10)
+                summary["blast"] = f"blastp of {new_query} against {motif_chosen}"
+            else:
+                summary["blast"] = f"no sequence found for {new_query}"
+
+        steps["blast_query"] = ([], fetch_blast_query)
+        steps["blast"] = (["motifs", "blast_query"], blast)
+
+    if parallel_steps:
+        run_steps_concurrently(query, steps)
+    else:
+        for needed_steps, step in steps.values():
+            step()
+
+    return ", ".join([f"{query}: {sequence_count} protein sequences"] + [summary[step] for step in ["alignment", "motifs", "blast", "transmembrane"] if step in summary])
+
+
+
+#Function to run the steps of a query as soon as the steps they wait for have finished, so independent steps run at the same time and the query takes about as long as its longest chain of steps. 'steps' gives each step name the names of the steps it waits for and the function running it. The start and end of every step is printed as it happens
+def run_steps_concurrently(query, steps):
+
+    waiting = dict(steps)
+    running = {}
+    finished = set()
+    errors = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(steps), 1)) as pool:
+        while len(waiting) != 0 or len(running) != 0:
+
+            #Starting every step whose steps have all finished
+            for name, (needed_steps, step) in list(waiting.items()):
+                if all(needed in finished for needed in needed_steps):
+                    print(f"[{query}] Starting {name}...")
+                    running[pool.submit(step)] = (name, time.monotonic())
+                    del waiting[name]
+
+            #Steps can never start once a step they wait for has failed
+            if len(running) == 0:
+                break
+
+            done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name, start_time = running.pop(future)
+
+                try:
+                    future.result()
+                    finished.add(name)
+                    print(f"[{query}] Finished {name} in {time.monotonic() - start_time:.1f} seconds.")
+
+                except Exception as error:
+                    errors.append(error)
+                    print(f"[{query}] {name} failed: {error}")
+
+    if len(errors) != 0:
+        raise errors[0]
+
+
+
+#Function to run all the queries of a manifest, with at most 'workers' queries running at the same time. A query that fails is reported without stopping the others
+def run_batch(manifest_file, workers=None):
+
+    jobs = read_manifest(manifest_file)
+    print(f"Running {len(jobs)} queries from {manifest_file}...")
+
+    #Queries running at the same time split the CPUs between them, so one query's alignment cannot take every CPU while the others wait
+    cpu_budget.share = max(1, cpu_budget.total // min(workers or batch_workers, max(1, len(jobs))))
+
+    #Each query mostly waits on NCBI and external programs, so threads are enough to run several at once
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or batch_workers) as pool:
+        running = {pool.submit(run_job, job): job for job in jobs}
+
+        for finished in concurrent.futures.as_completed(running):
+            try:
+                print(finished.result())
+            except Exception as error:
+                print(f"{running[finished]['protein_family']} in {running[finished]['taxonomic_group']} failed: {error}")
+
+
+
+
+
+
+#################################################################################################################################
+#Benchmarking the stages on recorded or synthetic protein sequences, with a local stand-in for the NCBI E-utilities
+
+
+
+#Number of sequences in each synthetic set benchmarked by default, where the benchmark results are added to, and the most sequences aligned by clustalo in the benchmark (clustalo on 100k sequences would take hours)
+benchmark_sizes = [1000, 10000]
+benchmark_history = "./benchmark_history.json"
+benchmark_alignment_sample = 500
+
+#A stage of the latest benchmark taking this many times longer than in the previous benchmark of the same size is reported as a regression
+benchmark_regression_ratio = 1.2
+
+#Frequency of each amino acid in UniProtKB, used to make the synthetic sequences
+background_frequencies = {"A": 8.25, "R": 5.53, "N": 4.06, "D": 5.45, "C": 1.37, "Q": 3.93, "E": 6.75, "G": 7.07, "H": 2.27, "I": 5.96, "L": 9.66, "K": 5.84, "M": 2.42, "F": 3.86, "P": 4.70, "S": 6.56, "T": 5.34, "W": 1.08, "Y": 2.92, "V": 6.87}
+
+
+
+#Function to write a synthetic set of protein sequences looking like an NCBI protein family search: families of related sequences of varied lengths made from a few ancestral sequences by substitutions, deletions and truncated (partial) copies, with NCBI style headers, some of them uninformative ("unknown", "uncharacterized"), and a few ambiguous residues
+def synthetic_fasta(fasta_file, count, seed=1):
+
+    generator = random.Random(seed)
+    letters, weights = list(background_frequencies), list(background_frequencies.values())
+    organisms = ["Homo sapiens", "Mus musculus", "Rattus norvegicus", "Bos taurus", "Sus scrofa", "Canis lupus familiaris", "Gallus gallus", "Danio rerio", "Xenopus laevis", "Macaca mulatta"]
+    names = ["protein kinase", "serine/threonine-protein kinase", "tyrosine-protein kinase receptor", "kinase-associated protein", "uncharacterized protein", "unknown protein"]
+
+    families = []
+    for family in range(max(1, count // 20)):
+        length = min(3000, max(50, int(generator.lognormvariate(math.log(350), 0.5))))
+        families.append((generator.choice(names), generator.choices(letters, weights, k=length)))
+
+    with open(fasta_file, "w") as fasta_output:
+        for number in range(count):
+            name, ancestor = generator.choice(families)
+            sequence = list(ancestor)
+
+            #Substituting up to 30% of the residues, with the occasional ambiguous residue
+            for position in generator.sample(range(len(sequence)), int(len(sequence) * generator.uniform(0, 0.3))):
+                sequence[position] = "X" if generator.random() < 0.002 else generator.choices(letters, weights)[0]
+
+            #Deleting a stretch of residues from some sequences, and keeping only part of others
+            if generator.random() < 0.2:
+                start = generator.randrange(len(sequence))
+                del sequence[start:start + generator.randint(1, 30)]
+            if generator.random() < 0.1:
+                sequence = sequence[generator.randrange(len(sequence) // 2):]
+                name += ", partial"
+
+            sequence = "".join(sequence)
+            lines = "\n".join(sequence[start:start + 80] for start in range(0, len(sequence), 80))
+            fasta_output.write(f">XP_{number:09d}.1 {name} [{generator.choice(organisms)}]\n{lines}\n")
+
+
+
+#Function to start a local stand-in of the E-utilities on a free port: every esearch or efetch is answered from fasta_file, as if it held the results of every search. failures can map the retstart of an efetch to the HTTP error statuses its next requests are answered with, one status per request, e.g. {0: [429, 503]}, to test retrying and resuming. Gives the server, to be shut down when done, and its base URL. The server lists the (utility, retstart) of every request it receives in server.requests. http.server is only needed here, so it is only imported when the benchmark or the tests run
+def start_eutils_stand_in(fasta_file, failures=None):
+    import http.server
+
+    record_offsets = []
+    with open(fasta_file, "rb") as fasta:
+        offset = 0
+        for line in fasta:
+            if line.startswith(b">"):
+                record_offsets.append(offset)
+            offset += len(line)
+    record_offsets.append(offset)
+
+    failures = {start: list(statuses) for start, statuses in (failures or {}).items()}
+    requests = []
+
+    class EutilsStandIn(http.server.BaseHTTPRequestHandler):
+
+        def log_message(self, format, *arguments):
+            pass
+
+        def do_POST(self):
+            parameters = dict(urllib.parse.parse_qsl(self.rfile.read(int(self.headers["Content-Length"])).decode()))
+            utility = self.path.rstrip("/").rsplit("/", 1)[-1].removesuffix(".fcgi")
+            requests.append((utility, int(parameters.get("retstart", 0))))
+
+            #A failure asked for is answered with no wait before the retry, so tests stay quick
+            if utility == "efetch" and failures.get(int(parameters.get("retstart", 0))):
+                self.send_response(failures[int(parameters["retstart"])].pop(0))
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            if utility == "esearch":
+                body = f"<eSearchResult><Count>{len(record_offsets) - 1}</Count><RetMax>0</RetMax><RetStart>0</RetStart><QueryKey>1</QueryKey><WebEnv>STANDIN</WebEnv><IdList></IdList></eSearchResult>".encode()
+
+            elif utility == "efetch":
+                start = min(int(parameters.get("retstart", 0)), len(record_offsets) - 1)
+                end = min(start + int(parameters.get("retmax", 20)), len(record_offsets) - 1)
+                with open(fasta_file, "rb") as fasta:
+                    fasta.seek(record_offsets[start])
+                    body = fasta.read(record_offsets[end] - record_offsets[start])
+
+            else:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), EutilsStandIn)
+    server.requests = requests
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+
+#Function to find the searches recorded in a recordings directory (see eutils_recordings), giving the search and the recorded efetch responses holding its results, in the order of the results. A search recorded more than once gives the responses of its latest recording
+def recorded_searches(recordings):
+
+    index_file = os.path.join(recordings, "index.jsonl")
+    if not os.path.exists(index_file):
+        return []
+
+    with open(index_file) as recording_index:
+        requests = [json.loads(line) for line in recording_index if line.strip() != ""]
+
+    #Each esearch starts a session on the history server, and its efetch requests name the same WebEnv and query_key
+    latest_sessions = {}
+    for request in requests:
+        recording = os.path.join(recordings, request["recording"])
+        if request["utility"] == "esearch" and os.path.exists(recording):
+            result = ElementTree.parse(recording).getroot()
+            latest_sessions[request["parameters"]["term"]] = (result.findtext("WebEnv"), result.findtext("QueryKey"))
+
+    searches = {session: term for term, session in latest_sessions.items()}
+    fetches = {}
+    for request in requests:
+        parameters = request["parameters"]
+        term = searches.get((parameters.get("WebEnv"), parameters.get("query_key")))
+        if request["utility"] == "efetch" and term is not None:
+            fetches.setdefault(term, {})[int(parameters.get("retstart", 0))] = os.path.join(recordings, request["recording"])
+
+    return [(term, [responses[key] for key in sorted(responses)]) for term, responses in fetches.items()]
+
+
+
+#Function to join the recorded efetch responses of a search into one fasta file, giving the number of sequences in it
+def replay_search(responses, fasta_file):
+
+    with open(fasta_file, "wb") as fasta_output:
+        for response in responses:
+            with open(response, "rb") as recorded_fasta:
+                shutil.copyfileobj(recorded_fasta, fasta_output)
+
+    return count_sequences(fasta_file)
+
+
+
+#Function to run one benchmarked stage, giving its wall time, CPU time (of this process and of the programs it ran), and highest memory use. A stage needing a program or module that is missing is recorded as skipped
+def benchmark_stage(name, stage):
+
+    reset_peak_rss()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+
+    try:
+        stage()
+    except (ImportError, FileNotFoundError) as error:
+        print(f"  {name}: skipped ({error})")
+        return {"skipped": str(error)}
+
+    wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    child_cpu_time = (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+
+    result = {"seconds": round(wall_time, 4), "cpu_seconds": round(cpu_time + child_cpu_time, 4), "peak_rss_mb": round(peak_rss() / 1024 ** 2, 1)}
+    print(f"  {name}: {result['seconds']:.3f} s wall, {result['cpu_seconds']:.3f} s CPU, {result['peak_rss_mb']} MB peak memory")
+
+    return result
+
+
+
+#Function to benchmark the stages of the analysis on a synthetic set of 'size' sequences, or on the recorded results of a search given as (search, recorded efetch responses), in the current directory. The stages needing EMBOSS, clustalo or BLAST are skipped when these are not installed
+def benchmark_size(size, prosite_path=None, recorded_search=None):
+
+    prosite_path = prosite_path or prosite_file
+
+    global eutils_rate_limiter, eutils_recordings
+
+    query = f"benchmark_{size}" if recorded_search is None else f"benchmark_recorded_{cache_key(recorded_search[0])[:10]}"
+    os.makedirs(query, exist_ok=True)
+    source_file = f"./{query}/source.pro.fa"
+    query_fasta = f"./{query}/{query}.pro.fa"
+    stages = {}
+
+    if recorded_search is None:
+        print(f"Benchmarking {size} synthetic sequences...")
+        stages["generate"] = benchmark_stage("generate", lambda: synthetic_fasta(source_file, size))
+        NCBI_query = "benchmark[PROT]"
+
+    else:
+        NCBI_query, responses = recorded_search
+        print(f"Benchmarking the recorded results of {NCBI_query}...")
+        stages["replay"] = benchmark_stage("replay", lambda: replay_search(responses, source_file))
+        size = count_sequences(source_file)
+
+    #The stand-in answers as fast as it can, so the NCBI request rate limit is lifted for it, and its answers are not recorded
+    server, base_url = start_eutils_stand_in(source_file)
+    normal_rate_limiter, eutils_rate_limiter = eutils_rate_limiter, RateLimiter(1000)
+    normal_recordings, eutils_recordings = eutils_recordings, None
+    try:
+        stages["fetch"] = benchmark_stage("fetch", lambda: fetch_fasta(NCBI_query, query_fasta, base_url=base_url))
+    finally:
+        eutils_rate_limiter = normal_rate_limiter
+        eutils_recordings = normal_recordings
+        server.shutdown()
+
+    stages["parse"] = benchmark_stage("parse", lambda: count_sequences(query_fasta))
+    stages["filter"] = benchmark_stage("filter", lambda: measure_sequences(query, query_fasta, ["length >= 30", "ambiguity <= 0.01", "header !~ associated|unknown|unnamed"]))
+
+    def motif_scan():
+        if not os.path.exists(prosite_path):
+            raise FileNotFoundError(f"no PROSITE patterns at {prosite_path}")
+        scan_motifs_native(open_sequence_store(query_fasta), f"./{query}/{query}_motifs.txt", f"./{query}/{query}_motif_index.tsv", prosite_path)
+
+    stages["motif_scan"] = benchmark_stage("motif_scan", motif_scan)
+
+    def alignment():
+        with open(f"./{query}/alignment_sample.pro.fa", "w") as sample:
+            for header, sequence in itertools.islice(read_fasta(query_fasta), benchmark_alignment_sample):
+                sample.write(f">{header}\n{sequence}\n")
+        if subprocess.call(["clustalo", "-i", f"./{query}/alignment_sample.pro.fa", "--force", f"--threads={cpu_budget.total}", "-o", f"./{query}/{query}_aligned.pro.fa"]) != 0:
+            raise FileNotFoundError("clustalo failed")
+
+    stages["alignment"] = benchmark_stage("alignment", alignment)
+
+    #One sequence in ten is extracted, as for a motif subset
+    accessions = [header.split(" ")[0] for number, (header, sequence) in enumerate(read_fasta(query_fasta)) if number % 10 == 0]
+    stages["subset_extraction"] = benchmark_stage("subset_extraction", lambda: (index_fasta(query_fasta), extract_fasta(query_fasta, accessions, f"./{query}/subset.pro.fa")))
+
+    def database_build():
+        if subprocess.call(["makeblastdb", "-in", f"./{query}/subset.pro.fa", "-dbtype", "prot", "-out", f"./{query}/subset"], stdout=subprocess.DEVNULL) != 0:
+            raise FileNotFoundError("makeblastdb failed")
+
+    stages["database_build"] = benchmark_stage("database_build", database_build)
+
+    #A blastp output of ten hits per sequence, with E-values spread over the usual range. The subjects are the extracted sequences, if any passed the filters
+    generator = random.Random(size)
+    subjects = accessions or ["XP_000000000.1"]
+    with open(f"./{query}/{query}_blast.out", "w") as blast_output:
+        blast_output.write("# BLASTP\n# Fields: query acc.ver, subject acc.ver, % identity, alignment length, mismatches, gap opens, q. start, q. end, s. start, s. end, evalue, bit score\n")
+        for number in range(size * 10):
+            blast_output.write(f"XP_{number // 10:09d}.1\t{subjects[generator.randrange(len(subjects))]}\t{generator.uniform(25, 100):.3f}\t300\t20\t1\t1\t300\t1\t300\t{10 ** generator.uniform(-150, 1):.2e}\t{generator.uniform(20, 600):.1f}\n")
+
+    stages["transmembrane"] = benchmark_stage("transmembrane", lambda: predict_transmembrane(query, query_fasta))
+
+    stages["blast_parse"] = benchmark_stage("blast_parse", lambda: summarise_blast_hits(SortedBlastHits(f"./{query}/{query}_blast.out")))
+
+    return stages
+
+
+
+#Function to benchmark every search recorded in eutils_recordings, or every size of synthetic set when no search has been recorded, add the results to the benchmark history and report the stages that have become slower since the previous benchmark of the same size. The benchmark runs in its own directory, which is removed afterwards unless 'keep' is set
+def run_benchmark(sizes=None, history_file=None, keep=False):
+
+    sizes = sizes or benchmark_sizes
+    history_file = os.path.abspath(history_file or benchmark_history)
+    recordings = os.path.abspath(eutils_recordings) if eutils_recordings else None
+    prosite_path = os.path.abspath(prosite_file)
+
+    history = []
+    if os.path.exists(history_file):
+        with open(history_file) as history_input:
+            history = json.load(history_input)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+
+    run = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": sys.version.split()[0], "cpus": cpu_budget.total, "sizes": {}}
+
+    working_directory = os.getcwd()
+    benchmark_directory = os.path.abspath("./benchmark")
+    os.makedirs(benchmark_directory, exist_ok=True)
+    os.chdir(benchmark_directory)
+    try:
+        recorded = recorded_searches(recordings) if recordings else []
+        for NCBI_query, responses in recorded:
+            run["sizes"][f"recorded {NCBI_query}"] = benchmark_size(None, prosite_path, (NCBI_query, responses))
+
+        if recorded == []:
+            for size in sizes:
+                run["sizes"][str(size)] = benchmark_size(size, prosite_path)
+    finally:
+        os.chdir(working_directory)
+        if not keep:
+            shutil.rmtree(benchmark_directory, ignore_errors=True)
+
+    #Comparing each stage with the latest earlier benchmark of the same size that ran it
+    for size, stages in run["sizes"].items():
+        for name, result in stages.items():
+            earlier = [previous["sizes"][size][name] for previous in history if "seconds" in previous.get("sizes", {}).get(size, {}).get(name, {})]
+            if "seconds" in result and earlier != [] and result["seconds"] > earlier[-1]["seconds"] * benchmark_regression_ratio and result["seconds"] > 0.05:
+                print(f"Regression: {name} on {size + ' sequences' if size.isdigit() else size} took {result['seconds']:.3f} s, against {earlier[-1]['seconds']:.3f} s before")
+
+    history.append(run)
+    with open(f"{history_file}.tmp", "w") as history_output:
+        json.dump(history, history_output, indent=1)
+    os.replace(f"{history_file}.tmp", history_file)
+
+    print(f"The benchmark results have been added to {history_file}")
+
+
+
+
+
+
+
+#################################################################################################################################
+#Running the analysis from the command line, or interactively one question at a time
+
+
+
+#Function to read the command line. With --batch, the queries of a manifest are run without asking any questions, and the script stops once they are done
+def parse_arguments(argv=None):
+
+    parser = argparse.ArgumentParser(description="Protein family and taxon query analysis using NCBI, EMBOSS and BLAST.")
+    parser.add_argument("--batch", metavar="MANIFEST", help="CSV or TOML manifest of queries to run without any questions")
+    parser.add_argument("--workers", type=int, default=batch_workers, help="number of manifest queries run at the same time")
+    parser.add_argument("--parallel-steps", action="store_true", help="run the independent steps of each manifest query at the same time")
+    parser.add_argument("--motif-backend", choices=["patmatmotifs", "native"], default=motif_backend, help="run EMBOSS patmatmotifs or match a local prosite.dat in this script")
+    parser.add_argument("--prosite", metavar="FILE", default=prosite_file, help="prosite.dat file of PROSITE patterns matched by the native motif backend")
+    parser.add_argument("--compare-motif-backends", metavar="FASTA", help="run patmatmotifs and the native motif backend on a fasta file, list the hits found by only one of them, then stop")
+    parser.add_argument("--tm-backend", choices=["tmap", "native"], default=tm_backend, help="predict transmembrane segments with EMBOSS tmap from the alignment, or from the hydropathy of every fetched sequence in this script")
+    parser.add_argument("--hydropathy-scale", choices=list(hydropathy_scales), default=hydropathy_scale, help="hydropathy scale used by the native transmembrane prediction")
+    parser.add_argument("--conservation-matrix", metavar="MATRIX", help="EMBOSS or NCBI format substitution matrix (e.g. EPAM250) used to score conservation instead of BLOSUM62")
+    parser.add_argument("--reduce-redundancy", metavar="IDENTITY", type=float, help="align one representative of each cluster of sequences at least this identical (e.g. 0.95)")
+    parser.add_argument("--blast-shards", type=int, default=blastp_shards, help="number of blastp runs a file of several query sequences is split between")
+    parser.add_argument("--find-motif", metavar="MOTIF", help="list every sequence carrying a motif across all the queries saved in the results database, then stop")
+    parser.add_argument("--filter", action="append", default=[], metavar="RULE", help="keep only the sequences passing a rule such as 'length >= 50', 'ambiguity <= 0.05' or 'header !~ partial'. Can be given several times")
+    parser.add_argument("--benchmark", metavar="SIZES", nargs="?", const=",".join(map(str, benchmark_sizes)), help="benchmark the stages on synthetic sets of these numbers of sequences (e.g. 1000,10000,100000), add the results to benchmark_history.json, then stop")
+    parser.add_argument("--trace", metavar="FILE", help="save the time, CPU, memory and bytes used by every stage and program of this run to FILE as a Chrome trace (JSON)")
+    parser.add_argument("--max-results", default=str(max_results), help="most search results fetched for a query, or 'all' to fetch every result")
+    parser.add_argument("--alignment-max-sequences", type=int, default=alignment_max_sequences, help="most sequences aligned by clustalo")
+    parser.add_argument("--alignment-oversize", choices=["downsample", "reject"], default=alignment_oversize, help="align a random sample of a query with too many sequences, or refuse to align it")
+
+    arguments = parser.parse_args(argv)
+
+    #An identity is a fraction, so a percentage typed by mistake (e.g. 95) is refused rather than clustering nothing
+    if arguments.reduce_redundancy is not None and not 0 < arguments.reduce_redundancy <= 1:
+        parser.error(f"argument --reduce-redundancy: the identity must be above 0 and at most 1 (e.g. 0.95), not {arguments.reduce_redundancy:g}")
+
+    return arguments
+
+
+
+#Function to run the script from the command line: the settings given on the command line replace the defaults above, then one of the modes runs, or otherwise the interactive analysis. Nothing runs when this file is imported, so its functions can be used from other scripts
+def main(argv=None):
+
+    global motif_backend, prosite_file, tm_backend, hydropathy_scale, parallel_steps, conservation_matrix_file, redundancy_identity, blastp_shards, sequence_filters, max_results, alignment_max_sequences, alignment_oversize, trace_file
+
+    arguments = parse_arguments(argv)
+
+    motif_backend = arguments.motif_backend
+    prosite_file = arguments.prosite
+    tm_backend = arguments.tm_backend
+    hydropathy_scale = arguments.hydropathy_scale
+    parallel_steps = arguments.parallel_steps
+    conservation_matrix_file = arguments.conservation_matrix
+    redundancy_identity = arguments.reduce_redundancy
+    blastp_shards = arguments.blast_shards
+    sequence_filters = arguments.filter
+    max_results = None if arguments.max_results.lower() == "all" else int(arguments.max_results)
+    alignment_max_sequences = arguments.alignment_max_sequences
+    alignment_oversize = arguments.alignment_oversize
+    trace_file = arguments.trace
+    atexit.register(write_trace)
+
+    #Checking the filters before anything is fetched, so a mistyped filter stops the script straight away
+    for sequence_filter in sequence_filters:
+        try:
+            parse_sequence_filter(sequence_filter)
+        except ValueError as error:
+            sys.exit(str(error))
+
+    if arguments.benchmark is not None:
+        run_benchmark([int(size) for size in arguments.benchmark.split(",")])
+        return
+
+    if arguments.compare_motif_backends is not None:
+        patmatmotifs_counts, native_counts, differences = compare_motif_backends(arguments.compare_motif_backends)
+        for motif_name in sorted(set(patmatmotifs_counts) | set(native_counts)):
+            print(f"{motif_name}\t{patmatmotifs_counts.get(motif_name, 0)} sequences by patmatmotifs\t{native_counts.get(motif_name, 0)} sequences by the native backend")
+        print("\n".join("\t".join(map(str, hit)) for hit in differences))
+        print(f"{len(differences)} hits were found by only one of the backends")
+        return
+
+    if arguments.find_motif is not None:
+        carriers = motif_carriers(arguments.find_motif)
+        print("\n".join(f"{accession}\t{taxon}\t{query}" for accession, taxon, query in carriers))
+        print(f"{len(carriers)} sequences carry the motif {arguments.find_motif.upper()} in {results_database}")
+        return
+
+    if arguments.batch is not None:
+        run_batch(arguments.batch, arguments.workers)
+        return
+
+    interactive_analysis()
+
+
+
+#Function asking the user about their query one question at a time, and running each step of the analysis they ask for
+def interactive_analysis():
+
+    #First output on screen for the user: explaining the search on NCBI
+    print("By inputting a protein family and taxonomic group, fasta sequences of proteins found form NCBI protein database will be saved. " + ("Every protein result of the query search will be fetched, which can take long for large searches." if max_results is None else f"Please be warned that if the query search contains more than {max_results} protein results, only the first {max_results} will be considered and the search will take long."))
+
+
+    #Running while loop until user inputs the protein family and taxonomic group with the desired output
+    while True:
+
+        #User specifies the protein family and taxonomic group of their query and these inputs get saved to the variables protein_family and taxonomic_group. Unwanted characters are changed to a space.
+        protein_family = input("What is the protein family of your query?\n").replace("."," ").replace(";"," ").replace(","," ").replace("/"," ").replace("\\"," ").replace(":"," ").replace("'"," ").replace("\""," ").replace("_"," ")
+
+        taxonomic_group = input("What is the taxonomic group of your organism query?\n").replace("."," ").replace(";"," ").replace(","," ").replace("/"," ").replace("\\"," ").replace(":"," ").replace("'"," ").replace("\""," ").replace("_"," ")
+
+        #Identifies the taxonomic group ID from the local taxonomy index, or on NCBI taxonomy database when there is no local taxdump
+        temporary_taxon = resolve_taxon(taxonomic_group)
+
+        #If a valid taxon has been entered by the user, taxonomc_group will be reassigned to the taxonomid ID in the format txid____
+        if temporary_taxon.isnumeric():
+            taxonomic_group = "txid" + temporary_taxon
+
+        #Checks whether the user has inputted the queries in a valid format, so eliminating blank spaces and other characters. Inputs including a number or letter will be valid to continue to esearch
+        if any(char.isalnum() for char in protein_family) and any(char.isalnum() for char in taxonomic_group):
+
+            pass
+
+        else:
+
+            #Identifying invalid format of taxonomic group
+            if any(char.isalnum() for char in protein_family):
+                print("You have not enetered a valid taxonomic group. Please re-enter your query.")
+
+            #Identifying invalid format of protein family
+            elif any(char.isalnum() for char in taxonomic_group):
+                print("You have not entered a valid protein family. Please re-enter your query.")
+
+            continue
+
+
+        while True:
+
+            #User names a new directory as well as the name of most files produced for a specific query, so all outputs can be saved in the same location. Each query will therefore have its own directory.
+            query_name = input("What would you like to name the folder and subsequent outputs from this search? Please note that any of the following characters, as well as a space, will be changed to '_' for readability: '\\ / , ; :'\n")
+
+            #Removing unwanted characters from the directory name given by the user
+            query_name = query_name.replace(";","_").replace(",","_").replace("/","_").replace("\\","_").replace(":","_").replace("'","_").replace("\"","_").replace(" ","_")
+
+            try:
+                #Creating the new directory
+                os.mkdir(query_name)
+                break
+
+            except FileExistsError:
+
+                file_decision = input("This directory name already exists. Would you like to set it as the directory path for this query too? Please input 'Y' for yes or 'N' for no.\n")
+                if file_decision.upper() == "Y" or file_decision.lower() == "yes":
+                    break
+
+                else:
+                    pass
+
+
+
+        #Attempting to catch out any error when running esearch and efetch
+        try:
+
+            #Running the user query until the input for including 'NOT PARTIAL' or not is provided well
+            while True:
+
+
+                #Asking the user if they want to run esearch with 'NOT PARTIAL' or not
+                partial = input("Would you like to consider all protein sequences found from your search, including those that contain an incomplete version of of the amino acid sequence (partial)? Please input 'Y' for yes or 'N' for no.\n")
+
+                #Not including 'NOT PARTIAL' in the NCBI search        
+                if partial.upper() == "Y" or partial.lower() == "yes":
+                    print("Retrieving protein sequences of query from NCBI databases...")
+
+                    #Contains the number of sequences in the search fasta result, searched again without [PROT] if there were no results
+                    sequence_count = search_query(query_name, protein_family, taxonomic_group, True)
+
+                    break
+
+                #Including 'NOT PARTIAL' in the NCBI search
+                elif partial.upper() == "N" or partial.lower() == "no":
+                    print("Retrieving protein sequences of query from NCBI databases...")
+
+                    #Contains the number of sequences in the search fasta result, searched again without [PROT] if there were no results
+                    sequence_count = search_query(query_name, protein_family, taxonomic_group, False)
+
+                    break
+
+                else:
+                    print("You have not entered a valid character. Please try again.")
+
+
+            #Checks if the final search has any results
+            if sequence_count != 0:
+
+                #Outputs the number of searches found (at most max_results, as only these are fetched) and displays the first 5
+                print("Your query has returned " + str(sequence_count) + " protein sequences of the protein family " + protein_family + " and taxonomic group " + taxonomic_group + ". The first few outputs of this search are shown below:")
+
+                print(subprocess.call(f"grep '>' ./{query_name}/{query_name}.pro.fa | head -n5", shell=True))
+
+
+                #Allows user to confirm whether the displayed results are as they desired. Any other input other than yes will not be considered
+                decision = input("Is this your desired search? Please type 'Y' for yes or 'N' for no.\n")
+
+                if decision.upper() == "Y" or decision.lower() == "yes":
+                    print(f"Great! The fasta sequences for your protein query are saved under ./{query_name}/{query_name}.pro.fa")
+
+                    break
+
+                else:
+
+                    #Will delete the directory created if the output is not as desired.
+                    shutil.rmtree(f"./{query_name}/")
+                    print("It seems you have instructed that these results are not as you desired. Please start this process again.")
+
+            else:
+
+                #Will delete the directory created if there are no search results for the query given.    
+                shutil.rmtree(f"./{query_name}/")
+                print("There are no results for your query. Please start again.")
+
+
+        except:
+            shutil.rmtree(f"./{query_name}/")
+            print("There are no results for your query. Please start again.")
+
+
+
+    protein_family = protein_family.replace(" ","_")
+    taxonomic_group = taxonomic_group.replace(" ","_")
+
+
+
+
+    #Aligning and plotting conservation across protein query
+    if os.path.exists(f"./{query_name}/{query_name}.pro.fa"):
+        aligned_fasta = f"{query_name}_aligned.pro.fa"
+
+        #First output on screen to start the process of alignment of user query
+        alignment_question = input("Would you like to determine and plot the level of conservation between the protein sequences of your query? Please input 'Y' for yes or 'N' for no.\n")
+
+
+        #Runs the alignment function and plots the conservation
+        if alignment_question.upper() == "Y" or alignment_question.lower() == "yes":
+
+            #A query with too many sequences to align is refused when alignment_oversize is "reject"
+            try:
+                plot_conservation(query_name, aligned_fasta)
+
+            except RuntimeError as error:
+                print(error)
+
+            else:
+
+                #Asks user if they want the plot to be opened in a separate window
+                view_image = input("Would you like to view the conservation plot? Please input 'Y' for yes or 'N' for no.\n")
+                if view_image.upper() == "Y" or view_image.lower() == "yes":
+
+                    print("Plot is opening in separate window...")
+                    subprocess.call(f"eog ./{query_name}/{query_name}_conservation_plot.png", shell=True)
+
+        else:
+
+            print("It seems you have decided not to generate conservation plots of your query.")
+
+
+
+
+    #Identifying motifs from the protein and taxon query
+    if os.path.exists(f"./{query_name}/{query_name}.pro.fa"):
+
+        #The sequences of the query are read from its memory-mapped sequence store whenever the motifs are searched, instead of being held in memory
+        query_fasta = f"./{query_name}/{query_name}.pro.fa"
+
+
+        #Every motif hit of the query is saved to this index by the first scan, and later calls are answered from it
+        motif_index = f"./{query_name}/{query_name}_motif_index.tsv"
+
+
+        #First output to the user before finding protein query motifs
+        motif_decision = input("Would you like the identify the motifs from PROSITE in your protein query sequences? Please input 'Y' for yes or 'N' for no.\n")
+
+        if motif_decision.upper() == "Y" or motif_decision.lower() == "yes":
+
+            #Running the function find_motifs() using the query
+            find_motifs(query_name, open_sequence_store(query_fasta))
+            print(f"The full output of motifs per protein sequence from your query can be found in ./{query_name}/{query_name}_motifs.txt")
+
+        else:
+
+            print("It seems you have chosen to not identify the motifs in your protein query.")
+
+
+
+
+    #WILDCARD: Building a blast database off of a motif subset of the user's protein query and asking for a new taxon to blast against
+
+    #Looping until the user has ran blast as many times as they desire
+    while True:
+
+        #The first output to the user before identifying the new query to blast against a database of a chosen motif from the original query
+        motif_assessment_decision = input("Would you like to make a database of a certain motif found in your protein sequence query to subsequently run blastp on a separate query against? This involves running blastp across the same protein family, but with two different taxonomic groups as query (new) and subject (original query: to make database). Please input 'Y' for yes or 'N' for no.\n")
+
+        if motif_assessment_decision.upper() == 'Y' or motif_assessment_decision.lower() == 'yes':
+
+            #Checks if motifs have already been identified for the original taxon query
+            if motif_index_current(query_fasta, motif_index):
+
+                #Asks the user to pick from a list of motifs
+                print("Please pick the motif for which you would like to create a blast database. This database will be constructed using the proteins from your query search containing this motif.\n")
+
+                counter = 1
+                motif_choice_dict = {}
+
+                #Loops through each motif present from the original taxon query, as saved in the motif index
+                for m in motif_counts(motif_index).keys():     
+                    print(str(counter) + ": " + m)   #Enumerates each motif and prints each combination
+                    motif_choice_dict[counter] = m   #Saves each combination of number and motif to a dictionary
+                    counter += 1
+
+                #Loops until a valid motif number has been picked by the user
+                while True:
+
+                    #Asks the user to input a number corresponding to a motif
+                    motif_choice = input("Input the number corresponding to your chosen motif.\n")
+
+                    #Checks that the motif chosen is an integer
+                    try:
+
+                        int(motif_choice)
+
+                    #If the motif chosen is not an integer, the user has the chance to re-enter a number
+                    except ValueError:
+
+                        print("You have not chosen a valid motif number. Please input a number that corresponds to a motif from your protein query search shown above.")
+
+                        #Does not continue on to the remainder of this interation
+                        continue
+
+
+                    #Checks if the user has chosen a number corresponding to a motif by checking the dictionary created
+                    if int(motif_choice) in motif_choice_dict.keys():
+
+                        #Extracts the motif name corresponding to the chosen number and saves it to chosen_motif
+                        chosen_motif = motif_choice_dict[int(motif_choice)]
+
+                        #Runs the motif_assessment() function to make the blast database
+                        motif_assessment(query_name, chosen_motif)
+
+                        #Runs the new_query() function to blast a new query to the database created
+                        new_query = run_blast(query_name, chosen_motif, protein_family, taxonomic_group)
+
+                        #Runs the assess_blastp() function to output the results of blastp
+                        assess_blastp(query_name, chosen_motif, new_query, taxonomic_group)
+
+                        break
+
+
+                    #If the user did not pick a valid motif number, they can re-enter a new number
+                    else:
+                        print("You have not chosen a valid motif number. Please input a number that corresponds to a motif from your protein query search shown above.")
+
+
+
+            #If motifs have not yet been identified of the fasta sequences from the original query, the user has the choice to do so now
+            else:
+
+                rerun_decision = input("It appears you have not yet identified motifs from your protein sequence query. Would you like to do that now? Please input 'Y' for yes or 'N' for no.\n")
+
+                #If user has chosen to identify the motifs now, find_motifs() function is run
+                if rerun_decision.upper() == "Y" or rerun_decision.lower() == "yes":
+
+                    print("Identifying motifs from your protein query sequences...")
+                    find_motifs(query_name, open_sequence_store(query_fasta))
+
+                    continue
+
+                else:
+                    print("A motif from your protein sequence query cannot be assessed if motifs have not been identified yet.")
+
+        #Loop will be broken if the user does not choose to find the motifs from the original query
+        else:
+
+            break
+
+
+        #Checks if blastp has already been run
+        if os.path.exists(f"./{query_name}/{chosen_motif}_{new_query}_blast.out"):
+
+            #Asks the user if they want to start the process again
+            again = input("Would you like to run blast again with a different motif or taxon query? Please input 'Y' for yes or 'N' for no.\n")
+
+            if again.upper() == "Y" or again.lower() == "yes":
+
+                #Will continue to the next iteration if the user chooses to blast again
+                pass
+
+            else:
+
+                #Breaks the loop if the user chooses not to blast again
+                break
+
+
+
+
+    #Plotting the transmembrane segments of the user's original protein and taxon query
+
+    #Checks whether the query sequences have been aligned yet, which only tmap needs
+    if tm_backend == "native" or os.path.exists(f"./{query_name}/{query_name}_aligned.pro.fa"):
+
+
+        #Asks the user if they want to identify transmembrane segments of their query
+        tmap_decision = input("Would you like to predict whether there are transmembrane segments in the proteins of your query? Please input 'Y' for yes or 'N' for no.\n")
+
+        if (tmap_decision.upper() == "Y" or tmap_decision.lower() == "yes") and tm_backend == "native":
+
+            #Predicts the segments of every fetched sequence from its hydropathy, without a plot
+            transmembrane_stage(query_name)
+
+            with open(f"./{query_name}/{query_name}_tm_segments.tsv") as segment_file:
+                segment_count = sum(1 for line in segment_file) - 1
+
+            print(f"{segment_count} transmembrane segments were predicted in the proteins of your query. They are saved in ./{query_name}/{query_name}_tm_segments.tsv")
+
+        elif tmap_decision.upper() == "Y" or tmap_decision.lower() == "yes":
+
+            #Generates a plot showing transmembrane regions. Plot will be blank if no transmembrane regions are present
+            plot_transmembrane(query_name)
+
+            print(f"Your transmembrane segment plot is saved in ./{query_name}/{query_name}_tmap.png\nOpening this plot in a separate window...")
+
+            #Displays the plot in a separate window
+            subprocess.call(f"eog ./{query_name}/{query_name}_tmap_plot.png", shell=True)
+
+        else:
+
+            print("It seems you have decided not to predict transmembrane segments in your protein query.")
+
+    else:
 
-    print("Once you have generated aligned sequences of your query, you will have the choice to identify transmembrane segments of your query.")
+        print("Once you have generated aligned sequences of your query, you will have the choice to identify transmembrane segments of your query.")
 
 
 
-################################################################################################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import random
+
+import protein_analysis
+
+
+#A blastp tabular output (-outfmt 7) of three queries, the first reported by the accession inside its 'sp|...|...' header
+blast_output = """# BLASTP 2.12.0+
+# Query: sp|P12345.2|X_HUMAN
+# 2 hits found
+P12345.2\tXP_1.1\t90.0\t100\t10\t0\t1\t100\t1\t100\t1e-40\t200.0
+P12345.2\tXP_2.1\t50.0\t100\t50\t0\t1\t100\t1\t100\t0.001\t40.0
+# Query: B.1
+# 1 hits found
+B.1\tXP_3.1\t80.0\t100\t20\t0\t1\t100\t1\t100\t1e-20\t120.0
+# Query: C.1
+# 1 hits found
+C.1\tXP_1.1\t70.0\t100\t30\t0\t1\t100\t1\t100\t1e-10\t90.0
+"""
+
+
+
+def write_blast_output(tmp_path, text=blast_output):
+
+    blast_file = tmp_path / "motif_query_blast.out"
+    blast_file.write_text(text)
+    return str(blast_file)
+
+
+
+def test_split_blast_hits_matches_queries_by_id(tmp_path):
+
+    blast_file = write_blast_output(tmp_path)
+
+    assert protein_analysis.split_blast_hits(blast_file, ["sp|P12345.2|X_HUMAN", "B.1", "C.1", "D.1"]) == (4, 3, [])
+
+    hits_directory = tmp_path / "motif_query_blast"
+    assert len((hits_directory / "sp|P12345.2|X_HUMAN.tsv").read_text().splitlines()) == 2
+    assert (hits_directory / "B.1.tsv").read_text().startswith("B.1\tXP_3.1")
+    assert (hits_directory / "C.1.tsv").read_text().startswith("C.1\tXP_1.1")
+    assert (hits_directory / "D.1.tsv").read_text() == ""
+
+
+
+def test_split_blast_hits_reports_unmatched_ids(tmp_path):
+
+    blast_file = write_blast_output(tmp_path)
+
+    assert protein_analysis.split_blast_hits(blast_file, ["A.1", "B.1", "C.1"]) == (3, 2, ["P12345.2"])
+
+    hits_directory = tmp_path / "motif_query_blast"
+    assert (hits_directory / "A.1.tsv").read_text() == ""
+    assert len((hits_directory / "P12345.2.tsv").read_text().splitlines()) == 2
+    assert (hits_directory / "C.1.tsv").read_text().startswith("C.1\tXP_1.1")
+
+
+
+#A blastp output of many hits in random order, with few distinct E-values so that many hits tie
+def write_random_blast_output(tmp_path, hit_count=500):
+
+    generator = random.Random(17)
+    lines = ["# BLASTP 2.12.0+\n"]
+    for number in range(hit_count):
+        evalue = generator.choice([0.0, 1e-60, 1e-30, 1e-20, 1e-8, 0.001, 0.5, 5.0, 20.0])
+        lines.append(f"Q{generator.randrange(20)}.1\tS{generator.randrange(60)}.1\t50.0\t100\t50\t0\t1\t100\t1\t100\t{evalue:g}\t{number % 97 + 0.5}\n")
+
+    blast_file = tmp_path / "motif_query_blast.out"
+    blast_file.write_text("".join(lines))
+    return str(blast_file), [line for line in lines if not line.startswith("#")]
+
+
+
+def test_sorted_blast_hits_are_ordered_by_evalue_then_bit_score(tmp_path, monkeypatch):
+
+    #Sorting 37 hits at a time, so the hits are merged from several sorted chunks
+    monkeypatch.setattr(protein_analysis, "blast_sort_chunk", 37)
+    blast_file, lines = write_random_blast_output(tmp_path)
+
+    sorted_hits = protein_analysis.SortedBlastHits(blast_file)
+    hits = list(sorted_hits.hits())
+
+    assert len(sorted_hits) == len(hits) == len(lines)
+    assert [(hit[10], -hit[11]) for hit in hits] == sorted((float(line.split("\t")[10]), -float(line.split("\t")[11])) for line in lines)
+    assert list(sorted_hits.hits(5)) == hits[:5]
+    assert not list(tmp_path.glob("*.chunk*"))
+
+
+
+def test_count_includes_every_hit_tied_on_the_threshold(tmp_path):
+
+    blast_file, lines = write_random_blast_output(tmp_path)
+    evalues = [float(line.split("\t")[10]) for line in lines]
+
+    sorted_hits = protein_analysis.SortedBlastHits(blast_file)
+
+    for threshold in [0.0, 1e-60, 1e-45, 1e-20, 0.001, 1, 20.0, 100]:
+        assert sorted_hits.count(threshold) == sum(evalue <= threshold for evalue in evalues)
+
+
+
+def test_summary_matches_a_count_at_each_threshold(tmp_path):
+
+    blast_file, lines = write_random_blast_output(tmp_path)
+    hits = [line.split("\t") for line in lines]
+
+    summary = protein_analysis.summarise_blast_hits(protein_analysis.SortedBlastHits(blast_file), [10, 1e-20, 0.001, 1e-30])
+
+    assert [row[0] for row in summary] == [1e-30, 1e-20, 0.001, 10]
+    for threshold, hit_count, query_count, subject_count in summary:
+        kept = [hit for hit in hits if float(hit[10]) <= threshold]
+        assert (hit_count, query_count, subject_count) == (len(kept), len({hit[0] for hit in kept}), len({hit[1] for hit in kept}))
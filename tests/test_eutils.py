@@ -0,0 +1,58 @@
+import os
+import urllib.error
+
+import pytest
+
+import protein_analysis
+
+
+fasta_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "motifs.fa")
+
+
+
+#Every test fetches one record per batch from its own E-utilities stand-in, into its own parts directory, without waiting between requests
+@pytest.fixture
+def fetch(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(protein_analysis, "fetch_parts_cache", str(tmp_path / "fetch_parts"))
+    monkeypatch.setattr(protein_analysis, "eutils_rate_limiter", protein_analysis.RateLimiter(1000))
+    servers = []
+
+    def fetch_from_stand_in(failures, retries):
+        monkeypatch.setattr(protein_analysis, "eutils_retries", retries)
+        server, base_url = protein_analysis.start_eutils_stand_in(fasta_file, failures)
+        servers.append(server)
+        return server, lambda: protein_analysis.fetch_fasta("kinase", str(tmp_path / "query.pro.fa"), batch_size=1, workers=1, base_url=base_url)
+
+    yield fetch_from_stand_in
+
+    for server in servers:
+        server.shutdown()
+
+
+
+def test_fetch_retries_rate_limits_and_server_errors(tmp_path, fetch):
+
+    server, fetch_fasta = fetch({1: [429, 503]}, 5)
+
+    assert fetch_fasta() == 4
+    assert server.requests.count(("efetch", 1)) == 3
+    assert (tmp_path / "query.pro.fa").read_text() == open(fasta_file).read()
+
+
+
+def test_fetch_resumes_from_the_missing_batches(tmp_path, fetch):
+
+    #The third batch fails more often than it is retried, so the first fetch fails after saving the other batches
+    server, fetch_fasta = fetch({2: [503, 503]}, 1)
+
+    with pytest.raises(urllib.error.HTTPError):
+        fetch_fasta()
+    assert not (tmp_path / "query.pro.fa").exists()
+
+    del server.requests[:]
+    assert fetch_fasta() == 4
+
+    assert [request for request in server.requests if request[0] == "efetch"] == [("efetch", 2)]
+    assert (tmp_path / "query.pro.fa").read_text() == open(fasta_file).read()
+    assert list((tmp_path / "fetch_parts").iterdir()) == []
@@ -0,0 +1,33 @@
+import os
+
+import protein_analysis
+
+
+#The fixtures are a few fasta records, a few entries of prosite.dat and the report patmatmotifs gave for the records, so the native backend is checked without EMBOSS
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+fasta_file = os.path.join(fixtures, "motifs.fa")
+prosite_path = os.path.join(fixtures, "prosite.dat")
+report_file = os.path.join(fixtures, "motifs.patmatmotifs")
+
+
+
+def test_native_hits_match_patmatmotifs_report():
+
+    patmatmotifs_counts, native_counts, differences = protein_analysis.compare_motif_report(report_file, protein_analysis.read_fasta(fasta_file), prosite_path)
+
+    assert differences == []
+    assert native_counts == patmatmotifs_counts == {"ATP_GTP_A": 2, "ZINC_FINGER_C2H2_1": 1, "MICROBODIES_CTER": 1}
+
+
+
+def test_native_scan_prunes_skipped_patterns_and_names_its_prosite_file(tmp_path):
+
+    protein_analysis.scan_motifs_native(protein_analysis.read_fasta(fasta_file), tmp_path / "motifs.txt", tmp_path / "motif_index.tsv", prosite_path)
+
+    #ASN_GLYCOSYLATION and MYRISTYL both match SEQ1.1 but are flagged to be skipped, as patmatmotifs does by default
+    motif_hits = protein_analysis.read_motif_index(str(tmp_path / "motif_index.tsv"))
+    assert sorted(motif_hits) == ["ATP_GTP_A", "MICROBODIES_CTER", "ZINC_FINGER_C2H2_1"]
+    assert motif_hits["ZINC_FINGER_C2H2_1"]["SEQ2.1"] == [(4, 24, 0.0), (28, 48, 0.0)]
+
+    reports = (tmp_path / "motifs.txt").read_text().split("\nnew_sequence")
+    assert all(f"# Data_file: {prosite_path}" in report for report in reports if report != "")
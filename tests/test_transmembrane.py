@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+import protein_analysis
+
+np = pytest.importorskip("numpy")
+
+
+
+#Brute-force prediction of one sequence at a time, window by window, in the same hundredths of hydropathy as transmembrane_segments(). Gives (sequence number, start, end) of each segment
+def scan_windows(sequences, window, threshold):
+
+    hydropathies = protein_analysis.kyte_doolittle
+    segments = []
+
+    for number, sequence in enumerate(sequences):
+        values = [round(hydropathies.get(residue, 0) * 100) for residue in sequence.upper()]
+        covered = [False] * len(values)
+        for start in range(len(values) - window + 1):
+            if sum(values[start:start + window]) > round(threshold * 100) * window:
+                covered[start:start + window] = [True] * window
+
+        for position, residue_covered in enumerate(covered):
+            if residue_covered and (position == 0 or not covered[position - 1]):
+                segments.append([number, position + 1, position + 1])
+            if residue_covered:
+                segments[-1][2] = position + 1
+
+    return [tuple(segment) for segment in segments]
+
+
+
+def predicted_segments(sequences, window, threshold):
+
+    segment_sequences, starts, ends, scores = protein_analysis.transmembrane_segments(sequences, "kyte_doolittle", window, threshold)
+    return list(zip(segment_sequences.tolist(), starts.tolist(), ends.tolist()))
+
+
+
+def test_windows_never_cross_sequence_boundaries():
+
+    #Each half of the hydrophobic stretch is shorter than a window, so only a window crossing from one sequence into the next would find a segment
+    assert predicted_segments(["KKKKKKKKKKIIIIII", "IIIIIIKKKKKKKKKK"], 8, 3.0) == []
+    assert predicted_segments(["KKKKKKKKKKIIIIIIII", "IIIIIIIIKKKKKKKKKK"], 8, 3.0) == [(0, 10, 18), (1, 1, 9)]
+
+
+
+def test_empty_and_short_sequences_have_no_segments():
+
+    assert predicted_segments([], 5, 1.6) == []
+    assert predicted_segments(["", "IIII", "", "IIIII", ""], 5, 1.6) == [(3, 1, 5)]
+    assert predicted_segments(["IIIII", "", "IIIII"], 5, 1.6) == [(0, 1, 5), (2, 1, 5)]
+
+
+
+def test_segments_match_a_window_by_window_scan():
+
+    generator = random.Random(3)
+    residues = "AILMFVWKRDEGSTPX"
+    sequences = ["".join(generator.choice(residues) for position in range(generator.choice([0, 0, 3, 7, 19, 40, 120]))) for number in range(300)]
+
+    for window, threshold in [(7, 1.6), (19, 1.6), (5, 0.5)]:
+        assert predicted_segments(sequences, window, threshold) == scan_windows(sequences, window, threshold)
+
+
+
+def test_store_residues_give_the_same_segments_as_a_list(tmp_path):
+
+    sequences = ["MKKIIIIIIIILLLLLLLLKK", "", "MII", "mkkllllllllllllllllllkk"]
+    fasta_file = tmp_path / "tm.fa"
+    fasta_file.write_text("".join(f">SEQ{number}.1\n{sequence}\n" for number, sequence in enumerate(sequences)))
+
+    store = protein_analysis.open_sequence_store(str(fasta_file))
+
+    assert predicted_segments(store.residue_array(), 9, 1.6) == predicted_segments(sequences, 9, 1.6) == scan_windows(sequences, 9, 1.6) != []